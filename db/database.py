@@ -50,3 +50,7 @@ def _build_database() -> Any:
 # Singleton used by Python services/routes.
 database = _build_database()
 
+
+def is_null_database(db: Any) -> bool:
+    """True when `db` is the no-op fallback (no DATABASE_URL / no driver)."""
+    return isinstance(db, _NullDatabase)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import os
 from enum import Enum
 from typing import Any, Dict, List, Optional
 
@@ -58,3 +59,124 @@ class StandardProduct(BaseModel):
             self.id = self.product_id
         return self
 
+
+
+# ---------------------------------------------------------------------------
+# Trusted hydration
+# ---------------------------------------------------------------------------
+#
+# `products_cache.product_data` was validated when it was written, so cache
+# reads can skip pydantic validation: `hydrate_product` checks the declared
+# fields with exact type tests, builds the model without validation (as
+# `model_construct` does) and applies the `_normalize_ids` rule by hand. Any value that validation
+# would coerce or reject (numeric strings, int ids, unknown status, ...) takes
+# the full `StandardProduct(**data)` path instead, so results -- including
+# which rows raise -- are identical either way.
+#
+# STANDARD_PRODUCT_FAST_HYDRATION=0 forces full validation everywhere.
+
+FAST_HYDRATION_ENABLED = os.getenv("STANDARD_PRODUCT_FAST_HYDRATION", "1").strip().lower() not in {
+    "0",
+    "false",
+    "no",
+    "off",
+}
+
+_STR_FIELDS = frozenset(
+    {
+        "id",
+        "product_id",
+        "platform_product_id",
+        "platform",
+        "merchant_id",
+        "title",
+        "description",
+        "product_type",
+        "currency",
+        "sku",
+        "image_url",
+    }
+)
+_STATUS_VALUES = {s.value: s for s in ProductStatus}
+_FIELD_NAMES = frozenset(StandardProduct.model_fields)
+_SCALAR_DEFAULTS = {
+    name: field.default for name, field in StandardProduct.model_fields.items() if field.default_factory is None
+}
+_new_object = object.__new__
+_set_slot = object.__setattr__
+
+
+def _trusted_product(data: Dict[str, Any]) -> Optional[StandardProduct]:
+    """
+    Build the instance the way `model_construct` does (slots set directly),
+    or return None if any declared field needs validation.
+    """
+    values = dict(_SCALAR_DEFAULTS)
+    extra: Dict[str, Any] = {}
+    for key, value in data.items():
+        if key in _STR_FIELDS:
+            if value is not None and type(value) is not str:
+                return None
+        elif key not in _FIELD_NAMES:
+            extra[key] = value
+            continue
+        elif key == "price":
+            if value is not None and type(value) is not float:
+                if type(value) is not int:
+                    return None
+                value = float(value)
+        elif key == "status":
+            if value is not None:
+                value = _STATUS_VALUES.get(value) if type(value) is str else None
+                if value is None:
+                    return None
+        elif key == "inventory_quantity":
+            if value is not None and type(value) is not int:
+                return None
+        elif key == "in_stock":
+            if value is not None and type(value) is not bool:
+                return None
+        elif key == "images":
+            if type(value) is not list or any(type(v) is not str for v in value):
+                return None
+            value = list(value)
+        elif key == "platform_metadata":
+            if type(value) is not dict:
+                return None
+        values[key] = value
+    if "images" not in data:
+        values["images"] = []
+    if "platform_metadata" not in data:
+        values["platform_metadata"] = {}
+
+    fields_set = set(data)
+    # `_normalize_ids`; validation marks the assigned field as set.
+    if not values["product_id"] and values["id"]:
+        values["product_id"] = values["id"]
+        fields_set.add("product_id")
+    if not values["id"] and values["product_id"]:
+        values["id"] = values["product_id"]
+        fields_set.add("id")
+
+    product = _new_object(StandardProduct)
+    _set_slot(product, "__dict__", values)
+    _set_slot(product, "__pydantic_extra__", extra)
+    _set_slot(product, "__pydantic_fields_set__", fields_set)
+    _set_slot(product, "__pydantic_private__", None)
+    return product
+
+
+def hydrate_product(data: Any) -> StandardProduct:
+    """
+    Build a StandardProduct from already-validated cache data.
+
+    Same result as `StandardProduct(**data)` (and raises in the same cases),
+    minus the validation cost for well-formed rows.
+    """
+    if FAST_HYDRATION_ENABLED and type(data) is dict:
+        product = _trusted_product(data)
+        if product is not None:
+            return product
+    if isinstance(data, dict):
+        return StandardProduct(**data)
+    return StandardProduct.model_validate(data)
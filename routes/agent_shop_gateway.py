@@ -13,12 +13,12 @@ Currently supports:
 Path: POST /agent/shop/v1/invoke
 """
 
-import json
+import copy
 import logging
 import os
 import re
 import unicodedata
-from collections import Counter
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
@@ -26,13 +26,40 @@ import httpx
 from fastapi import APIRouter, BackgroundTasks, HTTPException
 from pydantic import BaseModel, Field
 
-from services.product_query_service import get_products_hybrid
+from services.candidate_batch import CandidateBatch
+from services.catalog_snapshot import CatalogEntry, catalog_snapshot, typo_corrections_in
+from services.co_purchase_service import co_purchase_index
+from services.env import env_float, env_int
+from services.fuzzy_index import fuzzy_token_match
+from services.intent_lexicon import TEE_QUERY_TERMS, TOY_FUZZY_TARGETS, TOY_QUERY_TERMS, tag_query
+from services.json_columns import decode_array, decode_object, decode_stats
+from services.merchant_directory import merchant_directory
+from services.popularity_service import popularity_index
+from services.prefetch import PrefetchGraph
+from services.product_detail_cache import product_detail_cache
+from services.product_hydration import (
+    load_merchant_products_ordered,
+    load_product_by_id,
+    load_products_by_ids,
+)
+from services.product_query_service import (
+    InvalidCursor,
+    ProductFilter,
+    filter_products,
+    get_products_hybrid,
+    get_products_page,
+    merchant_product_cache,
+)
+from services.single_flight import SingleFlight, canonical_request_key
+from services.upstream_clients import UpstreamClient, aclose_upstreams, register_upstream, upstream_stats
+from services.user_signal_cache import EMPTY_SIGNALS, UserSignals, user_signal_cache
 from services.similarity_service import (
     SimilarityStrategy,
     similarity_service,
 )
 from services.similarity_config import get_similarity_scoring_weights
-from models.standard_product import StandardProduct, ProductStatus
+from services.similarity_scoring import personalization_scores, rank_scores, top_k_indices
+from models.standard_product import StandardProduct, ProductStatus, hydrate_product
 
 AGENT_API_BASE = os.getenv("AGENT_API_BASE", "https://web-production-fedb.up.railway.app").rstrip("/")
 SHOP_MAINLINE_INVOKE_BASE = os.getenv(
@@ -43,8 +70,44 @@ AGENT_API_KEY = os.getenv("SHOP_GATEWAY_AGENT_API_KEY") or os.getenv("PIVOTA_API
 
 logger = logging.getLogger(__name__)
 
+# Pooled, keep-alive clients shared by every proxied call; closed on shutdown.
+agent_api_upstream = register_upstream(
+    UpstreamClient(
+        "agent_api",
+        AGENT_API_BASE,
+        default_timeout_s=15.0,
+        operation_timeouts={"create_order": 15.0, "preview_quote": 10.0, "submit_payment": 20.0},
+    )
+)
+mainline_upstream = register_upstream(
+    UpstreamClient("shop_mainline", SHOP_MAINLINE_INVOKE_BASE, default_timeout_s=25.0)
+)
+
+
+# Read-only, high fan-in operations whose identical concurrent calls share one computation.
+COALESCED_OPERATIONS = frozenset({"find_products_multi", "find_similar_products"})
+invoke_single_flight = SingleFlight()
+
+# find_products_multi prefetch budgets (0 disables). A slow history lookup is
+# dropped (no personalization boost); slow candidates yield an empty result.
+MULTI_HISTORY_TIMEOUT_S = env_float("SHOP_GATEWAY_MULTI_HISTORY_TIMEOUT_MS", 300.0) / 1000.0
+MULTI_CANDIDATES_TIMEOUT_S = env_float("SHOP_GATEWAY_MULTI_CANDIDATES_TIMEOUT_MS", 0.0) / 1000.0
+# find_products_multi searches at most this many merchants per request, in
+# directory order (0 = all), and loads their candidates with at most
+# MULTI_MERCHANT_IN_LIST merchant ids per products_cache query.
+MULTI_MAX_MERCHANTS = env_int("SHOP_GATEWAY_MULTI_MAX_MERCHANTS", 500)
+MULTI_MERCHANT_IN_LIST = max(1, env_int("SHOP_GATEWAY_MULTI_MERCHANT_IN_LIST", 200))
+
+
+@asynccontextmanager
+async def _upstream_lifespan(_app):
+    try:
+        yield
+    finally:
+        await aclose_upstreams()
+
 
-router = APIRouter(prefix="/agent/shop/v1", tags=["Shopping Gateway"])
+router = APIRouter(prefix="/agent/shop/v1", tags=["Shopping Gateway"], lifespan=_upstream_lifespan)
 DEV_MODE = os.getenv("APP_ENV", "dev") != "production"
 
 
@@ -57,6 +120,9 @@ class SearchFilters(BaseModel):
     page: int = Field(1, ge=1, description="Page number (1-based)")
     # Allow larger requested limits; internal logic will clamp to safe bounds.
     limit: int = Field(20, ge=1, le=500, description="Page size (max 500; internally clamped)")
+    cursor: Optional[str] = Field(
+        None, description="Opaque next_cursor from the previous page; takes precedence over page"
+    )
 
 
 class FindProductsPayload(BaseModel):
@@ -410,7 +476,6 @@ def _should_proxy_beauty_find_products_multi(
 
 
 async def _proxy_public_shop_invoke(request_body: Dict[str, Any]) -> Dict[str, Any]:
-    url = f"{SHOP_MAINLINE_INVOKE_BASE}/agent/shop/v1/invoke"
     headers = {
         "Content-Type": "application/json",
         "Accept": "application/json",
@@ -419,8 +484,12 @@ async def _proxy_public_shop_invoke(request_body: Dict[str, Any]) -> Dict[str, A
         headers["X-API-Key"] = AGENT_API_KEY
 
     try:
-        async with httpx.AsyncClient(timeout=25.0) as client:
-            resp = await client.post(url, json=request_body, headers=headers)
+        resp = await mainline_upstream.post(
+            "/agent/shop/v1/invoke",
+            operation="mainline_invoke",
+            json=request_body,
+            headers=headers,
+        )
     except httpx.HTTPError as exc:
         raise HTTPException(status_code=502, detail=f"Upstream mainline invoke error: {exc}") from exc
 
@@ -476,33 +545,10 @@ async def _load_product_by_id(product_id: str) -> Optional[StandardProduct]:
     """
     Load a single product from cache by product_id/platform_product_id.
     """
-    from db.database import database
-
-    queries = [
-        """
-        SELECT product_data
-        FROM products_cache
-        WHERE product_data->>'product_id' = :pid
-        LIMIT 1
-        """,
-        """
-        SELECT product_data
-        FROM products_cache
-        WHERE platform_product_id = :pid
-        LIMIT 1
-        """,
-    ]
-    for q in queries:
-        try:
-            row = await database.fetch_one(q, {"pid": product_id})
-            if row and "product_data" in row:
-                try:
-                    return StandardProduct.parse_obj(row["product_data"])
-                except Exception:
-                    continue
-        except Exception:
-            continue
-    return None
+    try:
+        return await load_product_by_id(product_id)
+    except Exception:
+        return None
 
 
 async def _load_products_by_ids(product_ids: List[str]) -> Dict[str, StandardProduct]:
@@ -511,32 +557,10 @@ async def _load_products_by_ids(product_ids: List[str]) -> Dict[str, StandardPro
     """
     if not product_ids:
         return {}
-    from db.database import database
-
-    unique_ids = list({pid for pid in product_ids if pid})
-    placeholders = ",".join([f":pid{i}" for i in range(len(unique_ids))])
-    params = {f"pid{i}": pid for i, pid in enumerate(unique_ids)}
-
-    query = f"""
-    SELECT product_data
-    FROM products_cache
-    WHERE product_data->>'product_id' IN ({placeholders})
-       OR platform_product_id IN ({placeholders})
-    """
-    result: Dict[str, StandardProduct] = {}
     try:
-        rows = await database.fetch_all(query, params)
-        for row in rows:
-            try:
-                sp = StandardProduct.parse_obj(row["product_data"])
-                pid = sp.product_id or sp.id
-                if pid:
-                    result[pid] = sp
-            except Exception:
-                continue
+        return await load_products_by_ids(product_ids)
     except Exception:
-        pass
-    return result
+        return {}
 
 
 async def _handle_find_products(
@@ -547,14 +571,49 @@ async def _handle_find_products(
     Implementation of the find_products operation.
 
     Contract (simplified):
-    - Input: { search: { merchant_id, query, category?, price_min?, price_max?, page?, limit? } }
-    - Output: { products: [...], total, page, page_size }
+    - Input: { search: { merchant_id, query, category?, price_min?, price_max?, page?, limit?, cursor? } }
+    - Output: { products: [...], total, page, page_size, next_cursor }
+
+    Filters run in SQL and pages are keyset-paginated: pass the returned
+    `next_cursor` back as `cursor` to read the following page at constant
+    cost. `page` without a cursor still works (OFFSET). If the paged query
+    fails the legacy over-fetch-and-slice path below is used instead.
     """
     merchant_id = filters.merchant_id
     page = filters.page or 1
     limit = min(filters.limit or 20, 100)
 
-    # To support pagination, fetch up to page * limit items (capped)
+    try:
+        result = await get_products_page(
+            merchant_id=merchant_id,
+            limit=limit,
+            query=filters.query,
+            category=filters.category,
+            price_min=filters.price_min,
+            price_max=filters.price_max,
+            cursor=filters.cursor,
+            offset=0 if filters.cursor else (page - 1) * limit,
+        )
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {exc}")
+    except Exception as exc:
+        logger.warning("find_products: paged query failed, using legacy scan: %s", exc)
+    else:
+        return {
+            "products": [_standard_to_shop_product(p) for p in result.products],
+            "total": result.total,
+            "page": page,
+            "page_size": len(result.products),
+            "next_cursor": result.next_cursor,
+            "metadata": {
+                "query_source": result.source,
+                "pagination": "keyset" if filters.cursor else ("offset" if page > 1 else "first"),
+                "total_capped": result.total_capped,
+                "fetched_at": datetime.utcnow().isoformat(),
+            },
+        }
+
+    # Legacy path: fetch up to page * limit items (capped)
     # and slice in-memory. For now we cap to 500 for safety.
     raw_limit = min(page * limit, 500)
 
@@ -575,33 +634,10 @@ async def _handle_find_products(
             detail=f"Failed to fetch products for merchant {merchant_id}: {error}",
         )
 
-    # In-memory filtering based on query/category/price
-    filtered: List[StandardProduct] = products
-
-    q = (filters.query or "").strip().lower()
-    if q:
-        def matches_query(prod: StandardProduct) -> bool:
-            title = (prod.title or "").lower()
-            desc = (prod.description or "").lower()
-            ptype = (prod.product_type or "").lower()
-            return q in title or q in desc or q in ptype
-
-        filtered = [p for p in filtered if matches_query(p)]
-
-    if filters.category:
-        cat = filters.category.lower()
-
-        def matches_category(prod: StandardProduct) -> bool:
-            ptype = (prod.product_type or "").lower()
-            return cat in ptype
-
-        filtered = [p for p in filtered if matches_category(p)]
-
-    if filters.price_min is not None:
-        filtered = [p for p in filtered if p.price >= filters.price_min]
-
-    if filters.price_max is not None:
-        filtered = [p for p in filtered if p.price <= filters.price_max]
+    # In-memory filtering with the same semantics as the SQL predicates
+    filtered = filter_products(
+        products, ProductFilter.build(filters.query, filters.category, filters.price_min, filters.price_max)
+    )
 
     total = len(filtered)
 
@@ -615,8 +651,10 @@ async def _handle_find_products(
         "total": total,
         "page": page,
         "page_size": len(page_items),
+        "next_cursor": None,
         "metadata": {
             "query_source": query_source,
+            "pagination": "legacy",
             "fetched_at": datetime.utcnow().isoformat(),
         },
     }
@@ -665,67 +703,25 @@ async def _handle_find_products_multi(
             if not unicodedata.combining(c)
         )
 
-    def _edit_distance_leq(a: str, b: str, max_dist: int) -> bool:
-        """Return True if Levenshtein(a,b) <= max_dist (with early exit)."""
-        if a == b:
-            return True
-        if max_dist <= 0:
-            return False
-        if not a or not b:
-            return max(len(a), len(b)) <= max_dist
-        if abs(len(a) - len(b)) > max_dist:
-            return False
-
-        if len(a) > len(b):
-            a, b = b, a
-
-        prev = list(range(len(a) + 1))
-        for i, ch_b in enumerate(b, start=1):
-            cur = [i]
-            min_in_row = cur[0]
-            for j, ch_a in enumerate(a, start=1):
-                cost = 0 if ch_a == ch_b else 1
-                cur_val = min(
-                    prev[j] + 1,
-                    cur[j - 1] + 1,
-                    prev[j - 1] + cost,
-                )
-                cur.append(cur_val)
-                if cur_val < min_in_row:
-                    min_in_row = cur_val
-            if min_in_row > max_dist:
-                return False
-            prev = cur
-        return prev[-1] <= max_dist
-
-    def _fuzzy_token_match(tokens: List[str], targets: List[str], max_dist: int) -> bool:
-        if not tokens or not targets:
-            return False
-        target_set = {t for t in targets if t}
-        for tok in tokens:
-            if tok in target_set:
-                return True
-            if len(tok) < 4:
-                continue
-            for t in target_set:
-                if abs(len(tok) - len(t)) > max_dist:
-                    continue
-                if _edit_distance_leq(tok, t, max_dist):
-                    return True
-        return False
-
-    async def _load_user_history_signals() -> tuple[set[str], List[str]]:
+    async def _load_user_history_signals() -> UserSignals:
         """Best-effort fetch of the user's historical purchases to bias ranking."""
         if not user_ctx:
-            return set(), []
+            return EMPTY_SIGNALS
 
         uid = (user_ctx.id or "").strip()
         explicit_email = (user_ctx.email or "").strip()
         email_from_id = uid if "@" in uid and not explicit_email else ""
 
         if not uid and not explicit_email and not email_from_id:
-            return set(), []
+            return EMPTY_SIGNALS
+
+        # Derived signals are cached per user and dropped when they order.
+        return await user_signal_cache.get(
+            (uid, explicit_email, email_from_id),
+            lambda: _read_user_history_signals(uid, explicit_email, email_from_id),
+        )
 
+    async def _read_user_history_signals(uid: str, explicit_email: str, email_from_id: str) -> UserSignals:
         query = """
             SELECT merchant_id, items
             FROM orders
@@ -748,15 +744,10 @@ async def _handle_find_products_multi(
         )
 
         product_ids: set[str] = set()
-        titles: List[str] = []
+        title_terms: set[str] = set()
         for row in rows:
-            raw_items = row.get("items") if isinstance(row, dict) else None
-            if isinstance(raw_items, str):
-                try:
-                    raw_items = json.loads(raw_items)
-                except Exception:
-                    raw_items = None
-            if not isinstance(raw_items, list):
+            raw_items = decode_array(row.get("items") if isinstance(row, dict) else None)
+            if raw_items is None:
                 continue
             for item in raw_items:
                 if not isinstance(item, dict):
@@ -771,184 +762,22 @@ async def _handle_find_products_multi(
                 if pid:
                     product_ids.add(pid)
                 if item.get("product_title"):
-                    titles.append(str(item["product_title"]))
-        return product_ids, titles
+                    title_terms.update(_tokenize(str(item["product_title"])))
+        return UserSignals(frozenset(product_ids), frozenset(title_terms))
 
     async def _load_creator_top_sellers(max_candidates: int = 50) -> List[StandardProduct]:
-        """Fetch top-selling products for a creator by mining order metadata."""
+        """Top-selling products for a creator, from the order popularity index."""
         if not creator_id:
             return []
-
-        rows = await database.fetch_all(
-            """
-            SELECT merchant_id, items
-            FROM orders
-            WHERE is_deleted IS NOT TRUE
-              AND (
-                metadata->>'creator_id' = :creator_id
-                OR metadata->>'creatorId' = :creator_id
-              )
-            ORDER BY created_at DESC
-            LIMIT 400
-            """,
-            {"creator_id": creator_id},
-        )
-
-        popularity = Counter()
-        for row in rows:
-            merchant_id = row.get("merchant_id") if isinstance(row, dict) else None
-            raw_items = row.get("items") if isinstance(row, dict) else None
-            if not merchant_id:
-                continue
-            if isinstance(raw_items, str):
-                try:
-                    raw_items = json.loads(raw_items)
-                except Exception:
-                    raw_items = None
-            if not isinstance(raw_items, list):
-                continue
-            for item in raw_items:
-                if not isinstance(item, dict):
-                    continue
-                pid = str(
-                    item.get("product_id")
-                    or item.get("id")
-                    or item.get("platform_product_id")
-                    or ""
-                ).strip()
-                if not pid:
-                    continue
-                qty = int(item.get("quantity") or 1)
-                popularity[(merchant_id, pid)] += max(qty, 1)
-
-        if not popularity:
-            return []
-
-        async def _fetch_product(merchant_id: str, product_id: str) -> Optional[StandardProduct]:
-            row = await database.fetch_one(
-                """
-                SELECT product_data
-                FROM products_cache
-                WHERE merchant_id = :merchant_id
-                  AND (
-                    platform_product_id = :pid
-                    OR product_data->>'id' = :pid
-                    OR product_data->>'product_id' = :pid
-                  )
-                ORDER BY cached_at DESC
-                LIMIT 1
-                """,
-                {"merchant_id": merchant_id, "pid": product_id},
-            )
-            if not row:
-                return None
-            product_data = row.get("product_data") if isinstance(row, dict) else None
-            if isinstance(product_data, str):
-                try:
-                    product_data = json.loads(product_data)
-                except Exception:
-                    return None
-            if not isinstance(product_data, dict):
-                return None
-            try:
-                product = StandardProduct(**product_data)
-                product.merchant_id = merchant_id
-                return product
-            except Exception:
-                return None
-
-        products: List[StandardProduct] = []
-        for (m_id, pid), _count in popularity.most_common(max_candidates * 2):
-            prod = await _fetch_product(m_id, pid)
-            if prod:
-                products.append(prod)
-            if len(products) >= max_candidates:
-                break
-        return products
+        ranked = await popularity_index.top_keys(creator_id, max_candidates * 2)
+        return await load_merchant_products_ordered(ranked, limit=max_candidates)
 
     async def _load_global_top_sellers(max_candidates: int = 50) -> List[StandardProduct]:
         """Global popular products as a fallback when creator context is missing."""
-        rows = await database.fetch_all(
-            """
-            SELECT merchant_id, items
-            FROM orders
-            WHERE is_deleted IS NOT TRUE
-            ORDER BY created_at DESC
-            LIMIT 800
-            """
-        )
-
-        popularity = Counter()
-        for row in rows:
-            merchant_id = row.get("merchant_id") if isinstance(row, dict) else None
-            raw_items = row.get("items") if isinstance(row, dict) else None
-            if not merchant_id:
-                continue
-            if isinstance(raw_items, str):
-                try:
-                    raw_items = json.loads(raw_items)
-                except Exception:
-                    raw_items = None
-            if not isinstance(raw_items, list):
-                continue
-            for item in raw_items:
-                if not isinstance(item, dict):
-                    continue
-                pid = str(
-                    item.get("product_id")
-                    or item.get("id")
-                    or item.get("platform_product_id")
-                    or ""
-                ).strip()
-                if not pid:
-                    continue
-                qty = int(item.get("quantity") or 1)
-                popularity[(merchant_id, pid)] += max(qty, 1)
-
-        products: List[StandardProduct] = []
-
-        async def _fetch_product(merchant_id: str, product_id: str) -> Optional[StandardProduct]:
-            row = await database.fetch_one(
-                """
-                SELECT product_data
-                FROM products_cache
-                WHERE merchant_id = :merchant_id
-                  AND (
-                    platform_product_id = :pid
-                    OR product_data->>'id' = :pid
-                    OR product_data->>'product_id' = :pid
-                  )
-                ORDER BY cached_at DESC
-                LIMIT 1
-                """,
-                {"merchant_id": merchant_id, "pid": product_id},
-            )
-            if not row:
-                return None
-            product_data = row.get("product_data") if isinstance(row, dict) else None
-            if isinstance(product_data, str):
-                try:
-                    product_data = json.loads(product_data)
-                except Exception:
-                    return None
-            if not isinstance(product_data, dict):
-                return None
-            try:
-                product = StandardProduct(**product_data)
-                product.merchant_id = merchant_id
-                return product
-            except Exception:
-                return None
-
-        if popularity:
-            for (m_id, pid), _count in popularity.most_common(max_candidates * 2):
-                prod = await _fetch_product(m_id, pid)
-                if prod:
-                    products.append(prod)
-                if len(products) >= max_candidates:
-                    break
-            if products:
-                return products
+        ranked = await popularity_index.top_keys(None, max_candidates * 2)
+        products = await load_merchant_products_ordered(ranked, limit=max_candidates)
+        if products:
+            return products
 
         # Final fallback: recent cached products
         rows = await database.fetch_all(
@@ -962,54 +791,18 @@ async def _handle_find_products_multi(
         )
         for row in rows:
             product_data = row.get("product_data") if isinstance(row, dict) else None
-            if isinstance(product_data, str):
-                try:
-                    product_data = json.loads(product_data)
-                except Exception:
-                    continue
-            if not isinstance(product_data, dict):
+            product_data = decode_object(product_data)
+            if product_data is None:
                 continue
             try:
-                products.append(StandardProduct(**product_data))
+                products.append(hydrate_product(product_data))
             except Exception:
                 continue
 
         return products
 
-    history_product_ids, history_titles = await _load_user_history_signals()
-    history_terms = set()
-    if user_ctx and user_ctx.recent_queries:
-        for q_term in user_ctx.recent_queries:
-            history_terms.update(_tokenize(q_term))
-    for title in history_titles:
-        history_terms.update(_tokenize(title))
-
-    # Fetch candidate merchants (active + PSP connected)
-    merchant_rows = await database.fetch_all(
-        """
-        SELECT merchant_id, business_name
-        FROM merchant_onboarding
-        WHERE status NOT IN ('deleted', 'rejected')
-        AND psp_connected = true
-        LIMIT 100
-        """
-    )
-    merchant_map = {row["merchant_id"]: row["business_name"] for row in merchant_rows}
-
-    if not merchant_map:
-        return {
-            "products": [],
-            "total": 0,
-            "page": page,
-            "page_size": 0,
-            "metadata": {
-                "query_source": "cache_multi",
-                "fetched_at": datetime.utcnow().isoformat(),
-                "merchants_searched": 0,
-            },
-        }
-
-    # Cold start & intent detection.
+    # Query-side inputs; pure and identical for every product, so they are
+    # computed before any data is loaded.
     q_raw = filters.query or ""
     q = q_raw.strip()
     q_lower = q.lower()
@@ -1017,35 +810,15 @@ async def _handle_find_products_multi(
     q_tokens = _tokenize(q_ascii)
 
     # Detect special intents for downstream filtering/UX.
-    look_intent = False
-    if "nina studio" in q_lower and any(
-        token in q_lower for token in ["exact outfit", "shop", "look", "wear", "ropa", "outfit"]
-    ):
-        look_intent = True
-
-    # Detect negative lingerie constraint (e.g. "no lingerie", "sin lenceria").
-    exclude_lingerie = False
-    if (
-        "no lingerie" in q_lower
-        or "without lingerie" in q_lower
-        or "sin lenceria" in q_lower
-        or "sin lencer\u00eda" in q_lower
-        or "sin ropa interior" in q_lower
-    ):
-        exclude_lingerie = True
-
-    # Detect toys intent (kids + designer toys), including common misspellings (e.g. "tolls" ≈ "dolls").
-    toys_intent_query = bool(
-        "toy" in q_ascii
-        or "toys" in q_ascii
-        or "juguete" in q_ascii
-        or "juguetes" in q_ascii
-        or "art toy" in q_ascii
-        or "art toys" in q_ascii
-        or "designer toy" in q_ascii
-        or "designer toys" in q_ascii
-        or "labubu" in q_ascii
-        or _fuzzy_token_match(q_tokens, ["doll", "dolls", "toys"], max_dist=1)
+    q_compact = re.sub(r"[^a-z0-9]+", "", q_lower)
+    query_intents = tag_query(q_lower, q_ascii, q_compact)
+    look_intent = query_intents.look
+    # Negative lingerie constraint (e.g. "no lingerie", "sin lenceria").
+    exclude_lingerie = query_intents.exclude_lingerie
+    tee_intent = query_intents.tee
+    # Toys intent (kids + designer toys), including common misspellings (e.g. "tolls" ≈ "dolls").
+    toys_intent_query = query_intents.toys or fuzzy_token_match(
+        q_tokens, list(TOY_FUZZY_TARGETS), max_dist=1
     )
 
     # Construct reply for look-intent queries: similar items + disclaimer/prompt.
@@ -1057,36 +830,6 @@ async def _handle_find_products_multi(
             "If you share a link or photo of the outfit, I can refine these suggestions."
         )
 
-    # Cold start: empty query falls back to creator top sellers (or global).
-    if not q:
-        source = "creator_top_sellers"
-        top_sellers = await _load_creator_top_sellers(max_candidates=limit * 2)
-        if not top_sellers:
-            top_sellers = await _load_global_top_sellers(max_candidates=limit * 2)
-            source = "global_top_sellers"
-        mapped = []
-        for prod in top_sellers[: limit * page]:
-            item = _standard_to_shop_product(prod)
-            item["merchant_name"] = merchant_map.get(prod.merchant_id)
-            mapped.append(item)
-
-        start_idx = (page - 1) * limit
-        page_items = mapped[start_idx : start_idx + limit]
-        return {
-            "products": page_items,
-            "total": len(mapped),
-            "page": page,
-            "page_size": len(page_items),
-            "reply": reply_text,
-            "metadata": {
-                "query_source": source,
-                "fetched_at": datetime.utcnow().isoformat(),
-                "merchants_searched": len(merchant_map),
-                "creator_id": creator_id,
-                "creator_name": creator_name,
-            },
-        }
-
     # How many products to fetch per merchant (before global filtering/pagination)
     # We fetch a bit more than the requested page size to have headroom for filtering.
     per_merchant_limit = min(max(limit * 2, 20), 200)
@@ -1094,48 +837,55 @@ async def _handle_find_products_multi(
     async def _load_merchant_products_batch(
         merchant_ids: List[str],
         per_merchant_cap: int,
+        merchant_names: Dict[str, str],
     ) -> list[tuple[StandardProduct, str]]:
         """
-        Load recent cached products for all merchants in one DB roundtrip.
+        Load recent cached products for the merchants in a few bounded queries.
 
         This replaces the previous N-roundtrip loop (one query per merchant),
-        which caused first-hit latency spikes on large merchant sets.
+        which caused first-hit latency spikes on large merchant sets; IN lists
+        are capped at MULTI_MERCHANT_IN_LIST merchant ids per query.
         """
         if not merchant_ids:
             return []
 
         safe_limit = min(max(int(per_merchant_cap), 1), 200)
-        bind_params: Dict[str, Any] = {"per_merchant_limit": safe_limit}
-        merchant_binds: List[str] = []
-        for idx, merchant_id in enumerate(merchant_ids):
-            bind_key = f"mid_{idx}"
-            bind_params[bind_key] = merchant_id
-            merchant_binds.append(f":{bind_key}")
-
-        in_clause = ", ".join(merchant_binds) if merchant_binds else "''"
-        rows = await database.fetch_all(
-            f"""
-            WITH ranked AS (
-                SELECT
-                    merchant_id,
-                    product_data,
-                    ROW_NUMBER() OVER (
-                        PARTITION BY merchant_id
-                        ORDER BY cached_at DESC
-                    ) AS rn
-                FROM products_cache
-                WHERE merchant_id IN ({in_clause})
+        rows: List[Any] = []
+        for start in range(0, len(merchant_ids), MULTI_MERCHANT_IN_LIST):
+            bind_params: Dict[str, Any] = {"per_merchant_limit": safe_limit}
+            merchant_binds: List[str] = []
+            for idx, merchant_id in enumerate(merchant_ids[start : start + MULTI_MERCHANT_IN_LIST]):
+                bind_key = f"mid_{idx}"
+                bind_params[bind_key] = merchant_id
+                merchant_binds.append(f":{bind_key}")
+
+            in_clause = ", ".join(merchant_binds)
+            rows.extend(
+                await database.fetch_all(
+                    f"""
+                    WITH ranked AS (
+                        SELECT
+                            merchant_id,
+                            product_data,
+                            ROW_NUMBER() OVER (
+                                PARTITION BY merchant_id
+                                ORDER BY cached_at DESC
+                            ) AS rn
+                        FROM products_cache
+                        WHERE merchant_id IN ({in_clause})
+                    )
+                    SELECT merchant_id, product_data
+                    FROM ranked
+                    WHERE rn <= :per_merchant_limit
+                    ORDER BY merchant_id, rn
+                    """,
+                    bind_params,
+                )
+                or []
             )
-            SELECT merchant_id, product_data
-            FROM ranked
-            WHERE rn <= :per_merchant_limit
-            ORDER BY merchant_id, rn
-            """,
-            bind_params,
-        )
 
         out: list[tuple[StandardProduct, str]] = []
-        for row in rows or []:
+        for row in rows:
             merchant_id = str(
                 row.get("merchant_id") if isinstance(row, dict) else ""
             ).strip()
@@ -1143,54 +893,204 @@ async def _handle_find_products_multi(
                 continue
 
             product_data = row.get("product_data") if isinstance(row, dict) else None
-            if isinstance(product_data, str):
-                try:
-                    product_data = json.loads(product_data)
-                except Exception:
-                    continue
-            if not isinstance(product_data, dict):
+            product_data = decode_object(product_data)
+            if product_data is None:
                 continue
 
             try:
-                product = StandardProduct(**product_data)
+                product = hydrate_product(product_data)
                 if not product.merchant_id:
                     product.merchant_id = merchant_id
-                out.append((product, merchant_map.get(merchant_id) or ""))
+                out.append((product, merchant_names.get(merchant_id) or ""))
             except Exception:
                 continue
 
         return out
 
-    merchant_products_source = "batch_cache_query"
-    merchant_products: list[tuple[StandardProduct, str]]
-    merchant_ids = list(merchant_map.keys())
-    try:
-        merchant_products = await _load_merchant_products_batch(
-            merchant_ids=merchant_ids,
-            per_merchant_cap=per_merchant_limit,
+    # Token-based matching with short-token guard (prevents "te e" -> ["te","e"] over-matching).
+    query_terms = _tokenize(q_ascii)
+
+    if not query_terms and q_compact and len(q_compact) > 2:
+        query_terms = [q_compact]
+
+    if tee_intent:
+        for t in TEE_QUERY_TERMS:
+            if t not in query_terms:
+                query_terms.append(t)
+
+    if toys_intent_query:
+        for t in TOY_QUERY_TERMS:
+            if t not in query_terms:
+                query_terms.append(t)
+
+    async def _load_candidates(merchants: Dict[str, str]) -> tuple:
+        """
+        Relevance candidates for the merchants in `merchants`: (source,
+        products loaded, catalog entries, merchant names, typo alternatives).
+        """
+        merchant_ids = list(merchants.keys())
+        term_alternatives: Dict[str, tuple[str, ...]] = {}
+        typo_terms = [term for term in _tokenize(q_ascii) if term in query_terms]
+        if not merchant_ids:
+            return "no_merchants", 0, [], [], term_alternatives
+        if await catalog_snapshot.ensure_fresh():
+            # Serve from the in-process snapshot; it mirrors the batch query below.
+            loaded = catalog_snapshot.count_selected(merchant_ids, per_merchant_limit)
+            # Typo tolerance: a query token that matches nothing in the catalog also
+            # accepts vocabulary terms one edit away (e.g. "tolls" -> "dolls").
+            for term in typo_terms:
+                corrections = catalog_snapshot.typo_corrections(term)
+                if corrections:
+                    term_alternatives[term] = (term, *corrections)
+            # Every product that can score must contain the query or one of its
+            # terms, so index candidates are enough and ranking stays unchanged.
+            entries = catalog_snapshot.select_matching(
+                merchant_ids,
+                per_merchant_limit,
+                [q_lower, *query_terms, *(alt for alts in term_alternatives.values() for alt in alts)],
+            )
+            if entries is None:
+                entries = catalog_snapshot.select(merchant_ids, per_merchant_limit)
+            names = [merchants.get(entry.merchant_id) or "" for entry in entries]
+            return "catalog_snapshot", loaded, entries, names, term_alternatives
+
+        source = "batch_cache_query"
+        try:
+            merchant_products = await _load_merchant_products_batch(
+                merchant_ids=merchant_ids,
+                per_merchant_cap=per_merchant_limit,
+                merchant_names=merchants,
+            )
+        except Exception:
+            # Safety fallback: preserve previous behavior if batch query fails.
+            source = "per_merchant_fallback"
+            merchant_products = []
+            for mid, name in merchants.items():
+                try:
+                    products, _source, _error = await get_products_hybrid(
+                        merchant_id=mid,
+                        limit=per_merchant_limit,
+                        agent_id="shopping_ai_multi",
+                        background_tasks=background_tasks,
+                    )
+                    for p in products:
+                        merchant_products.append((p, name))
+                except Exception:
+                    # Ignore individual merchant failures to keep cross-merchant search robust
+                    continue
+        entries = [
+            CatalogEntry.from_product(product, product.merchant_id or "")
+            for product, _merchant_name in merchant_products
+        ]
+        names = [merchant_name for _product, merchant_name in merchant_products]
+        # Same typo tolerance as the snapshot, with the loaded candidates as vocabulary.
+        for term, corrections in typo_corrections_in(entries, typo_terms).items():
+            term_alternatives[term] = (term, *corrections)
+        return source, len(entries), entries, names, term_alternatives
+
+    async def _load_merchants() -> Dict[str, str]:
+        merchants = await merchant_directory.get(database)
+        if 0 < MULTI_MAX_MERCHANTS < len(merchants):
+            merchants = dict(list(merchants.items())[:MULTI_MAX_MERCHANTS])
+        return merchants
+
+    async def _load_cold_start() -> tuple[str, List[StandardProduct]]:
+        top_sellers = await _load_creator_top_sellers(max_candidates=limit * 2)
+        if top_sellers:
+            return "creator_top_sellers", top_sellers
+        return "global_top_sellers", await _load_global_top_sellers(max_candidates=limit * 2)
+
+    # Data loading as a small dependency graph: the merchant directory, the
+    # user's history and (for an empty query) top sellers are independent;
+    # only candidates wait on the merchant list. History is optional and
+    # degrades to no boost when slow or failing.
+    prefetch = PrefetchGraph()
+    prefetch.add("merchants", _load_merchants)
+    if q:
+        prefetch.add(
+            "history",
+            _load_user_history_signals,
+            timeout_s=MULTI_HISTORY_TIMEOUT_S,
+            fallback=EMPTY_SIGNALS,
         )
-    except Exception:
-        # Safety fallback: preserve previous behavior if batch query fails.
-        merchant_products_source = "per_merchant_fallback"
-        merchant_products = []
-        for mid, name in merchant_map.items():
-            try:
-                products, _source, _error = await get_products_hybrid(
-                    merchant_id=mid,
-                    limit=per_merchant_limit,
-                    agent_id="shopping_ai_multi",
-                    background_tasks=background_tasks,
-                )
-                for p in products:
-                    merchant_products.append((p, name))
-            except Exception:
-                # Ignore individual merchant failures to keep cross-merchant search robust
-                continue
+        prefetch.add(
+            "candidates",
+            _load_candidates,
+            after=("merchants",),
+            timeout_s=MULTI_CANDIDATES_TIMEOUT_S,
+            fallback=("timeout", 0, [], [], {}),
+        )
+    else:
+        # Cold start: empty query falls back to creator top sellers (or global).
+        prefetch.add("cold_start", _load_cold_start)
+    loaded = await prefetch.run()
+    prefetch_timings = prefetch.timings
 
-    # In-memory filtering and simple relevance scoring (reuse Agent API logic)
-    filtered_products: list[dict[str, Any]] = []
+    # Candidate merchants (active + PSP connected), served stale-while-revalidate.
+    merchant_map = loaded["merchants"]
 
-    for product, merchant_name in merchant_products:
+    if not merchant_map:
+        return {
+            "products": [],
+            "total": 0,
+            "page": page,
+            "page_size": 0,
+            "metadata": {
+                "query_source": "cache_multi",
+                "fetched_at": datetime.utcnow().isoformat(),
+                "merchants_searched": 0,
+                "merchant_directory_age_s": merchant_directory.age_s(),
+                "prefetch": prefetch_timings,
+            },
+        }
+
+    if not q:
+        source, top_sellers = loaded["cold_start"]
+        mapped = []
+        for prod in top_sellers[: limit * page]:
+            item = _standard_to_shop_product(prod)
+            item["merchant_name"] = merchant_map.get(prod.merchant_id)
+            mapped.append(item)
+
+        start_idx = (page - 1) * limit
+        page_items = mapped[start_idx : start_idx + limit]
+        return {
+            "products": page_items,
+            "total": len(mapped),
+            "page": page,
+            "page_size": len(page_items),
+            "reply": reply_text,
+            "metadata": {
+                "query_source": source,
+                "fetched_at": datetime.utcnow().isoformat(),
+                "merchants_searched": len(merchant_map),
+                "creator_id": creator_id,
+                "creator_name": creator_name,
+                "prefetch": prefetch_timings,
+            },
+        }
+
+    history_signals: UserSignals = loaded["history"]
+    history_product_ids = history_signals.product_ids
+    history_terms = set(history_signals.terms)
+    if user_ctx and user_ctx.recent_queries:
+        for q_term in user_ctx.recent_queries:
+            history_terms.update(_tokenize(q_term))
+
+    (
+        merchant_products_source,
+        merchant_products_loaded,
+        catalog_entries,
+        merchant_names,
+        term_alternatives,
+    ) = loaded["candidates"]
+
+    # In-memory filtering and simple relevance scoring (reuse Agent API logic).
+    # Survivors are kept as (row, score) columns; dicts are built for one page only.
+    candidates = CandidateBatch()
+
+    for row, entry in enumerate(catalog_entries):
+        product = entry.product
         # Price filter
         if filters.price_min is not None and product.price < filters.price_min:
             continue
@@ -1212,144 +1112,46 @@ async def _handle_find_products_multi(
                 continue
 
         # Explicit lingerie exclusion when user asks for "no lingerie" (or equivalents).
-        if exclude_lingerie:
-            blob_for_lingerie = " ".join(
-                [
-                    (product.title or "").lower(),
-                    (product.description or "").lower(),
-                    (product.product_type or "").lower(),
-                ]
-            )
-            lingerie_tokens = [
-                "lingerie",
-                "lenceria",
-                "lencer\u00eda",
-                "underwear",
-                "bra",
-                "panties",
-                "ropa interior",
-                "sujetador",
-                "bragas",
-            ]
-            if any(tok in blob_for_lingerie for tok in lingerie_tokens):
-                continue
+        if exclude_lingerie and "lingerie" in entry.intents:
+            continue
 
         # Text relevance
         relevance_score = 1.0
         if q_lower:
-            title = (product.title or "").lower()
-            description = (product.description or "").lower()
-            product_type = (product.product_type or "").lower()
-            blob = " ".join([title, description, product_type]).strip()
-            blob_compact = re.sub(r"[^a-z0-9]+", "", blob)
-            q_compact = re.sub(r"[^a-z0-9]+", "", q_lower)
-
-            tee_intent = bool(
-                q_compact == "tee"
-                or "tshirt" in q_compact
-                or re.search(r"\btees?\b", q_lower)
-                or re.search(r"\bt\s*-?\s*shirts?\b", q_lower)
-                or "t恤" in q_lower
-                or "t 恤" in q_lower
-            )
+            title = entry.title
+            blob = entry.blob
+            blob_compact = entry.blob_compact
 
-            if tee_intent:
-                has_tee_marker = bool(
-                    "tshirt" in blob_compact
-                    or re.search(r"\btees?\b", blob)
-                    or re.search(r"\bt\s*-?\s*shirts?\b", blob)
-                    or "t恤" in blob
-                    or "t 恤" in blob
-                )
-                if not has_tee_marker:
-                    continue
+            if tee_intent and "tee" not in entry.intents:
+                continue
 
             if q_lower in title:
                 relevance_score = 1.0 if q_lower == title else 0.9
-            elif q_lower in description:
+            elif q_lower in entry.description:
                 relevance_score = 0.7
             elif q_compact and len(q_compact) >= 4 and q_compact in blob_compact:
                 # Handle queries like "t-shirt" vs "tshirt" or "te e" vs "tee"
                 relevance_score = 0.8
             else:
-                # Token-based matching with short-token guard (prevents "te e" -> ["te","e"] over-matching).
-                query_terms = _tokenize(q_ascii)
-
-                if not query_terms and q_compact and len(q_compact) > 2:
-                    query_terms = [q_compact]
-
-                if tee_intent:
-                    for t in ("tee", "tshirt", "t-shirt"):
-                        if t not in query_terms:
-                            query_terms.append(t)
-
-                if toys_intent_query:
-                    for t in (
-                        "toy",
-                        "toys",
-                        "juguete",
-                        "juguetes",
-                        "doll",
-                        "dolls",
-                        "plush",
-                        "plushie",
-                        "peluche",
-                        "figure",
-                        "figures",
-                        "vinyl",
-                        "blind",
-                        "box",
-                        "collectible",
-                        "collector",
-                        "art",
-                        "designer",
-                        "labubu",
-                    ):
-                        if t not in query_terms:
-                            query_terms.append(t)
-
                 if not query_terms:
                     continue
 
                 matches = sum(
                     1
                     for term in query_terms
-                    if term and (term in blob or term in blob_compact)
+                    if term
+                    and any(
+                        alt in blob or alt in blob_compact
+                        for alt in term_alternatives.get(term, (term,))
+                    )
                 )
                 if matches == 0:
                     continue
                 relevance_score = 0.5 + (matches / len(query_terms)) * 0.3
 
-        # Detect toy-like products for intent filtering/boosting.
-        blob_for_filters = " ".join(
-            [
-                (product.title or "").lower(),
-                (product.description or "").lower(),
-                (product.product_type or "").lower(),
-                " ".join(getattr(product, "tags", None) or []),
-            ]
-        )
-        blob_for_filters_ascii = _strip_accents(blob_for_filters)
-        toy_like_tokens = [
-            "toy",
-            "toys",
-            "juguete",
-            "juguetes",
-            "doll",
-            "dolls",
-            "plush",
-            "plushie",
-            "peluche",
-            "figure",
-            "figures",
-            "vinyl",
-            "blind box",
-            "collectible",
-            "designer toy",
-            "art toy",
-            "labubu",
-        ]
-        is_toy_like = any(tok in blob_for_filters_ascii for tok in toy_like_tokens)
+        # Toy intent keeps only toy-like products (tagged once per catalog entry).
+        if toys_intent_query and "toy_like" not in entry.intents:
+            continue
 
         # User intent boost based on history and recency
         pid = str(product.product_id or product.id or "")
@@ -1357,54 +1159,28 @@ async def _handle_find_products_multi(
         if pid and pid in history_product_ids:
             history_boost += 0.6
         if history_terms:
-            blob = " ".join(
-                [
-                    (product.title or "").lower(),
-                    (product.description or "").lower(),
-                    (product.product_type or "").lower(),
-                ]
-            )
-            matched_terms = sum(1 for term in history_terms if term and term in blob)
+            matched_terms = sum(1 for term in history_terms if term and term in entry.blob)
             if matched_terms:
                 history_boost += min(0.5, matched_terms * 0.1)
 
         relevance_score += history_boost
 
-        if toys_intent_query and is_toy_like:
+        if toys_intent_query:
             relevance_score += 0.45
 
-        filtered_products.append(
-            {
-                "product": product,
-                "merchant_name": merchant_name,
-                "relevance_score": relevance_score,
-                "is_toy_like": is_toy_like,
-            }
-        )
-
-    if toys_intent_query:
-        toy_candidates = [p for p in filtered_products if p.get("is_toy_like")]
-        filtered_products = toy_candidates if toy_candidates else []
-
-    # Sort by relevance
-    filtered_products.sort(
-        key=lambda p: p.get("relevance_score", 0), reverse=True
-    )
+        candidates.add(row, relevance_score)
 
-    total = len(filtered_products)
+    # Rank by relevance; only the pages up to the requested one are ordered.
+    total = len(candidates)
     start_idx = (page - 1) * limit
     end_idx = start_idx + limit
-    page_items = filtered_products[start_idx:end_idx]
 
     # Map to Shopping contract; inject merchant_id into result
     out_products = []
-    for item_wrapper in page_items:
-        sp: StandardProduct = item_wrapper["product"]
-        merchant_name = item_wrapper.get("merchant_name")
-
-        item = _standard_to_shop_product(sp)
+    for row in candidates.page(start_idx, end_idx):
+        item = _standard_to_shop_product(catalog_entries[row].product)
         # add merchant name if we have it
-        item["merchant_name"] = merchant_name
+        item["merchant_name"] = merchant_names[row]
         out_products.append(item)
 
     # Fallback: if primary query returned nothing, surface creator top-sellers instead
@@ -1438,6 +1214,7 @@ async def _handle_find_products_multi(
                 "merchants_searched": len(merchant_map),
                 "creator_id": creator_id,
                 "creator_name": creator_name,
+                "prefetch": prefetch_timings,
             },
         }
 
@@ -1459,11 +1236,19 @@ async def _handle_find_products_multi(
             "query_source": "cache_multi_intent",
             "fetched_at": datetime.utcnow().isoformat(),
             "merchants_searched": len(merchant_map),
+            "merchant_directory_age_s": merchant_directory.age_s(),
+            "merchant_directory_stale": merchant_directory.is_stale(),
             "creator_id": creator_id,
             "creator_name": creator_name,
             "history_boost_applied": history_used,
             "merchant_products_source": merchant_products_source,
-            "merchant_products_loaded": len(merchant_products),
+            "merchant_products_loaded": merchant_products_loaded,
+            "relevance_candidates": len(catalog_entries),
+            "typo_corrections": {t: list(alts[1:]) for t, alts in term_alternatives.items()} or None,
+            "catalog_snapshot_age_s": catalog_snapshot.stats()["age_s"]
+            if merchant_products_source == "catalog_snapshot"
+            else None,
+            "prefetch": prefetch_timings,
         },
     }
 
@@ -1526,6 +1311,12 @@ async def _handle_find_similar_products(
         except Exception:
             has_coview = False
         strategy_used = "co_view" if has_coview else "content_embedding"
+        if not has_coview:
+            try:
+                if await similarity_service.hasNeighborData(payload.product_id):
+                    strategy_used = "neighbors"
+            except Exception:
+                pass
 
     overfetch = min(limit * 3, 90)
     try:
@@ -1541,28 +1332,13 @@ async def _handle_find_similar_products(
         logger.error(f"[similar] similarity_service failed: {e}")
         candidates = []
 
-    def _personalization_score(prod: StandardProduct) -> float:
-        """Lightweight personalization using recent query tokens."""
-        if not payload.user or not payload.user.recent_queries:
-            return 0.0
-        title_tokens = set(re.split(r"[^a-z0-9]+", (prod.title or "").lower()))
-        q_tokens: set[str] = set()
-        for q in payload.user.recent_queries:
-            q_tokens |= set(re.split(r"[^a-z0-9]+", (q or "").lower()))
-        q_tokens = {t for t in q_tokens if len(t) > 2}
-        if not q_tokens:
-            return 0.0
-        overlap = len(title_tokens & q_tokens)
-        return min(1.0, overlap / max(len(q_tokens), 1))
-
     raw_products = []
-    seen_ids: set[str] = set()
     candidate_ids = [c.productId for c in candidates if c.productId]
     product_map = await _load_products_by_ids(candidate_ids)
 
     for cand in candidates:
         pid = cand.productId
-        if not pid or pid in seen_ids:
+        if not pid:
             continue
 
         sp = product_map.get(pid)
@@ -1573,87 +1349,66 @@ async def _handle_find_similar_products(
             continue
         raw_products.append((pid, sp, cand))
 
-    strict_candidates: List[Dict[str, Any]] = []
-    relaxed_candidates: List[Dict[str, Any]] = []
-
-    def _score(sp: StandardProduct, cand_obj):
-        similarity_score = max(0.0, float(getattr(cand_obj, "score", 0.0) or 0.0))
-        price_score = 0.0
-        base_price = base_product.price or 0.0
-        if base_price > 0:
-            price_score = max(0.0, 1.0 - abs(sp.price - base_price) / base_price)
-        merchant_score = 1.0 if strategy_used == "same_merchant_first" and sp.merchant_id == base_product.merchant_id else 0.0
-        personalization_score = _personalization_score(sp)
-        weights = get_similarity_scoring_weights()
-        final_score = (
-            weights["similarity"] * similarity_score
-            + weights["price"] * price_score
-            + weights["merchant"] * merchant_score
-            + weights["personalization"] * personalization_score
-        )
-        return similarity_score, personalization_score, final_score
+    # Score every candidate in one batch (services/similarity_scoring.py).
+    recent_queries = payload.user.recent_queries if payload.user and payload.user.recent_queries else []
+    scores = rank_scores(
+        similarity=[getattr(cand_obj, "score", 0.0) for _, _, cand_obj in raw_products],
+        prices=[sp.price for _, sp, _ in raw_products],
+        merchant_match=[
+            strategy_used == "same_merchant_first" and sp.merchant_id == base_product.merchant_id
+            for _, sp, _ in raw_products
+        ],
+        personalization=personalization_scores([sp.title for _, sp, _ in raw_products], recent_queries),
+        base_price=base_product.price or 0.0,
+        weights=get_similarity_scoring_weights(),
+    )
+
+    def _entry(i: int) -> Dict[str, Any]:
+        personalization_score = scores["personalization"][i]
+        return {
+            "product": raw_products[i][1],
+            "scores": {
+                "similarity": round(scores["similarity"][i], 3),
+                "personalization": round(personalization_score, 3) if personalization_score else None,
+            },
+            "debug_scores": {
+                "price": round(scores["price"][i], 3),
+                "merchant": round(scores["merchant"][i], 3),
+                "personalization": round(personalization_score, 3),
+            },
+            "final_score": scores["final"][i],
+        }
+
+    def _first_per_product(indices) -> List[int]:
+        kept: List[int] = []
+        seen_ids: set[str] = set()
+        for i in indices:
+            pid = raw_products[i][0]
+            if pid not in seen_ids:
+                seen_ids.add(pid)
+                kept.append(i)
+        return kept
 
     # First pass: strict
-    for pid, sp, cand_obj in raw_products:
-        if pid in seen_ids:
-            continue
+    def _passes_strict(sp: StandardProduct) -> bool:
         if sp.in_stock is False or (sp.inventory_quantity is not None and sp.inventory_quantity <= 0):
-            continue
+            return False
         if creator_id:
             cand_creator = None
             if sp.platform_metadata:
                 cand_creator = sp.platform_metadata.get("creator_id") or sp.platform_metadata.get("creatorId")
             if cand_creator and cand_creator != creator_id:
-                continue
-        similarity_score, personalization_score, final_score = _score(sp, cand_obj)
-        seen_ids.add(pid)
-        strict_candidates.append(
-            {
-                "product": sp,
-                "scores": {
-                    "similarity": round(similarity_score, 3),
-                    "personalization": round(personalization_score, 3) if personalization_score else None,
-                },
-                "debug_scores": {
-                    "price": round(price_score, 3),
-                    "merchant": round(merchant_score, 3),
-                    "personalization": round(personalization_score, 3),
-                },
-                "final_score": final_score,
-            }
-        )
+                return False
+        return True
 
-    chosen_candidates = strict_candidates
+    strict_idx = _first_per_product(i for i, (_, sp, _) in enumerate(raw_products) if _passes_strict(sp))
+    relaxed_idx: List[int] = []
+    chosen_idx = strict_idx
 
     # Relaxed pass if needed
-    if not strict_candidates:
-        seen_ids.clear()
-        for pid, sp, cand_obj in raw_products:
-            if pid in seen_ids:
-                continue
-            similarity_score, personalization_score, final_score = _score(sp, cand_obj)
-            price_score = 0.0
-            base_price = base_product.price or 0.0
-            if base_price > 0:
-                price_score = max(0.0, 1.0 - abs(sp.price - base_price) / base_price)
-            merchant_score = 1.0 if strategy_used == "same_merchant_first" and sp.merchant_id == base_product.merchant_id else 0.0
-            seen_ids.add(pid)
-            relaxed_candidates.append(
-                {
-                    "product": sp,
-                    "scores": {
-                        "similarity": round(similarity_score, 3),
-                        "personalization": round(personalization_score, 3) if personalization_score else None,
-                    },
-                    "debug_scores": {
-                        "price": round(price_score, 3),
-                        "merchant": round(merchant_score, 3),
-                        "personalization": round(personalization_score, 3),
-                    },
-                    "final_score": final_score,
-                }
-            )
-        if relaxed_candidates:
+    if not strict_idx:
+        relaxed_idx = _first_per_product(range(len(raw_products)))
+        if relaxed_idx:
             logger.info(
                 "similar.filter.relax",
                 extra={
@@ -1661,25 +1416,17 @@ async def _handle_find_similar_products(
                     "raw_count": len(raw_products),
                 },
             )
-            chosen_candidates = relaxed_candidates
-
-    # Rank and trim
-    chosen_candidates.sort(key=lambda x: x["final_score"], reverse=True)
+            chosen_idx = relaxed_idx
 
-    # Prefer same product_type as the base product where possible.
+    # Rank and trim: best final score first (ties keep candidate order),
+    # preferring the base product's product_type where possible.
     base_type = (base_product.product_type or "").lower()
-    same_type_bucket: List[Dict[str, Any]] = []
-    other_type_bucket: List[Dict[str, Any]] = []
-    for entry in chosen_candidates:
-        sp: StandardProduct = entry["product"]
-        cand_type = (sp.product_type or "").lower() if getattr(sp, "product_type", None) else ""
-        if base_type and cand_type == base_type:
-            same_type_bucket.append(entry)
-        else:
-            other_type_bucket.append(entry)
-
-    ordered_candidates = same_type_bucket + other_type_bucket
-    top = ordered_candidates[:limit]
+    chosen_scores = [scores["final"][i] for i in chosen_idx]
+    same_type = [
+        bool(base_type) and (raw_products[i][1].product_type or "").lower() == base_type for i in chosen_idx
+    ]
+    top_idx = [chosen_idx[j] for j in top_k_indices(chosen_scores, limit, preferred=same_type)]
+    top = [_entry(i) for i in top_idx]
 
     items = []
     include_debug_scores = DEV_MODE and bool(payload.debug)
@@ -1711,8 +1458,8 @@ async def _handle_find_similar_products(
             "base_product_id": payload.product_id,
             "strategy_used": strategy_used,
             "raw_count": len(raw_products),
-            "strict_count": len(strict_candidates),
-            "relaxed_count": len(relaxed_candidates),
+            "strict_count": len(strict_idx),
+            "relaxed_count": len(relaxed_idx),
             "final_count": len(items),
             "creator_id": creator_id,
             "trace_id": trace_id,
@@ -1721,7 +1468,7 @@ async def _handle_find_similar_products(
 
     # Top candidates log (up to 5)
     debug_top = []
-    for entry in chosen_candidates[:5]:
+    for entry in (_entry(chosen_idx[j]) for j in top_k_indices(chosen_scores, 5)):
         pid = entry.get("product").product_id or entry.get("product").id
         debug_top.append(
             {
@@ -1770,6 +1517,62 @@ if DEV_MODE:
         result = await _handle_find_similar_products(payload, request_metadata={})
         return result
 
+    @router.get("/dev/upstreams")
+    async def debug_upstream_pools():
+        """
+        Dev-only endpoint exposing upstream connection-pool utilization.
+        """
+        return upstream_stats()
+
+    @router.get("/dev/single_flight")
+    async def debug_single_flight():
+        """
+        Dev-only endpoint exposing invoke coalescing counters (hits/misses/coalesced).
+        """
+        return invoke_single_flight.stats()
+
+    @router.get("/dev/json_decode")
+    async def debug_json_decode():
+        """
+        Dev-only endpoint exposing JSON column decode time and backend.
+        """
+        return decode_stats()
+
+    @router.get("/dev/co_purchase")
+    async def debug_co_purchase():
+        """
+        Dev-only endpoint exposing co-purchase graph size and pruning counters.
+        """
+        return co_purchase_index.stats()
+
+    @router.get("/dev/merchant_directory")
+    async def debug_merchant_directory():
+        """
+        Dev-only endpoint exposing merchant directory size and staleness.
+        """
+        return merchant_directory.stats()
+
+    @router.get("/dev/user_signal_cache")
+    async def debug_user_signal_cache():
+        """
+        Dev-only endpoint exposing per-user history signal cache counters.
+        """
+        return user_signal_cache.stats()
+
+    @router.get("/dev/merchant_products")
+    async def debug_merchant_products():
+        """
+        Dev-only endpoint exposing get_products_hybrid cache size and hit/revalidation counters.
+        """
+        return merchant_product_cache.stats()
+
+    @router.get("/dev/similar_recall")
+    async def debug_similar_recall():
+        """
+        Dev-only endpoint exposing content-recall latency (p50/p95) per level and mode.
+        """
+        return {"mode": similarity_service.recall_mode, **similarity_service.recall_stats.snapshot()}
+
 
 async def _handle_get_product_detail(
     ref: ProductRef,
@@ -1785,28 +1588,16 @@ async def _handle_get_product_detail(
     merchant_id = ref.merchant_id
     product_id = ref.product_id
 
-    # Fetch a reasonably large slice of the catalog to locate the product.
-    # For typical merchants this is sufficient and keeps latency low.
-    agent_id = "shopping_ai_frontend"
-    products, query_source, error = await get_products_hybrid(
-        merchant_id=merchant_id,
-        limit=500,
-        agent_id=agent_id,
-        background_tasks=background_tasks,
-    )
-
-    if error and not products:
+    # Indexed single-row lookup (plus an in-process LRU), independent of catalog size.
+    query_source = "cache"
+    try:
+        match, detail_cache_outcome = await product_detail_cache.get(merchant_id, product_id)
+    except Exception as exc:
         raise HTTPException(
             status_code=502,
-            detail=f"Failed to fetch products for merchant {merchant_id}: {error}",
+            detail=f"Failed to fetch products for merchant {merchant_id}: DB unavailable: {exc.__class__.__name__}",
         )
 
-    match: Optional[StandardProduct] = None
-    for p in products:
-        if p.product_id == product_id or p.id == product_id:
-            match = p
-            break
-
     if not match:
         # Strong contract: this should not happen if product comes from find_products,
         # so treat it as PRODUCT_NOT_FOUND.
@@ -1823,17 +1614,22 @@ async def _handle_get_product_detail(
         attributes.update(match.platform_metadata)
 
     # Include variants summary if available
-    if match.variants:
+    # `variants` is an extra field (raw dicts from product_data), so it may be absent.
+    variants = getattr(match, "variants", None)
+    if variants:
+        def _variant_field(v: Any, name: str) -> Any:
+            return v.get(name) if isinstance(v, dict) else getattr(v, name, None)
+
         attributes["variants"] = [
             {
-                "variant_id": v.variant_id or v.id,
-                "title": v.title,
-                "price": v.price,
-                "sku": v.sku,
-                "inventory_quantity": v.inventory_quantity,
-                "options": v.options or {},
+                "variant_id": _variant_field(v, "variant_id") or _variant_field(v, "id"),
+                "title": _variant_field(v, "title"),
+                "price": _variant_field(v, "price"),
+                "sku": _variant_field(v, "sku"),
+                "inventory_quantity": _variant_field(v, "inventory_quantity"),
+                "options": _variant_field(v, "options") or {},
             }
-            for v in match.variants
+            for v in variants
         ]
 
     return {
@@ -1843,12 +1639,18 @@ async def _handle_get_product_detail(
         },
         "metadata": {
             "query_source": query_source,
+            "detail_cache": detail_cache_outcome,
             "fetched_at": datetime.utcnow().isoformat(),
         },
     }
 
 
-async def _proxy_agent_api(method: str, path: str, json_body: Dict[str, Any]) -> Dict[str, Any]:
+async def _proxy_agent_api(
+    method: str,
+    path: str,
+    json_body: Dict[str, Any],
+    operation: Optional[str] = None,
+) -> Dict[str, Any]:
     """Forward a request to the Agent API using a server-side API key."""
     if not AGENT_API_KEY:
         raise HTTPException(
@@ -1856,15 +1658,15 @@ async def _proxy_agent_api(method: str, path: str, json_body: Dict[str, Any]) ->
             detail="SHOP_GATEWAY_AGENT_API_KEY / PIVOTA_API_KEY is not configured for agent payments",
         )
 
-    url = f"{AGENT_API_BASE}{path}"
     headers = {
         "Content-Type": "application/json",
         "X-API-Key": AGENT_API_KEY,
     }
 
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            resp = await client.request(method, url, json=json_body, headers=headers)
+        resp = await agent_api_upstream.request(
+            method, path, operation=operation, json=json_body, headers=headers
+        )
     except httpx.HTTPError as exc:
         raise HTTPException(status_code=502, detail=f"Upstream agent API error: {exc}") from exc
 
@@ -1912,7 +1714,11 @@ async def _handle_create_order(order: OrderPayloadBody) -> Dict[str, Any]:
         "customer_notes": order.customer_notes or "",
     }
 
-    return await _proxy_agent_api("POST", "/agent/v1/orders/create", body)
+    try:
+        return await _proxy_agent_api("POST", "/agent/v1/orders/create", body, operation="create_order")
+    finally:
+        # Even a failed call may have created the order; re-reading history is cheap.
+        user_signal_cache.invalidate(order.customer_email)
 
 
 async def _handle_preview_quote(quote: QuotePayloadBody) -> Dict[str, Any]:
@@ -1940,7 +1746,7 @@ async def _handle_preview_quote(quote: QuotePayloadBody) -> Dict[str, Any]:
             **({"state": quote.shipping_address.state} if quote.shipping_address.state else {}),
         }
 
-    return await _proxy_agent_api("POST", "/agent/v1/quotes/preview", body)
+    return await _proxy_agent_api("POST", "/agent/v1/quotes/preview", body, operation="preview_quote")
 
 
 async def _handle_submit_payment(payment: PaymentPayloadBody) -> Dict[str, Any]:
@@ -1959,7 +1765,7 @@ async def _handle_submit_payment(payment: PaymentPayloadBody) -> Dict[str, Any]:
         "currency": payment.currency,
     }
 
-    return await _proxy_agent_api("POST", "/agent/v1/payments", body)
+    return await _proxy_agent_api("POST", "/agent/v1/payments", body, operation="submit_payment")
 
 
 @router.post("/invoke")
@@ -1978,6 +1784,41 @@ async def invoke_shop_operation(
     """
     operation = (request.operation or "").strip()
 
+    if operation in COALESCED_OPERATIONS:
+        key = canonical_request_key(operation, request.payload, request.metadata)
+        shared = await invoke_single_flight.run(key, lambda: _dispatch_coalesced(operation, request))
+        # Every caller schedules the background work, as it would have uncoalesced.
+        for task in shared.tasks:
+            background_tasks.add_task(task.func, *task.args, **task.kwargs)
+        return shared.response
+    return await _dispatch_shop_operation(operation, request, background_tasks)
+
+
+class _CoalescedResult:
+    """A shared response plus the background tasks its computation scheduled."""
+
+    __slots__ = ("response", "tasks")
+
+    def __init__(self, response: Dict[str, Any], tasks: List[Any]):
+        self.response = response
+        self.tasks = tasks
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "_CoalescedResult":
+        # Tasks hold callables and their arguments (db handles, ...); share them.
+        return _CoalescedResult(copy.deepcopy(self.response, memo), self.tasks)
+
+
+async def _dispatch_coalesced(operation: str, request: ShopGatewayRequest) -> _CoalescedResult:
+    deferred = BackgroundTasks()
+    response = await _dispatch_shop_operation(operation, request, deferred)
+    return _CoalescedResult(response, list(deferred.tasks))
+
+
+async def _dispatch_shop_operation(
+    operation: str,
+    request: ShopGatewayRequest,
+    background_tasks: BackgroundTasks,
+) -> Dict[str, Any]:
     if operation == "find_products":
         payload = FindProductsPayload(**request.payload)
         return await _handle_find_products(payload.search, background_tasks)
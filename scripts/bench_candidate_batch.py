@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Measure per-request allocations of find_products_multi's candidate pipeline.
+
+Part 1 compares the scoring -> rank -> page stage in isolation: one dict per
+candidate (the previous code) against `CandidateBatch` columns. Part 2 runs
+the real handler against an in-memory catalog snapshot and reports
+tracemalloc peak and net allocations per request.
+
+Usage:
+  python scripts/bench_candidate_batch.py --candidates 1000 5000 20000 --limit 20
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fastapi import BackgroundTasks  # noqa: E402
+
+import db.database  # noqa: E402
+from models.standard_product import StandardProduct  # noqa: E402
+from routes import agent_shop_gateway  # noqa: E402
+from services import catalog_snapshot as catalog_snapshot_module  # noqa: E402
+from services.candidate_batch import CandidateBatch  # noqa: E402
+from services.catalog_snapshot import CatalogEntry, CatalogSnapshot  # noqa: E402
+from services.merchant_directory import MerchantDirectory  # noqa: E402
+from services.user_signal_cache import UserSignalCache  # noqa: E402
+
+WORDS = ["red", "blue", "cotton", "tee", "dress", "linen", "shirt", "wool", "denim", "jacket", "soft", "classic"]
+
+
+def _entries(n: int, merchants: int, seed: int) -> list:
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        title = " ".join(rng.choice(WORDS) for _ in range(3))
+        product = StandardProduct(
+            id=f"p{i}",
+            merchant_id=f"m{i % merchants}",
+            title=title,
+            description=f"{title} {' '.join(rng.choice(WORDS) for _ in range(8))}",
+            price=round(rng.uniform(5, 200), 2),
+            currency="USD",
+        )
+        out.append(CatalogEntry.from_product(product, product.merchant_id))
+    return out
+
+
+def _measure(fn, repeat: int):
+    """(best ms, tracemalloc peak bytes) of `fn`."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1000.0, peak
+
+
+def _pipeline(entries: list, names: list, limit: int, repeat: int) -> None:
+    rng = random.Random(1)
+    scores = [rng.choice([0.5, 0.66, 0.8, 0.9, 1.0]) for _ in entries]
+
+    def with_dicts():
+        filtered = []
+        for entry, name, score in zip(entries, names, scores):
+            filtered.append(
+                {"product": entry.product, "merchant_name": name, "relevance_score": score, "is_toy_like": False}
+            )
+        ranked = sorted(filtered, key=lambda p: p.get("relevance_score", 0), reverse=True)[:limit]
+        return [(p["product"].id, p["merchant_name"]) for p in ranked]
+
+    def with_batch():
+        batch = CandidateBatch()
+        for row, score in enumerate(scores):
+            batch.add(row, score)
+        return [(entries[row].product.id, names[row]) for row in batch.page(0, limit)]
+
+    assert with_dicts() == with_batch()
+    dict_ms, dict_peak = _measure(with_dicts, repeat)
+    batch_ms, batch_peak = _measure(with_batch, repeat)
+    print(
+        f"{len(entries):>8} {'pipeline':<9} dicts {dict_ms:7.2f} ms {dict_peak / 1024:9.1f} KiB"
+        f" | batch {batch_ms:7.2f} ms {batch_peak / 1024:9.1f} KiB"
+        f" | peak -{100.0 * (1 - batch_peak / dict_peak):.0f}%"
+    )
+
+
+class _FakeDB:
+    """merchant_onboarding and products_cache keyset pages, from memory."""
+
+    def __init__(self, entries: list):
+        self.merchants = sorted({e.merchant_id for e in entries})
+        t0 = datetime(2025, 1, 1)
+        self.rows = [
+            {
+                "id": i,
+                "merchant_id": e.merchant_id,
+                "product_data": json.dumps(e.product.model_dump(mode="json")),
+                "cached_at": t0 + timedelta(seconds=i),
+            }
+            for i, e in enumerate(entries)
+        ]
+
+    async def fetch_all(self, query, values=None):
+        values = values or {}
+        if "merchant_onboarding" in query:
+            return [{"merchant_id": m, "business_name": f"Shop {m}"} for m in self.merchants]
+        rows = self.rows
+        if "after_cached_at" in values:
+            after = (values["after_cached_at"], values["after_id"])
+            rows = [r for r in rows if (r["cached_at"], r["id"]) > after]
+        return rows[: values.get("page_size", len(rows))]
+
+
+def _handler(entries: list, limit: int, repeat: int) -> None:
+    fake = _FakeDB(entries)
+    catalog_snapshot_module.database = fake
+    db.database.database = fake
+    snap = CatalogSnapshot(enabled=True, refresh_interval_s=3600)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(snap.refresh(full=True))
+    agent_shop_gateway.catalog_snapshot = snap
+    agent_shop_gateway.merchant_directory = MerchantDirectory(refresh_interval_s=3600)
+    agent_shop_gateway.user_signal_cache = UserSignalCache(max_users=0)
+    payload = agent_shop_gateway.FindProductsMultiPayload(search={"query": "cotton tee", "limit": limit})
+
+    def run():
+        return loop.run_until_complete(
+            agent_shop_gateway._handle_find_products_multi(payload, None, BackgroundTasks())
+        )
+
+    result = run()
+    best_ms, peak = _measure(run, repeat)
+    loop.close()
+    print(
+        f"{len(entries):>8} {'handler':<9} {best_ms:7.2f} ms, peak {peak / 1024:9.1f} KiB,"
+        f" candidates {result['metadata']['relevance_candidates']}, total {result['total']}"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--candidates", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--per-merchant", type=int, default=40, help="products per merchant")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--skip-handler", action="store_true")
+    args = parser.parse_args()
+
+    for n in args.candidates:
+        entries = _entries(n, max(1, n // args.per_merchant), args.seed)
+        names = [f"Shop {e.merchant_id}" for e in entries]
+        _pipeline(entries, names, args.limit, args.repeat)
+        if not args.skip_handler:
+            _handler(entries, args.limit, args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark the bounded co-purchase graph on synthetic Zipf-distributed orders.
+
+Reports ingest throughput, memory (tracemalloc), neighbor query latency and
+recall@k of the pruned graph against exact, unbounded pair counts.
+
+Usage:
+  python scripts/bench_co_purchase.py --orders 200000 --products 20000 --max-neighbors 50
+"""
+
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.co_purchase_service import CoPurchaseGraph  # noqa: E402
+
+
+def _orders(n: int, products: int, seed: int) -> list:
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(products)]
+    catalog = [f"p{i}" for i in range(products)]
+    out = []
+    for _ in range(n):
+        size = min(1 + int(rng.expovariate(0.6)), 12)
+        out.append(list(dict.fromkeys(rng.choices(catalog, weights=weights, k=size))))
+    return out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--orders", type=int, default=200000)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--max-neighbors", type=int, default=50)
+    parser.add_argument("--max-products", type=int, default=200000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    orders = _orders(args.orders, args.products, args.seed)
+
+    tracemalloc.start()
+    graph = CoPurchaseGraph(max_neighbors=args.max_neighbors, max_products=args.max_products)
+    started = time.perf_counter()
+    for order in orders:
+        graph.add(order)
+    ingest_s = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    exact = defaultdict(Counter)
+    for order in orders:
+        for a in order:
+            for b in order:
+                if a != b:
+                    exact[a][b] += 1
+
+    rng = random.Random(args.seed)
+    queried = rng.sample(sorted(exact), min(args.queries, len(exact)))
+    hits = total = 0
+    started = time.perf_counter()
+    for pid in queried:
+        got = {other for other, _ in graph.neighbors(pid, args.k)}
+        want = {other for other, _ in sorted(exact[pid].items(), key=lambda kv: (-kv[1], kv[0]))[: args.k]}
+        hits += len(got & want)
+        total += len(want)
+    query_us = (time.perf_counter() - started) / max(len(queried), 1) * 1e6
+
+    print(f"orders={len(orders)} products={len(graph)} pair_entries={graph.entries()}")
+    print(f"ingest:      {len(orders) / ingest_s:10.0f} orders/s")
+    print(f"peak memory: {peak / 1e6:10.1f} MB (tracemalloc)")
+    print(f"query:       {query_us:10.1f} us/neighbors() incl. exact ranking")
+    print(f"recall@{args.k}:   {hits / max(total, 1):10.3f}  pruned_pairs={graph.pruned_pairs} evicted={graph.evicted_products}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
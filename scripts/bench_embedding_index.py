@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark the content_embedding ANN index: recall@k and latency against brute force.
+
+Usage:
+  python scripts/bench_embedding_index.py --products 100000 --dim 256 --nprobe 4 8 16
+  python scripts/bench_embedding_index.py --index /data/embeddings   # an index built by build_embedding_index.py
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np  # noqa: E402
+
+from services.embedding_index import EmbeddingIndex, HashedTfidfFeaturizer, write_index  # noqa: E402
+
+_WORDS = [f"w{i}" for i in range(5000)]
+_TYPES = [f"type{i}" for i in range(200)]
+
+
+def _corpus(n: int, seed: int) -> tuple:
+    rng = random.Random(seed)
+    # Each product type draws most of its words from its own slice of the vocabulary.
+    ids, texts = [], []
+    for i in range(n):
+        t = rng.randrange(len(_TYPES))
+        own = _WORDS[t * 25 : t * 25 + 25]
+        words = rng.sample(own, 3) + [rng.choice(_WORDS) for _ in range(2)]
+        ids.append(f"p{i}")
+        texts.append(f"{' '.join(words)} {_TYPES[t]}")
+    return ids, texts
+
+
+def _measure(index: EmbeddingIndex, queries: list, k: int, exact: bool) -> tuple:
+    results, started = [], time.perf_counter()
+    for pid in queries:
+        vector = np.asarray(index.vectors[index.rows[pid]])
+        results.append(index.search(vector, k, exclude={pid}, exact=exact))
+    return results, (time.perf_counter() - started) / len(queries) * 1e3
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--index", default=None, help="existing index directory (default: build a synthetic one)")
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    root = args.index
+    if root is None:
+        root = tempfile.mkdtemp(prefix="embedding_index_")
+        ids, texts = _corpus(args.products, args.seed)
+        started = time.perf_counter()
+        write_index(root, ids, texts, HashedTfidfFeaturizer(dim=args.dim), nlist=args.nlist)
+        print(f"built {len(ids)} products in {time.perf_counter() - started:.1f}s -> {root}")
+
+    index = EmbeddingIndex.open(root, backend="numpy")
+    queries = random.Random(args.seed).sample(index.ids, min(args.queries, len(index.ids)))
+    exact, exact_ms = _measure(index, queries, args.k, exact=True)
+    print(f"products={len(index)} dim={index.meta['dim']} nlist={index.meta['nlist']} k={args.k}")
+    print(f"brute force:      {exact_ms:8.2f} ms/query")
+    for nprobe in args.nprobe:
+        index.nprobe = nprobe
+        approx, ms = _measure(index, queries, args.k, exact=False)
+        hits = total = 0
+        for want, got in zip(exact, approx):
+            if not want:
+                continue
+            # Ties at the k-th score are interchangeable, so recall is score-based.
+            kth = want[-1][1]
+            hits += sum(1 for _, score in got if score >= kth)
+            total += len(want)
+        print(f"ivf nprobe={nprobe:<4d}  {ms:8.2f} ms/query  recall@{args.k}={hits / max(total, 1):.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
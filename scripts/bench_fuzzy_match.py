@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark fuzzy vocabulary lookups: deletion index vs. the pure-Python DP scan.
+
+Usage:
+  python scripts/bench_fuzzy_match.py --vocab 20000 --queries 500
+"""
+
+import argparse
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.fuzzy_index import DeletionIndex, edit_distance_leq  # noqa: E402
+
+
+def _vocab(n: int, seed: int) -> list:
+    rng = random.Random(seed)
+    out = set()
+    while len(out) < n:
+        out.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))))
+    return sorted(out)
+
+
+def _queries(vocab: list, n: int, seed: int) -> list:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        word = rng.choice(vocab)
+        pos = rng.randrange(len(word))
+        out.append(word[:pos] + rng.choice(string.ascii_lowercase) + word[pos + 1 :])
+    return out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--vocab", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--max-dist", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    vocab = _vocab(args.vocab, args.seed)
+    queries = _queries(vocab, args.queries, args.seed + 1)
+
+    started = time.perf_counter()
+    index = DeletionIndex(vocab, max_distance=args.max_dist)
+    build_ms = (time.perf_counter() - started) * 1000.0
+
+    started = time.perf_counter()
+    indexed = [set(index.lookup(q, args.max_dist)) for q in queries]
+    index_ms = (time.perf_counter() - started) * 1000.0
+
+    started = time.perf_counter()
+    scanned = [{t for t in vocab if edit_distance_leq(q, t, args.max_dist)} for q in queries]
+    scan_ms = (time.perf_counter() - started) * 1000.0
+
+    mismatches = sum(1 for a, b in zip(indexed, scanned) if a != b)
+    print(f"vocab={len(vocab)} queries={len(queries)} max_dist={args.max_dist}")
+    print(f"deletion index build: {build_ms:8.1f} ms")
+    print(f"deletion index:       {index_ms / len(queries):8.3f} ms/query")
+    print(f"dp scan:              {scan_ms / len(queries):8.3f} ms/query")
+    print(f"speedup:              {scan_ms / max(index_ms, 1e-9):8.1f}x  mismatches={mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
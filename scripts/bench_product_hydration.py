@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark StandardProduct hydration from cache rows: full pydantic validation vs. hydrate_product.
+
+Usage:
+  python scripts/bench_product_hydration.py --rows 20000 --repeat 3
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from models.standard_product import StandardProduct, hydrate_product  # noqa: E402
+
+
+def _rows(n: int, seed: int) -> list:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        rows.append(
+            {
+                "id": f"pp{i}",
+                "product_id": f"p{i}",
+                "merchant_id": f"m{i % 50}",
+                "platform": "shopify",
+                "title": f"Product {i}",
+                "description": "Soft cotton tee " * rng.randint(1, 8),
+                "product_type": rng.choice(["T-Shirts", "Hoodies", "Toys", "Serums"]),
+                "price": round(rng.uniform(5, 200), 2),
+                "currency": "USD",
+                "status": "active",
+                "inventory_quantity": rng.randint(0, 100),
+                "image_url": f"https://cdn.example.com/{i}.jpg",
+                "images": [f"https://cdn.example.com/{i}-{k}.jpg" for k in range(rng.randint(1, 4))],
+                "platform_metadata": {"creator_id": f"c{i % 7}"},
+                "vendor": "Acme",
+                "tags": ["summer", "cotton"],
+            }
+        )
+    return rows
+
+
+def _per_row_us(build, rows: list, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for row in rows:
+            build(row)
+        best = min(best, time.perf_counter() - started)
+    return best / len(rows) * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rows = _rows(args.rows, args.seed)
+    mismatches = sum(1 for row in rows if hydrate_product(row).model_dump() != StandardProduct(**row).model_dump())
+
+    validated_us = _per_row_us(lambda row: StandardProduct(**row), rows, args.repeat)
+    fast_us = _per_row_us(hydrate_product, rows, args.repeat)
+    print(f"rows={len(rows)} repeat={args.repeat}")
+    print(f"StandardProduct(**row): {validated_us:8.2f} us/row")
+    print(f"hydrate_product(row):   {fast_us:8.2f} us/row")
+    print(f"speedup:                {validated_us / max(fast_us, 1e-9):8.1f}x  mismatches={mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
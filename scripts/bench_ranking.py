@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark page ranking: `top_k_indices` against sorting every candidate.
+
+Mirrors the gateway handlers: find_products_multi ranks candidate scores by
+relevance and returns one page; find_similar_products ranks indices by final
+score with the base product's type first. Checks that both approaches return
+the same order.
+
+Usage:
+  python scripts/bench_ranking.py --candidates 1000 10000 100000 --limit 20 --page 1
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.similarity_scoring import top_k_indices  # noqa: E402
+
+
+def _best_ms(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000.0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--candidates", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--page", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    k = args.page * args.limit
+    print(f"k={k} (page {args.page} x limit {args.limit}), best of {args.repeat}")
+    print(f"{'n':>8} {'case':<14} {'sort ms':>9} {'top-k ms':>9} {'speedup':>8}")
+    for n in args.candidates:
+        # Relevance scores in the multi handler take few distinct values, so ties are common.
+        relevance = [rng.choice([0.5, 0.58, 0.66, 0.8, 0.9, 1.0]) + rng.choice([0, 0.6]) for _ in range(n)]
+        sort_items = lambda: sorted(range(n), key=relevance.__getitem__, reverse=True)[:k]  # noqa: E731
+        top_items = lambda: top_k_indices(relevance, k)  # noqa: E731
+        assert sort_items() == top_items()
+
+        scores = [rng.random() for _ in range(n)]
+        preferred = [rng.random() < 0.3 for _ in range(n)]
+
+        def sort_buckets():
+            same = [i for i in range(n) if preferred[i]]
+            other = [i for i in range(n) if not preferred[i]]
+            out = sorted(same, key=lambda i: scores[i], reverse=True)[:k]
+            return out + sorted(other, key=lambda i: scores[i], reverse=True)[: k - len(out)]
+
+        top_buckets = lambda: top_k_indices(scores, k, preferred=preferred)  # noqa: E731
+        assert sort_buckets() == top_buckets()
+
+        for case, slow, fast in (("multi", sort_items, top_items), ("similar", sort_buckets, top_buckets)):
+            sort_ms = _best_ms(slow, args.repeat)
+            top_ms = _best_ms(fast, args.repeat)
+            print(f"{n:>8} {case:<14} {sort_ms:>9.2f} {top_ms:>9.2f} {sort_ms / top_ms:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
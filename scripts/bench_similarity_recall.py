@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark content-recall modes (sequential / parallel / union) against a simulated-latency products_cache.
+
+Reports p50/p95 per recall level and per request for each mode, and checks
+that every mode returns the same candidates.
+
+Usage:
+  python scripts/bench_similarity_recall.py --requests 200 --rtt-ms 4 --jitter-ms 3
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from models.standard_product import StandardProduct  # noqa: E402
+from services import similarity_service as similarity_module  # noqa: E402
+from services.similarity_service import SimilarityService  # noqa: E402
+
+TYPES = ["shirts", "hoodies", "toys", "serums", "gadgets"]
+
+
+class SimulatedDB:
+    """Answers the recall queries from memory after one simulated round trip."""
+
+    def __init__(self, rows, rtt_s: float, jitter_s: float, seed: int):
+        self.rows = rows
+        self.rtt_s = rtt_s
+        self.jitter_s = jitter_s
+        self.rng = random.Random(seed)
+
+    def _select(self, ptype, band, limit):
+        out = [r for r in self.rows if (ptype is None or r["ptype"] == ptype) and (band is None or band[0] <= r["price"] <= band[1])]
+        return out[:limit]  # rows are kept newest first
+
+    async def fetch_all(self, query, values=None):
+        await asyncio.sleep(self.rtt_s + self.rng.random() * self.jitter_s)
+        limit, ptype = values["limit"], values.get("ptype")
+        band = (values["pmin"], values["pmax"]) if "pmin" in values else None
+        if "UNION ALL" in query:
+            levels = [self._select(ptype, band, limit), self._select(ptype, None, limit), self._select(None, None, limit)]
+            return [{"recall_level": i + 1, "product_data": r["data"]} for i, rows in enumerate(levels) for r in rows]
+        uses_type = "data_product_type_lower = :ptype" in query
+        return [{"product_data": r["data"]} for r in self._select(ptype if uses_type else None, band, limit)]
+
+
+def _catalog(n: int, seed: int) -> list:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        # "gadgets" is rare so some requests fall through to level 2 and 3.
+        ptype = rng.choices(TYPES, weights=[30, 30, 30, 30, 1])[0]
+        price = round(rng.uniform(5, 200), 2)
+        rows.append({"ptype": ptype, "price": price, "data": {"id": f"p{i}", "title": f"{ptype} item {i}", "product_type": ptype, "price": price}})
+    return rows
+
+
+async def _run(mode: str, bases: list, limit: int, db: SimulatedDB) -> tuple:
+    similarity_module.database = db
+    svc = SimilarityService(recall_mode=mode)
+    results = []
+    for base in bases:
+
+        async def load_base(pid, base=base):
+            return base
+
+        svc._load_base_product = load_base
+        found = await svc.findSimilar({"baseProductId": base.id, "limit": limit, "strategy": "content_embedding"})
+        results.append([(c.productId, c.score) for c in found])
+    return results, svc.recall_stats.snapshot()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--rtt-ms", type=float, default=4.0)
+    parser.add_argument("--jitter-ms", type=float, default=3.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rows = _catalog(args.products, args.seed)
+    rng = random.Random(args.seed + 1)
+    bases = []
+    for i in range(args.requests):
+        row = rng.choice(rows)
+        bases.append(StandardProduct(id=f"base{i}", title=row["data"]["title"], product_type=row["ptype"], price=row["price"]))
+
+    reference = None
+    mismatched = False
+    for mode in ("sequential", "parallel", "union"):
+        db = SimulatedDB(rows, args.rtt_ms / 1000.0, args.jitter_ms / 1000.0, args.seed)
+        results, stats = asyncio.run(_run(mode, bases, args.limit, db))
+        reference = reference if reference is not None else results
+        same = results == reference
+        mismatched = mismatched or not same
+        print(f"{mode:<10} identical={same} served={stats['served_by_level']}")
+        for name, lat in stats["latency"].items():
+            print(f"  {name:<7} n={lat['count']:<5d} p50={lat['p50_ms']:8.2f} ms  p95={lat['p95_ms']:8.2f} ms")
+    return 1 if mismatched else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Build the content_embedding ANN index over active products in products_cache.
+
+Usage:
+  DATABASE_URL=postgresql://... python scripts/build_embedding_index.py --out /data/embeddings
+  DATABASE_URL=postgresql://... python scripts/build_embedding_index.py --out /data/embeddings --backend hnswlib
+
+Serve it by pointing SIMILARITY_EMBEDDING_INDEX_PATH at the same directory.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from db.database import database, is_null_database  # noqa: E402
+from services.embedding_index import DEFAULT_DIM, FEATURIZERS, build_index  # noqa: E402
+
+
+async def _run(args: argparse.Namespace) -> dict:
+    await database.connect()
+    try:
+        return await build_index(args.out, dim=args.dim, nlist=args.nlist, backend=args.backend, featurizer=args.featurizer)
+    finally:
+        await database.disconnect()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--out", required=True, help="index directory (SIMILARITY_EMBEDDING_INDEX_PATH)")
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM, help=f"vector dimensions (default {DEFAULT_DIM})")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF cells (default sqrt(products))")
+    parser.add_argument("--backend", choices=["numpy", "faiss", "hnswlib"], default="numpy")
+    parser.add_argument("--featurizer", choices=sorted(FEATURIZERS), default="hashed_tfidf")
+    args = parser.parse_args()
+
+    if is_null_database(database):
+        print("DATABASE_URL is not set (or the databases package is missing)", file=sys.stderr)
+        return 2
+    print(json.dumps(asyncio.run(_run(args)), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Build or incrementally refresh the find_similar_products neighbor table.
+
+Usage:
+  DATABASE_URL=postgresql://... python scripts/build_neighbor_table.py --out /data/neighbors --k 100
+  DATABASE_URL=postgresql://... python scripts/build_neighbor_table.py --out /data/neighbors --incremental
+
+Serve it by pointing SIMILARITY_NEIGHBOR_TABLE_PATH at the same directory.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from db.database import database, is_null_database  # noqa: E402
+from services.neighbor_table import DEFAULT_K, build_table, refresh_table  # noqa: E402
+
+
+async def _run(args: argparse.Namespace) -> dict:
+    await database.connect()
+    try:
+        if args.incremental:
+            return await refresh_table(args.out, args.k)
+        return await build_table(args.out, args.k or DEFAULT_K)
+    finally:
+        await database.disconnect()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--out", required=True, help="table directory (SIMILARITY_NEIGHBOR_TABLE_PATH)")
+    parser.add_argument("--k", type=int, default=None, help=f"neighbors per product (default {DEFAULT_K})")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only re-read rows cached since the last build (full build if no table exists)",
+    )
+    args = parser.parse_args()
+
+    if is_null_database(database):
+        print("DATABASE_URL is not set (or the databases package is missing)", file=sys.stderr)
+        return 2
+    print(json.dumps(asyncio.run(_run(args)), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
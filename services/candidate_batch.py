@@ -0,0 +1,40 @@
+"""
+Candidate Batch
+
+Columnar store for the filter -> score -> rank -> page pipeline of
+find_products_multi. Each surviving candidate is one row index (into the
+caller's candidate list) and one float64 score in parallel `array`s instead
+of a per-candidate dict, so scoring thousands of products allocates two
+growing buffers rather than thousands of small objects. Response payloads
+are materialized by the caller for the returned page only.
+
+Scores are stored as C doubles, which hold Python floats exactly, so ranking
+is unchanged.
+"""
+from __future__ import annotations
+
+from array import array
+from typing import List
+
+from services.similarity_scoring import top_k_indices
+
+
+class CandidateBatch:
+    """Scored candidates as parallel arrays of row indices and scores."""
+
+    __slots__ = ("rows", "scores")
+
+    def __init__(self) -> None:
+        self.rows = array("q")
+        self.scores = array("d")
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def add(self, row: int, score: float) -> None:
+        self.rows.append(row)
+        self.scores.append(score)
+
+    def page(self, start: int, end: int) -> List[int]:
+        """Rows ranked [start, end): best score first, ties in insertion order."""
+        return [self.rows[i] for i in top_k_indices(self.scores, end)[start:]]
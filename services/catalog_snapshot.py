@@ -0,0 +1,525 @@
+"""
+Catalog Snapshot
+
+Process-local, read-mostly copy of `products_cache` used by cross-merchant
+search. The snapshot is loaded once, then refreshed incrementally using the
+`cached_at` watermark so `find_products_multi` can score against memory instead
+of re-reading (and re-parsing) up to 100 x 200 rows per request.
+
+Each entry carries pre-lowercased title/description/type fields; a
+`CatalogTextIndex` holds the compacted trigrams used for candidate recall.
+
+Parsing rows and building the indexes run in a worker thread. A full reload
+prepares the new entries, per-merchant lists, text index and vocabulary off
+to the side and swaps them in together, so readers never see entries from
+one load paired with an index from another.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import sys
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from db.database import database
+from models.standard_product import StandardProduct, hydrate_product
+from services.catalog_text_index import CatalogTextIndex
+from services.env import env_flag, env_int
+from services.fuzzy_index import DeletionIndex
+from services.intent_lexicon import tag_product
+from services.json_columns import decode_object
+
+logger = logging.getLogger(__name__)
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split lowercased text into alphanumeric tokens longer than two chars."""
+    if not text:
+        return []
+    return [t for t in _NON_ALNUM_RE.split(text.lower()) if len(t) > 2]
+
+
+def strip_accents(text: str) -> str:
+    if not text:
+        return ""
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def compact(text: str) -> str:
+    """Drop everything except [a-z0-9] (expects lowercased input)."""
+    return _NON_ALNUM_RE.sub("", text or "")
+
+
+@dataclass
+class CatalogEntry:
+    """A hydrated product plus the normalized text fields search needs."""
+
+    row_key: str
+    merchant_id: str
+    product: StandardProduct
+    cached_at: Any
+    title: str
+    description: str
+    product_type: str
+    blob: str
+    blob_compact: str
+    tokens: FrozenSet[str]
+    # Product-side intent tags from the intent lexicon ("tee", "toy_like", ...).
+    intents: FrozenSet[str] = frozenset()
+    # Position within the merchant's products ordered by cached_at DESC.
+    merchant_rank: int = 0
+    size_bytes: int = 0
+
+    @classmethod
+    def from_product(
+        cls,
+        product: StandardProduct,
+        merchant_id: str,
+        row_key: str = "",
+        cached_at: Any = None,
+    ) -> "CatalogEntry":
+        title = (product.title or "").lower()
+        description = (product.description or "").lower()
+        product_type = (product.product_type or "").lower()
+        blob = " ".join([title, description, product_type]).strip()
+        blob_compact = compact(blob)
+        tokens = frozenset(tokenize(strip_accents(blob)))
+        tags = " ".join(str(t) for t in (getattr(product, "tags", None) or []))
+        filters_ascii = strip_accents(" ".join([title, description, product_type, tags]))
+        intents = tag_product(blob, blob_compact, filters_ascii)
+        size_bytes = (
+            sys.getsizeof(title)
+            + sys.getsizeof(description)
+            + sys.getsizeof(product_type)
+            + sys.getsizeof(blob)
+            + sys.getsizeof(blob_compact)
+            + sys.getsizeof(tokens)
+            + sum(sys.getsizeof(t) for t in tokens)
+            # Rough allowance for the pydantic model and its field values.
+            + 2 * len(blob)
+            + 1024
+        )
+        return cls(
+            row_key=row_key or f"{merchant_id}:{product.product_id or product.id or id(product)}",
+            merchant_id=merchant_id,
+            product=product,
+            cached_at=cached_at,
+            title=title,
+            description=description,
+            product_type=product_type,
+            blob=blob,
+            blob_compact=blob_compact,
+            tokens=tokens,
+            intents=intents,
+            size_bytes=size_bytes,
+        )
+
+
+FUZZY_MIN_TERM_LEN = 4
+FUZZY_MAX_TERM_LEN = 24
+
+
+def _build_vocabulary(entries: Iterable[CatalogEntry]) -> DeletionIndex:
+    terms: Set[str] = set()
+    for entry in entries:
+        terms.update(t for t in entry.tokens if FUZZY_MIN_TERM_LEN <= len(t) <= FUZZY_MAX_TERM_LEN)
+    return DeletionIndex(sorted(terms), max_distance=1)
+
+
+def typo_corrections_in(entries: List[CatalogEntry], terms: Iterable[str], max_dist: int = 1) -> Dict[str, List[str]]:
+    """
+    `CatalogSnapshot.typo_corrections` over an ad-hoc list of entries (the
+    batch SQL path of find_products_multi), keyed by term. The vocabulary is
+    only built when some term matches no entry as-is.
+    """
+    missing = [
+        term
+        for term in terms
+        if len(term) >= FUZZY_MIN_TERM_LEN and not any(compact(term) in e.blob_compact for e in entries)
+    ]
+    if not missing:
+        return {}
+    vocabulary = _build_vocabulary(entries)
+    out: Dict[str, List[str]] = {}
+    for term in missing:
+        corrections = [] if term in vocabulary else vocabulary.lookup(term, max_dist)
+        if corrections:
+            out[term] = corrections
+    return out
+
+
+def _build_text_index(entries: List[CatalogEntry]) -> Tuple[CatalogTextIndex, DeletionIndex]:
+    return CatalogTextIndex(entries), _build_vocabulary(entries)
+
+
+def _parse_product_row(row: Any) -> Optional[Tuple[str, str, StandardProduct, Any]]:
+    if not isinstance(row, dict):
+        try:
+            row = dict(row)
+        except Exception:
+            return None
+    merchant_id = str(row.get("merchant_id") or "").strip()
+    if not merchant_id:
+        return None
+    product_data = row.get("product_data")
+    product_data = decode_object(product_data)
+    if product_data is None:
+        return None
+    try:
+        product = hydrate_product(product_data)
+    except Exception:
+        return None
+    if not product.merchant_id:
+        product.merchant_id = merchant_id
+    return str(row.get("id")), merchant_id, product, row.get("cached_at")
+
+
+def _entries_from_rows(rows: Iterable[Any]) -> List[CatalogEntry]:
+    """Decode and hydrate products_cache rows; undecodable rows are skipped."""
+    entries: List[CatalogEntry] = []
+    for row in rows:
+        parsed = _parse_product_row(row)
+        if parsed is None:
+            continue
+        row_key, merchant_id, product, cached_at = parsed
+        entries.append(CatalogEntry.from_product(product, merchant_id, row_key=row_key, cached_at=cached_at))
+    return entries
+
+
+def _rank_by_merchant(entries: Iterable[CatalogEntry]) -> Dict[str, List[CatalogEntry]]:
+    """Group entries per merchant, newest first, and set their `merchant_rank`."""
+    grouped: Dict[str, List[CatalogEntry]] = {}
+    for entry in entries:
+        grouped.setdefault(entry.merchant_id, []).append(entry)
+    for items in grouped.values():
+        items.sort(key=lambda e: e.cached_at, reverse=True)
+        for rank, entry in enumerate(items):
+            entry.merchant_rank = rank
+    return grouped
+
+
+@dataclass
+class _Loaded:
+    entries: Dict[str, CatalogEntry]
+    by_merchant: Dict[str, List[CatalogEntry]]
+    watermark: Any
+    memory_bytes: int
+    text_index: CatalogTextIndex
+    vocabulary: DeletionIndex
+
+
+def _build_snapshot(rows: List[Any]) -> _Loaded:
+    """Everything a full load computes from its rows (runs in a worker thread)."""
+    entries: Dict[str, CatalogEntry] = {}
+    watermark = None
+    for entry in _entries_from_rows(rows):
+        entries[entry.row_key] = entry
+        if watermark is None or entry.cached_at > watermark:
+            watermark = entry.cached_at
+    values = list(entries.values())
+    text_index, vocabulary = _build_text_index(values)
+    return _Loaded(
+        entries=entries,
+        by_merchant=_rank_by_merchant(values),
+        watermark=watermark,
+        memory_bytes=sum(e.size_bytes for e in values),
+        text_index=text_index,
+        vocabulary=vocabulary,
+    )
+
+
+class CatalogSnapshot:
+    """
+    In-memory `products_cache` mirror with incremental `cached_at` refresh.
+
+    Reads never block on the database: `ensure_fresh` schedules a background
+    refresh when the snapshot is stale and reports whether it is usable now.
+    Rows deleted from `products_cache` are only dropped on the periodic full
+    reload, so `full_reload_interval_s` bounds how long they can linger.
+    """
+
+    def __init__(
+        self,
+        *,
+        enabled: Optional[bool] = None,
+        refresh_interval_s: Optional[float] = None,
+        full_reload_interval_s: Optional[float] = None,
+        max_rows: Optional[int] = None,
+        page_size: int = 2000,
+    ):
+        self.enabled = env_flag("CATALOG_SNAPSHOT_ENABLED", True) if enabled is None else enabled
+        self.refresh_interval_s = (
+            float(env_int("CATALOG_SNAPSHOT_REFRESH_S", 30)) if refresh_interval_s is None else refresh_interval_s
+        )
+        self.full_reload_interval_s = (
+            float(env_int("CATALOG_SNAPSHOT_FULL_RELOAD_S", 900))
+            if full_reload_interval_s is None
+            else full_reload_interval_s
+        )
+        self.max_rows = env_int("CATALOG_SNAPSHOT_MAX_ROWS", 50000) if max_rows is None else max_rows
+        self.page_size = page_size
+        # Rebuild the text index once this share of rows changed since the last build.
+        self.index_rebuild_ratio = 0.1
+
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._by_merchant: Dict[str, List[CatalogEntry]] = {}
+        self._text_index: Optional[CatalogTextIndex] = None
+        self._vocabulary: Optional[DeletionIndex] = None
+        # Row keys upserted after the text index was built; scanned directly.
+        self._index_dirty: Set[str] = set()
+        self._watermark: Any = None
+        self._memory_bytes = 0
+        self._loaded = False
+        self._oversized = False
+        self._refreshed_at: Optional[float] = None
+        self._full_loaded_at: Optional[float] = None
+        # Last full load attempt, successful or not: oversized or failing
+        # catalogs are retried once per full_reload_interval_s, not per request.
+        self._full_attempted_at: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._counters = {"full_loads": 0, "incremental_refreshes": 0, "rows_upserted": 0, "refresh_errors": 0}
+
+    # ------------------------------------------------------------------ reads
+
+    @property
+    def ready(self) -> bool:
+        return self.enabled and self._loaded and not self._oversized and bool(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, row_key: str) -> Optional[CatalogEntry]:
+        return self._entries.get(row_key)
+
+    def select(self, merchant_ids: Iterable[str], per_merchant_limit: int) -> List[CatalogEntry]:
+        """
+        The `per_merchant_limit` most recently cached entries for each merchant.
+
+        Ordered by merchant_id then recency, matching the batch SQL it replaces.
+        """
+        cap = max(int(per_merchant_limit), 0)
+        out: List[CatalogEntry] = []
+        for merchant_id in sorted({m for m in merchant_ids if m}):
+            out.extend(self._by_merchant.get(merchant_id, [])[:cap])
+        return out
+
+    def typo_corrections(self, term: str, max_dist: int = 1) -> List[str]:
+        """
+        Catalog vocabulary terms within `max_dist` edits of a query term that
+        matches nothing as-is (e.g. "tolls" -> "dolls"); [] otherwise.
+        """
+        vocabulary, index = self._vocabulary, self._text_index
+        if vocabulary is None or index is None:
+            return []
+        if len(term) < FUZZY_MIN_TERM_LEN or term in vocabulary or index.containing(compact(term)):
+            return []
+        return vocabulary.lookup(term, max_dist)
+
+    def count_selected(self, merchant_ids: Iterable[str], per_merchant_limit: int) -> int:
+        cap = max(int(per_merchant_limit), 0)
+        return sum(min(len(self._by_merchant.get(m, ())), cap) for m in {m for m in merchant_ids if m})
+
+    def select_matching(
+        self,
+        merchant_ids: Iterable[str],
+        per_merchant_limit: int,
+        needles: Iterable[str],
+    ) -> Optional[List[CatalogEntry]]:
+        """
+        The subset of `select(...)` whose compacted blob contains any needle.
+
+        Returns None when the index cannot narrow the search (not built yet, or
+        a needle shorter than a trigram); callers then scan `select(...)`.
+        """
+        index = self._text_index
+        compact_needles = {compact(n) for n in needles}
+        if index is None or not compact_needles:
+            return None
+        hits: Dict[str, CatalogEntry] = {}
+        for needle in compact_needles:
+            found = index.containing(needle)
+            if found is None:
+                return None
+            for entry in found:
+                hits[entry.row_key] = entry
+        for row_key in self._index_dirty:
+            entry = self._entries.get(row_key)
+            if entry is not None and any(n in entry.blob_compact for n in compact_needles):
+                hits[row_key] = entry
+
+        allowed = {m for m in merchant_ids if m}
+        cap = max(int(per_merchant_limit), 0)
+        out = [
+            entry
+            for row_key, entry in hits.items()
+            if entry.merchant_id in allowed
+            and entry.merchant_rank < cap
+            and self._entries.get(row_key) is entry
+        ]
+        out.sort(key=lambda e: (e.merchant_id, e.merchant_rank))
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        watermark = self._watermark
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "rows": len(self._entries),
+            "merchants": len(self._by_merchant),
+            "memory_bytes": self._memory_bytes
+            + (self._text_index.memory_bytes if self._text_index is not None else 0),
+            "text_index_rows": len(self._text_index) if self._text_index is not None else 0,
+            "text_index_dirty": len(self._index_dirty),
+            "vocabulary": len(self._vocabulary) if self._vocabulary is not None else 0,
+            "age_s": round(now - self._refreshed_at, 3) if self._refreshed_at is not None else None,
+            "full_load_age_s": round(now - self._full_loaded_at, 3) if self._full_loaded_at is not None else None,
+            "watermark": watermark.isoformat() if hasattr(watermark, "isoformat") else watermark,
+            "oversized": self._oversized,
+            **self._counters,
+        }
+
+    # -------------------------------------------------------------- refreshes
+
+    async def ensure_fresh(self) -> bool:
+        """Schedule a background refresh if stale; return whether reads can use the snapshot."""
+        if not self.enabled:
+            return False
+        now = time.monotonic()
+        if self._full_attempted_at is None or now - self._full_attempted_at >= self.full_reload_interval_s:
+            self._schedule_refresh(full=True)
+        elif self._loaded and (self._refreshed_at is None or now - self._refreshed_at >= self.refresh_interval_s):
+            self._schedule_refresh(full=False)
+        return self.ready
+
+    def _schedule_refresh(self, *, full: bool) -> None:
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        try:
+            self._refresh_task = asyncio.get_running_loop().create_task(self.refresh(full=full))
+        except RuntimeError:
+            self._refresh_task = None
+
+    async def refresh(self, *, full: bool = False) -> None:
+        """Load the full table (`full=True`) or rows cached since the watermark."""
+        async with self._lock:
+            try:
+                if full or not self._loaded:
+                    await self._full_load()
+                else:
+                    await self._incremental_refresh()
+            except Exception as exc:  # pragma: no cover - defensive
+                self._counters["refresh_errors"] += 1
+                logger.warning("catalog_snapshot.refresh_failed", extra={"error": exc.__class__.__name__})
+
+    async def _fetch_rows(self, since: Any) -> Optional[List[Any]]:
+        """Page through products_cache in (cached_at, id) order; None if over max_rows."""
+        rows: List[Any] = []
+        after: Optional[Tuple[Any, Any]] = None
+        while True:
+            where = ["cached_at IS NOT NULL"]
+            params: Dict[str, Any] = {"page_size": self.page_size}
+            if since is not None:
+                where.append("cached_at >= :since")
+                params["since"] = since
+            if after is not None:
+                where.append("(cached_at, id) > (:after_cached_at, :after_id)")
+                params["after_cached_at"], params["after_id"] = after
+            page = await database.fetch_all(
+                f"""
+                SELECT id, merchant_id, product_data, cached_at
+                FROM products_cache
+                WHERE {' AND '.join(where)}
+                ORDER BY cached_at ASC, id ASC
+                LIMIT :page_size
+                """,
+                params,
+            )
+            page = list(page or [])
+            rows.extend(page)
+            if len(rows) > self.max_rows:
+                return None
+            if len(page) < self.page_size:
+                return rows
+            last = page[-1]
+            after = (last["cached_at"], last["id"])
+
+    async def _full_load(self) -> None:
+        self._full_attempted_at = time.monotonic()
+        self._counters["full_loads"] += 1
+        rows = await self._fetch_rows(since=None)
+        now = time.monotonic()
+        if rows is None:
+            self._oversized = True
+            self._entries, self._by_merchant = {}, {}
+            self._text_index, self._index_dirty, self._vocabulary = None, set(), None
+            self._memory_bytes = 0
+            logger.warning("catalog_snapshot.oversized", extra={"max_rows": self.max_rows})
+            return
+
+        # Parse and index off the event loop, then swap everything in one step:
+        # readers keep using the previous snapshot until the new one is complete.
+        loaded = await asyncio.to_thread(_build_snapshot, rows)
+        self._entries = loaded.entries
+        self._by_merchant = loaded.by_merchant
+        self._text_index = loaded.text_index
+        self._vocabulary = loaded.vocabulary
+        self._index_dirty = set()
+        self._watermark = loaded.watermark
+        self._memory_bytes = loaded.memory_bytes
+        self._oversized = False
+        self._loaded = True
+        self._refreshed_at = now
+        self._full_loaded_at = now
+
+    async def _incremental_refresh(self) -> None:
+        if self._watermark is None:
+            await self._full_load()
+            return
+        # `>=` re-reads rows sharing the watermark timestamp; upserts are idempotent.
+        rows = await self._fetch_rows(since=self._watermark)
+        if rows is None:
+            await self._full_load()
+            return
+        touched: Set[str] = set()
+        upserted = 0
+        for entry in await asyncio.to_thread(_entries_from_rows, rows):
+            previous = self._entries.get(entry.row_key)
+            if previous is not None:
+                if previous.cached_at == entry.cached_at:
+                    continue
+                self._memory_bytes -= previous.size_bytes
+            self._entries[entry.row_key] = entry
+            self._index_dirty.add(entry.row_key)
+            self._memory_bytes += entry.size_bytes
+            upserted += 1
+            touched.add(entry.merchant_id)
+            if entry.cached_at > self._watermark:
+                self._watermark = entry.cached_at
+        if touched:
+            self._by_merchant.update(
+                _rank_by_merchant(e for e in self._entries.values() if e.merchant_id in touched)
+            )
+            self._counters["rows_upserted"] += upserted
+        self._counters["incremental_refreshes"] += 1
+        self._refreshed_at = time.monotonic()
+        if len(self._index_dirty) > self.index_rebuild_ratio * max(len(self._entries), 1):
+            await self._rebuild_text_index()
+
+    async def _rebuild_text_index(self) -> None:
+        # Runs under the refresh lock, so entries can't change while the
+        # thread builds; the old index plus `_index_dirty` serves until the swap.
+        entries = list(self._entries.values())
+        text_index, vocabulary = await asyncio.to_thread(_build_text_index, entries)
+        self._text_index, self._vocabulary, self._index_dirty = text_index, vocabulary, set()
+
+
+# Singleton used by the gateway.
+catalog_snapshot = CatalogSnapshot()
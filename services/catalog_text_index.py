@@ -0,0 +1,80 @@
+"""
+Catalog Text Index
+
+Inverted index over catalog snapshot entries used to pick relevance
+candidates for `find_products_multi` without scanning every product.
+
+Every relevance test in the gateway (`q in title`, `term in blob`,
+`q_compact in blob_compact`) implies that the compacted needle occurs in the
+entry's `blob_compact`, so trigram postings over `blob_compact` give an exact
+superset of the matching products. Candidates are then re-checked by the
+caller's regular scoring code, which keeps ranking identical to a full scan.
+"""
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+if TYPE_CHECKING:  # pragma: no cover
+    from services.catalog_snapshot import CatalogEntry
+
+NGRAM = 3
+
+
+def _ngrams(text: str) -> set[str]:
+    return {text[i : i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+def _contains_sorted(values: array, target: int) -> bool:
+    idx = bisect_left(values, target)
+    return idx < len(values) and values[idx] == target
+
+
+class CatalogTextIndex:
+    """Immutable trigram index over a list of catalog entries."""
+
+    def __init__(self, entries: Sequence[CatalogEntry]):
+        self.entries: List[CatalogEntry] = list(entries)
+        grams: Dict[str, array] = {}
+        # Positions are appended in increasing order, so every posting list is sorted.
+        for pos, entry in enumerate(self.entries):
+            for gram in _ngrams(entry.blob_compact):
+                postings = grams.get(gram)
+                if postings is None:
+                    postings = grams[gram] = array("I")
+                postings.append(pos)
+        self._grams = grams
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(postings.buffer_info()[1] * postings.itemsize + 64 for postings in self._grams.values())
+
+    def containing(self, needle_compact: str) -> Optional[List[CatalogEntry]]:
+        """
+        Entries whose `blob_compact` contains `needle_compact`.
+
+        Returns None when the needle is too short to narrow with trigrams.
+        """
+        if len(needle_compact) < NGRAM:
+            return None
+        postings = []
+        for gram in _ngrams(needle_compact):
+            values = self._grams.get(gram)
+            if values is None:
+                return []
+            postings.append(values)
+        postings.sort(key=len)
+        candidates = postings[0]
+        for other in postings[1:]:
+            candidates = [pos for pos in candidates if _contains_sorted(other, pos)]
+            if not candidates:
+                return []
+        return [
+            self.entries[pos]
+            for pos in candidates
+            if needle_compact in self.entries[pos].blob_compact
+        ]
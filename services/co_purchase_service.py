@@ -0,0 +1,176 @@
+"""
+Co-Purchase Service
+
+Product-to-product co-purchase counts for the `co_view` similarity strategy.
+Two products co-occur when they are items of the same order.
+
+The graph is fed by the orders stream `PopularityIndex` already maintains
+(full reload + `created_at` watermark increments), so co-purchase data costs
+no extra scans of `orders`. A full reload fills a spawned graph off the event
+loop and the live graph adopts its counts. Reads are in-memory: `has_data` is a dict lookup
+plus one comparison, which lets `strategy="auto"` choose `co_view` in O(1).
+
+Memory is bounded by top-k pruning:
+- each product keeps at most `max_neighbors` counters; when a product
+  collects twice that many, only the `max_neighbors` largest survive;
+- at most `max_products` products are tracked; beyond that the products
+  seen in the fewest orders are dropped.
+Pruned pairs restart from zero if they co-occur again, so counts of rare pairs
+are approximate. Strong pairs, which are the ones ranked, are kept.
+
+Configuration (env):
+- CO_PURCHASE_ENABLED         (default true)
+- CO_PURCHASE_MAX_NEIGHBORS   (default 50)
+- CO_PURCHASE_MAX_PRODUCTS    (default 200000)
+- CO_PURCHASE_MIN_SUPPORT     (default 2; co-occurrences needed to count as co-view data)
+"""
+from __future__ import annotations
+
+import heapq
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.env import env_flag, env_int
+from services.popularity_service import PopularityIndex, PopularityKey, popularity_index
+
+# Large orders are capped so one bulk order can't add O(n^2) pairs.
+MAX_ITEMS_PER_ORDER = 50
+
+
+class CoPurchaseGraph:
+    """Bounded sparse co-occurrence counts between product ids."""
+
+    def __init__(self, max_neighbors: int = 50, max_products: int = 200000):
+        self.max_neighbors = max_neighbors
+        self.max_products = max_products
+        self._pairs: Dict[str, Dict[str, int]] = {}
+        self._best: Dict[str, int] = {}  # strongest pair count per product
+        self._orders: Dict[str, int] = {}  # orders containing the product
+        self.pruned_pairs = 0
+        self.evicted_products = 0
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+    def spawn(self) -> "CoPurchaseGraph":
+        """`OrderListener`: an empty graph with the same bounds."""
+        return CoPurchaseGraph(max_neighbors=self.max_neighbors, max_products=self.max_products)
+
+    def adopt(self, other: "CoPurchaseGraph") -> None:
+        """`OrderListener`: take over the counts a full reload built in `other`."""
+        self._pairs, self._best, self._orders = other._pairs, other._best, other._orders
+        self.pruned_pairs += other.pruned_pairs
+        self.evicted_products += other.evicted_products
+
+    def add_order(self, items: List[Tuple[PopularityKey, int]]) -> None:
+        """`PopularityIndex` listener entry point: one order's items."""
+        self.add(list(dict.fromkeys(pid for (_, pid), _ in items))[:MAX_ITEMS_PER_ORDER])
+
+    def add(self, product_ids: List[str]) -> None:
+        """Count every pair of distinct products bought together once."""
+        if len(product_ids) < 2:
+            return
+        for pid in product_ids:
+            self._orders[pid] = self._orders.get(pid, 0) + 1
+            row = self._pairs.get(pid)
+            if row is None:
+                row = self._pairs[pid] = {}
+            best = self._best.get(pid, 0)
+            for other in product_ids:
+                if other == pid:
+                    continue
+                count = row.get(other, 0) + 1
+                row[other] = count
+                if count > best:
+                    best = count
+            self._best[pid] = best
+            if len(row) > 2 * self.max_neighbors:
+                self._prune(pid, row)
+        if len(self._pairs) > self.max_products:
+            self._evict()
+
+    def _prune(self, pid: str, row: Dict[str, int]) -> None:
+        keep = heapq.nlargest(self.max_neighbors, row.items(), key=lambda kv: kv[1])
+        self.pruned_pairs += len(row) - len(keep)
+        self._pairs[pid] = dict(keep)
+
+    def _evict(self) -> None:
+        # Drop down to 90% of the bound so eviction is amortized.
+        excess = len(self._pairs) - int(self.max_products * 0.9)
+        for pid in heapq.nsmallest(excess, self._pairs, key=lambda p: self._orders.get(p, 0)):
+            del self._pairs[pid]
+            self._best.pop(pid, None)
+            self._orders.pop(pid, None)
+            self.evicted_products += 1
+
+    def has_data(self, product_id: str, min_support: int = 1) -> bool:
+        return self._best.get(product_id, 0) >= min_support
+
+    def neighbors(self, product_id: str, n: int, min_support: int = 1) -> List[Tuple[str, int]]:
+        """Up to `n` `(product_id, count)` pairs, most co-purchased first (ties by id)."""
+        row = self._pairs.get(product_id)
+        if not row:
+            return []
+        top = heapq.nsmallest(n, row.items(), key=lambda kv: (-kv[1], kv[0]))
+        return [(pid, count) for pid, count in top if count >= min_support]
+
+    def entries(self) -> int:
+        return sum(len(row) for row in self._pairs.values())
+
+
+class CoPurchaseIndex:
+    """`CoPurchaseGraph` kept fresh from the popularity index's order stream."""
+
+    def __init__(
+        self,
+        source: PopularityIndex = popularity_index,
+        *,
+        enabled: Optional[bool] = None,
+        max_neighbors: Optional[int] = None,
+        max_products: Optional[int] = None,
+        min_support: Optional[int] = None,
+    ):
+        self.source = source
+        self.enabled = env_flag("CO_PURCHASE_ENABLED", True) if enabled is None else enabled
+        self.min_support = env_int("CO_PURCHASE_MIN_SUPPORT", 2) if min_support is None else min_support
+        self.graph = CoPurchaseGraph(
+            max_neighbors=env_int("CO_PURCHASE_MAX_NEIGHBORS", 50) if max_neighbors is None else max_neighbors,
+            max_products=env_int("CO_PURCHASE_MAX_PRODUCTS", 200000) if max_products is None else max_products,
+        )
+        if self.enabled:
+            source.add_listener(self.graph)
+
+    async def _ready(self) -> bool:
+        # Schedules the shared background refresh; never waits on the database.
+        return self.enabled and await self.source.ensure_fresh()
+
+    async def has_data(self, product_id: str) -> bool:
+        return await self._ready() and self.graph.has_data(str(product_id), self.min_support)
+
+    async def neighbors(self, product_id: str, n: int) -> List[Tuple[str, float]]:
+        """
+        Up to `n` `(product_id, score)` pairs with at least `min_support`
+        co-purchases; score is the count relative to the strongest pair (0..1].
+        """
+        if not await self._ready():
+            return []
+        top = self.graph.neighbors(str(product_id), n, self.min_support)
+        if not top:
+            return []
+        strongest = top[0][1]
+        return [(pid, round(count / strongest, 3)) for pid, count in top]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "products": len(self.graph),
+            "pair_entries": self.graph.entries(),
+            "max_neighbors": self.graph.max_neighbors,
+            "max_products": self.graph.max_products,
+            "min_support": self.min_support,
+            "pruned_pairs": self.graph.pruned_pairs,
+            "evicted_products": self.graph.evicted_products,
+        }
+
+
+# Singleton used by SimilarityService.
+co_purchase_index = CoPurchaseIndex()
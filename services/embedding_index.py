@@ -0,0 +1,474 @@
+"""
+Embedding Index
+
+Vector recall for the `content_embedding` similarity strategy. Product text
+("<title> <product_type>", the same text the token strategy uses) is turned
+into dense vectors by a pluggable CPU featurizer and searched with an
+approximate nearest neighbor (ANN) index, so a request costs one in-memory
+search instead of up to three sequential recall queries.
+
+Featurizers are registered by name (`register_featurizer`). The built-in
+`hashed_tfidf` hashes tokens into `dim` buckets (crc32, so it is stable
+across processes), weights them by smoothed IDF fitted on the catalog, and
+L2-normalizes, so inner product is cosine similarity. A local model can be
+plugged in as another featurizer with the same `fit`/`transform` interface.
+
+ANN backends:
+- numpy    IVF (inverted file): spherical k-means cells, `nprobe` cells
+           scanned per query. Always written, and the fallback for the others.
+- faiss    IndexIVFFlat, inner product (optional dependency)
+- hnswlib  HNSW graph, inner product (optional dependency)
+
+Layout of an index directory:
+    CURRENT                      name of the live version directory
+    <version>/meta.json          featurizer config, dim, count, nlist, backend, built_at
+    <version>/ids.json           product ids in row order
+    <version>/featurizer_*.npy   featurizer arrays (e.g. the IDF weights)
+    <version>/vectors.npy        float32 [count, dim]
+    <version>/centroids.npy      float32 [nlist, dim]
+    <version>/list_rows.npy      int32 row ids grouped by cell
+    <version>/list_offsets.npy   int64 [nlist + 1] cell boundaries in list_rows
+    <version>/faiss.index | hnsw.bin   when built for that backend
+Versions are published by atomically replacing `CURRENT`; readers
+memory-map the arrays.
+
+Requires NumPy; without it the strategy uses live recall.
+
+Configuration (env):
+- SIMILARITY_EMBEDDING_INDEX_PATH     (unset disables vector recall)
+- SIMILARITY_EMBEDDING_INDEX_RELOAD_S (default 60; how often CURRENT is re-checked)
+- SIMILARITY_ANN_BACKEND              (auto | numpy | faiss | hnswlib, default auto)
+- SIMILARITY_ANN_NPROBE               (default 16; IVF cells scanned, also HNSW ef = 8 * nprobe)
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import shutil
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+from services.env import env_int
+from services.neighbor_table import scan_product_features
+from services.similarity_scoring import tokenize, top_k_indices
+
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None  # type: ignore
+
+try:
+    import faiss  # type: ignore
+except Exception:
+    faiss = None  # type: ignore
+
+try:
+    import hnswlib  # type: ignore
+except Exception:
+    hnswlib = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIM = 256
+KMEANS_ITERATIONS = 8
+ASSIGN_CHUNK = 8192
+KEEP_VERSIONS = 2
+
+
+# ---------------------------------------------------------------------------
+# Featurizers
+# ---------------------------------------------------------------------------
+
+
+class HashedTfidfFeaturizer:
+    """Binary term frequency x smoothed IDF over hashed token buckets."""
+
+    name = "hashed_tfidf"
+
+    def __init__(self, dim: int = DEFAULT_DIM, idf: Any = None):
+        self.dim = dim
+        self.idf = idf if idf is not None else np.ones(dim, dtype=np.float32)
+
+    def _buckets(self, text: str) -> List[int]:
+        return sorted({zlib.crc32(t.encode("utf-8")) % self.dim for t in tokenize(text or "")})
+
+    def fit(self, texts: Sequence[str]) -> "HashedTfidfFeaturizer":
+        df = np.zeros(self.dim, dtype=np.float64)
+        for text in texts:
+            df[self._buckets(text)] += 1.0
+        self.idf = (np.log((1.0 + len(texts)) / (1.0 + df)) + 1.0).astype(np.float32)
+        return self
+
+    def transform(self, texts: Sequence[str]) -> Any:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            buckets = self._buckets(text)
+            out[i, buckets] = self.idf[buckets]
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+    def config(self) -> Dict[str, Any]:
+        return {"name": self.name, "dim": self.dim}
+
+    def arrays(self) -> Dict[str, Any]:
+        return {"idf": self.idf}
+
+    @classmethod
+    def restore(cls, config: Dict[str, Any], arrays: Dict[str, Any]) -> "HashedTfidfFeaturizer":
+        return cls(dim=int(config["dim"]), idf=arrays["idf"])
+
+
+FEATURIZERS: Dict[str, Type[Any]] = {HashedTfidfFeaturizer.name: HashedTfidfFeaturizer}
+
+
+def register_featurizer(name: str, cls: Type[Any]) -> None:
+    """Make a featurizer class available to `build_index` and `EmbeddingIndex.open`."""
+    FEATURIZERS[name] = cls
+
+
+# ---------------------------------------------------------------------------
+# IVF training
+# ---------------------------------------------------------------------------
+
+
+def _assign(vectors: Any, centroids: Any) -> Any:
+    out = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        chunk = vectors[start : start + ASSIGN_CHUNK]
+        out[start : start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return out
+
+
+def train_ivf(vectors: Any, nlist: int, seed: int = 0) -> Tuple[Any, Any]:
+    """Spherical k-means; returns `(centroids [nlist, dim], cell per row)`."""
+    rng = np.random.default_rng(seed)
+    nlist = max(1, min(nlist, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    assign = _assign(vectors, centroids)
+    for _ in range(KMEANS_ITERATIONS):
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = np.flatnonzero(counts == 0)
+        # Re-seed empty cells with random rows so every cell is used.
+        sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.maximum(norms, 1e-12)).astype(np.float32)
+        new_assign = _assign(vectors, centroids)
+        if np.array_equal(new_assign, assign):
+            break
+        assign = new_assign
+    return centroids, assign
+
+
+# ---------------------------------------------------------------------------
+# Storage
+# ---------------------------------------------------------------------------
+
+
+def _read_current(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, "CURRENT"), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _read_meta(root: str, version: str) -> Dict[str, Any]:
+    with open(os.path.join(root, version, "meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_index(
+    root: str,
+    ids: List[str],
+    texts: Sequence[str],
+    featurizer: Any,
+    nlist: Optional[int] = None,
+    backend: str = "numpy",
+) -> str:
+    """Fit `featurizer`, index `texts` and publish a new version; returns its name."""
+    featurizer.fit(texts)
+    vectors = featurizer.transform(texts) if ids else np.zeros((0, featurizer.dim), dtype=np.float32)
+    if ids:
+        centroids, assign = train_ivf(vectors, nlist or int(math.sqrt(len(ids))) or 1)
+    else:
+        centroids, assign = np.zeros((0, featurizer.dim), dtype=np.float32), np.zeros(0, dtype=np.int64)
+    list_rows = np.argsort(assign, kind="stable").astype(np.int32)
+    list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=len(centroids)))]).astype(np.int64)
+
+    os.makedirs(root, exist_ok=True)
+    version = datetime.now(timezone.utc).strftime("v%Y%m%dT%H%M%S%fZ")
+    path = os.path.join(root, version)
+    os.makedirs(path)
+    np.save(os.path.join(path, "vectors.npy"), vectors)
+    np.save(os.path.join(path, "centroids.npy"), centroids)
+    np.save(os.path.join(path, "list_rows.npy"), list_rows)
+    np.save(os.path.join(path, "list_offsets.npy"), list_offsets)
+    for name, arr in featurizer.arrays().items():
+        np.save(os.path.join(path, f"featurizer_{name}.npy"), arr)
+    with open(os.path.join(path, "ids.json"), "w", encoding="utf-8") as f:
+        json.dump(ids, f)
+
+    if backend not in ("numpy", "faiss", "hnswlib"):
+        raise ValueError(f"unknown ANN backend: {backend}")
+    written = "numpy"
+    if backend == "faiss" and faiss is not None and ids:
+        quantizer = faiss.IndexFlatIP(featurizer.dim)
+        index = faiss.IndexIVFFlat(quantizer, featurizer.dim, len(centroids), faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.add(vectors)
+        faiss.write_index(index, os.path.join(path, "faiss.index"))
+        written = "faiss"
+    elif backend == "hnswlib" and hnswlib is not None and ids:
+        index = hnswlib.Index(space="ip", dim=featurizer.dim)
+        index.init_index(max_elements=len(ids), ef_construction=200, M=16)
+        index.add_items(vectors, np.arange(len(ids)))
+        index.save_index(os.path.join(path, "hnsw.bin"))
+        written = "hnswlib"
+    elif backend != "numpy":
+        logger.warning("ANN backend %s is not installed; writing the numpy IVF index only", backend)
+
+    meta = {
+        "version": version,
+        "featurizer": featurizer.config(),
+        "dim": featurizer.dim,
+        "count": len(ids),
+        "nlist": len(centroids),
+        "backend": written,
+        "built_at": datetime.now(timezone.utc).isoformat(),
+    }
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    tmp = os.path.join(root, f"CURRENT.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(root, "CURRENT"))
+
+    old = sorted(d for d in os.listdir(root) if d.startswith("v") and d != version)
+    for stale in old[: max(0, len(old) - (KEEP_VERSIONS - 1))]:
+        shutil.rmtree(os.path.join(root, stale), ignore_errors=True)
+    return version
+
+
+class EmbeddingIndex:
+    """Read-only view of one published index version (arrays memory-mapped)."""
+
+    def __init__(
+        self,
+        path: str,
+        meta: Dict[str, Any],
+        ids: List[str],
+        featurizer: Any,
+        vectors: Any,
+        centroids: Any,
+        list_rows: Any,
+        list_offsets: Any,
+        backend: str = "numpy",
+        backend_index: Any = None,
+        nprobe: int = 16,
+    ):
+        self.path = path
+        self.meta = meta
+        self.ids = ids
+        self.rows = {pid: i for i, pid in enumerate(ids)}
+        self.featurizer = featurizer
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_rows = list_rows
+        self.list_offsets = list_offsets
+        self.backend = backend
+        self.backend_index = backend_index
+        self.nprobe = nprobe
+
+    @classmethod
+    def open(cls, root: str, backend: str = "auto", nprobe: int = 16) -> Optional["EmbeddingIndex"]:
+        if np is None:
+            return None
+        version = _read_current(root)
+        if not version:
+            return None
+        path = os.path.join(root, version)
+        meta = _read_meta(root, version)
+        with open(os.path.join(path, "ids.json"), "r", encoding="utf-8") as f:
+            ids = json.load(f)
+        config = meta["featurizer"]
+        arrays = {
+            name[len("featurizer_") : -len(".npy")]: np.load(os.path.join(path, name))
+            for name in os.listdir(path)
+            if name.startswith("featurizer_") and name.endswith(".npy")
+        }
+        featurizer = FEATURIZERS[config["name"]].restore(config, arrays)
+        loaded = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in ("vectors", "centroids", "list_rows", "list_offsets")
+        }
+        used, backend_index = _open_backend(path, meta, backend, nprobe)
+        return cls(path, meta, ids, featurizer, backend=used, backend_index=backend_index, nprobe=nprobe, **loaded)
+
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self.rows
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def embed(self, text: str) -> Any:
+        return self.featurizer.transform([text])[0]
+
+    def search(
+        self,
+        vector: Any,
+        k: int,
+        exclude: Iterable[str] = (),
+        exact: bool = False,
+    ) -> List[Tuple[str, float]]:
+        """
+        Up to `k` `(product_id, cosine)` pairs, most similar first. `exact`
+        scans every vector (the brute-force reference for recall checks).
+        """
+        if not self.ids or k <= 0:
+            return []
+        exclude = set(exclude)
+        want = k + len(exclude)
+        if exact:
+            rows, scores = self._search_exact(vector, want)
+        elif self.backend == "faiss":
+            self.backend_index.nprobe = self.nprobe
+            found, rows = self.backend_index.search(np.asarray(vector, dtype=np.float32)[None, :], want)
+            rows, scores = rows[0].tolist(), found[0].tolist()
+        elif self.backend == "hnswlib":
+            labels, distances = self.backend_index.knn_query(np.asarray(vector, dtype=np.float32), k=min(want, len(self.ids)))
+            rows, scores = labels[0].tolist(), (1.0 - distances[0]).tolist()
+        else:
+            rows, scores = self._search_ivf(vector, want)
+        out: List[Tuple[str, float]] = []
+        for row, score in zip(rows, scores):
+            if row < 0:
+                continue
+            pid = self.ids[row]
+            if pid in exclude:
+                continue
+            out.append((pid, round(min(1.0, max(0.0, float(score))), 3)))
+            if len(out) >= k:
+                break
+        return out
+
+    def search_by_id(self, product_id: str, k: int) -> Optional[List[Tuple[str, float]]]:
+        """Nearest neighbors of an indexed product (itself excluded), or None if not indexed."""
+        row = self.rows.get(product_id)
+        if row is None:
+            return None
+        return self.search(np.asarray(self.vectors[row]), k, exclude=(product_id,))
+
+    def _search_exact(self, vector: Any, k: int) -> Tuple[List[int], List[float]]:
+        scores = np.asarray(self.vectors) @ vector
+        top = top_k_indices(scores.tolist(), k)
+        return top, scores[top].tolist()
+
+    def _search_ivf(self, vector: Any, k: int) -> Tuple[List[int], List[float]]:
+        cells = top_k_indices((np.asarray(self.centroids) @ vector).tolist(), self.nprobe)
+        rows = np.concatenate(
+            [self.list_rows[self.list_offsets[c] : self.list_offsets[c + 1]] for c in cells]
+        ).astype(np.int64)
+        # Scan in row order so equal scores rank the same way as the exact search.
+        rows.sort()
+        scores = self.vectors[rows] @ vector
+        top = top_k_indices(scores.tolist(), k)
+        return rows[top].tolist(), scores[top].tolist()
+
+
+def _open_backend(path: str, meta: Dict[str, Any], backend: str, nprobe: int) -> Tuple[str, Any]:
+    """The library index to serve with, falling back to NumPy IVF when unavailable."""
+    if backend in ("auto", "faiss") and faiss is not None and os.path.exists(os.path.join(path, "faiss.index")):
+        return "faiss", faiss.read_index(os.path.join(path, "faiss.index"), faiss.IO_FLAG_MMAP)
+    if backend in ("auto", "hnswlib") and hnswlib is not None and os.path.exists(os.path.join(path, "hnsw.bin")):
+        index = hnswlib.Index(space="ip", dim=int(meta["dim"]))
+        index.load_index(os.path.join(path, "hnsw.bin"), max_elements=int(meta["count"]))
+        index.set_ef(8 * nprobe)
+        return "hnswlib", index
+    if backend not in ("auto", "numpy"):
+        logger.warning("ANN backend %s unavailable for %s; using numpy IVF", backend, path)
+    return "numpy", None
+
+
+# ---------------------------------------------------------------------------
+# Build from products_cache
+# ---------------------------------------------------------------------------
+
+
+async def build_index(
+    root: str,
+    dim: int = DEFAULT_DIM,
+    nlist: Optional[int] = None,
+    backend: str = "numpy",
+    featurizer: str = HashedTfidfFeaturizer.name,
+) -> Dict[str, Any]:
+    """Full build over the active products in products_cache."""
+    if np is None:
+        raise RuntimeError("numpy is required to build the embedding index")
+    started = time.monotonic()
+    features, _ = await scan_product_features(None)
+    active = sorted((f for f in features.values() if f.active), key=lambda f: f.product_id)
+    version = write_index(
+        root,
+        [f.product_id for f in active],
+        [f.text for f in active],
+        FEATURIZERS[featurizer](dim=dim),
+        nlist=nlist,
+        backend=backend,
+    )
+    return {
+        "version": version,
+        "products": len(active),
+        "backend": _read_meta(root, version)["backend"],
+        "elapsed_s": round(time.monotonic() - started, 3),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Serving
+# ---------------------------------------------------------------------------
+
+
+class EmbeddingIndexProvider:
+    """Lazily opens the configured index and picks up newly published versions."""
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        reload_s: Optional[float] = None,
+        backend: Optional[str] = None,
+        nprobe: Optional[int] = None,
+    ):
+        self.root = root if root is not None else (os.getenv("SIMILARITY_EMBEDDING_INDEX_PATH") or "").strip()
+        self.reload_s = float(env_int("SIMILARITY_EMBEDDING_INDEX_RELOAD_S", 60)) if reload_s is None else reload_s
+        self.backend = (backend or os.getenv("SIMILARITY_ANN_BACKEND") or "auto").strip().lower()
+        self.nprobe = env_int("SIMILARITY_ANN_NPROBE", 16) if nprobe is None else nprobe
+        self._index: Optional[EmbeddingIndex] = None
+        self._version: Optional[str] = None
+        self._checked_at = float("-inf")
+
+    def get(self) -> Optional[EmbeddingIndex]:
+        if not self.root or np is None:
+            return None
+        now = time.monotonic()
+        if now - self._checked_at >= self.reload_s:
+            self._checked_at = now
+            try:
+                version = _read_current(self.root)
+                if version != self._version:
+                    self._index = EmbeddingIndex.open(self.root, self.backend, self.nprobe) if version else None
+                    self._version = version
+            except Exception as exc:
+                logger.warning("embedding index %s could not be opened: %s", self.root, exc)
+        return self._index
+
+
+# Singleton used by SimilarityService.
+embedding_indexes = EmbeddingIndexProvider()
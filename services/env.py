@@ -0,0 +1,36 @@
+"""
+Environment Settings
+
+Shared parsing for the `Configuration (env)` settings the services read, so
+every module applies the same rules:
+
+- unset, empty or whitespace-only values fall back to the default;
+- flags are off for "0", "false", "no" or "off" (any case) and on otherwise;
+- numbers that don't parse fall back to the default.
+"""
+from __future__ import annotations
+
+import os
+
+_FALSE_VALUES = frozenset({"0", "false", "no", "off"})
+
+
+def env_flag(name: str, default: bool) -> bool:
+    raw = (os.getenv(name) or "").strip().lower()
+    if not raw:
+        return default
+    return raw not in _FALSE_VALUES
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int((os.getenv(name) or "").strip())
+    except ValueError:
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float((os.getenv(name) or "").strip())
+    except ValueError:
+        return default
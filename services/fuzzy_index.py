@@ -0,0 +1,133 @@
+"""
+Fuzzy token matching
+
+SymSpell-style deletion index for "all vocabulary terms within edit distance
+k" lookups. Every term is indexed under the strings reachable by deleting up
+to `max_distance` characters; two terms within Levenshtein distance k always
+share such a deletion variant, so a lookup only generates the query's own
+variants, probes the index and verifies the few hits with a bounded DP.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Dict, Iterable, List, Set, Tuple, Union
+
+
+def edit_distance_leq(a: str, b: str, max_dist: int) -> bool:
+    """Return True if Levenshtein(a,b) <= max_dist (with early exit)."""
+    if a == b:
+        return True
+    if max_dist <= 0:
+        return False
+    if not a or not b:
+        return max(len(a), len(b)) <= max_dist
+    if abs(len(a) - len(b)) > max_dist:
+        return False
+
+    if len(a) > len(b):
+        a, b = b, a
+
+    prev = list(range(len(a) + 1))
+    for i, ch_b in enumerate(b, start=1):
+        cur = [i]
+        min_in_row = cur[0]
+        for j, ch_a in enumerate(a, start=1):
+            cost = 0 if ch_a == ch_b else 1
+            cur_val = min(
+                prev[j] + 1,
+                cur[j - 1] + 1,
+                prev[j - 1] + cost,
+            )
+            cur.append(cur_val)
+            if cur_val < min_in_row:
+                min_in_row = cur_val
+        if min_in_row > max_dist:
+            return False
+        prev = cur
+    return prev[-1] <= max_dist
+
+
+def _deletes(term: str, max_distance: int) -> Set[str]:
+    """All strings obtained from `term` by deleting up to `max_distance` chars."""
+    out = {term}
+    frontier = {term}
+    for _ in range(max_distance):
+        nxt: Set[str] = set()
+        for word in frontier:
+            for i in range(len(word)):
+                nxt.add(word[:i] + word[i + 1 :])
+        nxt -= out
+        out |= nxt
+        frontier = nxt
+    return out
+
+
+class DeletionIndex:
+    """Vocabulary index answering `lookup(term, k)` for k <= max_distance."""
+
+    def __init__(self, terms: Iterable[str], max_distance: int = 1):
+        self.max_distance = max_distance
+        self._vocab: Set[str] = set()
+        # Most variants map to a single term; store a bare str until they collide.
+        self._variants: Dict[str, Union[str, List[str]]] = {}
+        for term in terms:
+            if not term or term in self._vocab:
+                continue
+            self._vocab.add(term)
+            for variant in _deletes(term, max_distance):
+                existing = self._variants.get(variant)
+                if existing is None:
+                    self._variants[variant] = term
+                elif isinstance(existing, str):
+                    self._variants[variant] = [existing, term]
+                else:
+                    existing.append(term)
+
+    def __len__(self) -> int:
+        return len(self._vocab)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self._vocab
+
+    def lookup(self, term: str, max_dist: int = 1) -> List[str]:
+        """Vocabulary terms within `max_dist` edits of `term`, closest first."""
+        if max_dist > self.max_distance:
+            raise ValueError(f"index built for max_distance={self.max_distance}, got {max_dist}")
+        candidates: Set[str] = set()
+        for variant in _deletes(term, max_dist):
+            hit = self._variants.get(variant)
+            if hit is None:
+                continue
+            if isinstance(hit, str):
+                candidates.add(hit)
+            else:
+                candidates.update(hit)
+        scored: List[Tuple[int, str]] = []
+        for cand in candidates:
+            for dist in range(max_dist + 1):
+                if edit_distance_leq(term, cand, dist):
+                    scored.append((dist, cand))
+                    break
+        scored.sort()
+        return [cand for _dist, cand in scored]
+
+
+@lru_cache(maxsize=32)
+def _target_index(targets: Tuple[str, ...], max_dist: int) -> DeletionIndex:
+    return DeletionIndex(targets, max_distance=max_dist)
+
+
+def fuzzy_token_match(tokens: List[str], targets: Iterable[str], max_dist: int) -> bool:
+    """True if any token equals a target, or (for tokens of 4+ chars) is within `max_dist` edits."""
+    target_tuple = tuple(sorted({t for t in targets if t}))
+    if not tokens or not target_tuple:
+        return False
+    index = _target_index(target_tuple, max_dist)
+    for tok in tokens:
+        if tok in index:
+            return True
+        if len(tok) < 4:
+            continue
+        if index.lookup(tok, max_dist):
+            return True
+    return False
@@ -0,0 +1,172 @@
+"""
+Intent Lexicon
+
+Declarative vocabulary for the shopping intents `find_products_multi` reacts
+to (tee, toys, lingerie exclusion, creator "look" queries). Rules are
+compiled once into a single alternation regex per text field, so tagging a
+query or a product is one regex pass per field instead of a list of
+substring tests and ad-hoc regexes evaluated per product.
+
+Product-side tags only depend on the product, so callers compute them once
+per catalog entry and cache them with the catalog.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+
+@dataclass(frozen=True)
+class LexiconRule:
+    intent: str
+    field: str
+    literals: Tuple[str, ...] = ()
+    patterns: Tuple[str, ...] = ()
+
+
+_TEE_PATTERNS = (r"\btees?\b", r"\bt\s*-?\s*shirts?\b")
+_TEE_LITERALS = ("t恤", "t 恤")
+
+QUERY_RULES: Tuple[LexiconRule, ...] = (
+    LexiconRule("look_subject", "q_lower", literals=("nina studio",)),
+    LexiconRule("look_trigger", "q_lower", literals=("exact outfit", "shop", "look", "wear", "ropa", "outfit")),
+    # Negative lingerie constraint (e.g. "no lingerie", "sin lenceria").
+    LexiconRule(
+        "exclude_lingerie",
+        "q_lower",
+        literals=("no lingerie", "without lingerie", "sin lenceria", "sin lencería", "sin ropa interior"),
+    ),
+    LexiconRule("tee", "q_lower", literals=_TEE_LITERALS, patterns=_TEE_PATTERNS),
+    LexiconRule("tee", "q_compact", literals=("tshirt",), patterns=(r"^tee$",)),
+    # "toy" / "juguete" also cover their plurals and "art toy" / "designer toy".
+    LexiconRule("toys", "q_ascii", literals=("toy", "juguete", "labubu")),
+)
+
+PRODUCT_RULES: Tuple[LexiconRule, ...] = (
+    LexiconRule(
+        "lingerie",
+        "blob",
+        literals=(
+            "lingerie",
+            "lenceria",
+            "lencería",
+            "underwear",
+            "bra",
+            "panties",
+            "ropa interior",
+            "sujetador",
+            "bragas",
+        ),
+    ),
+    LexiconRule("tee", "blob", literals=_TEE_LITERALS, patterns=_TEE_PATTERNS),
+    LexiconRule("tee", "blob_compact", literals=("tshirt",)),
+    LexiconRule(
+        "toy_like",
+        "filters_ascii",
+        literals=(
+            "toy",
+            "juguete",
+            "doll",
+            "plush",
+            "peluche",
+            "figure",
+            "vinyl",
+            "blind box",
+            "collectible",
+            "labubu",
+        ),
+    ),
+)
+
+# Fuzzy targets for misspelled toy queries (e.g. "tolls" ~ "dolls").
+TOY_FUZZY_TARGETS: Tuple[str, ...] = ("doll", "dolls", "toys")
+
+# Terms appended to the token query when an intent is detected.
+TEE_QUERY_TERMS: Tuple[str, ...] = ("tee", "tshirt", "t-shirt")
+TOY_QUERY_TERMS: Tuple[str, ...] = (
+    "toy",
+    "toys",
+    "juguete",
+    "juguetes",
+    "doll",
+    "dolls",
+    "plush",
+    "plushie",
+    "peluche",
+    "figure",
+    "figures",
+    "vinyl",
+    "blind",
+    "box",
+    "collectible",
+    "collector",
+    "art",
+    "designer",
+    "labubu",
+)
+
+
+class IntentMatcher:
+    """Rules compiled into one named-group alternation per text field."""
+
+    def __init__(self, rules: Iterable[LexiconRule]):
+        alternatives: Dict[str, List[str]] = {}
+        self._groups: Dict[str, str] = {}
+        for idx, rule in enumerate(rules):
+            parts = [re.escape(lit) for lit in rule.literals] + list(rule.patterns)
+            if not parts:
+                continue
+            group = f"g{idx}"
+            self._groups[group] = rule.intent
+            alternatives.setdefault(rule.field, []).append(f"(?P<{group}>{'|'.join(parts)})")
+        # Zero-width lookahead so overlapping hits (e.g. "ropa" inside
+        # "sin ropa interior") are all reported, as with substring tests.
+        self._regexes = {
+            field: re.compile("(?=" + "|".join(alts) + ")") for field, alts in alternatives.items()
+        }
+        self._field_intents = {
+            field: frozenset(self._groups[g] for g in regex.groupindex)
+            for field, regex in self._regexes.items()
+        }
+
+    def tag(self, **fields: str) -> FrozenSet[str]:
+        tags: set[str] = set()
+        for field, regex in self._regexes.items():
+            text = fields.get(field) or ""
+            if not text:
+                continue
+            wanted = self._field_intents[field]
+            for match in regex.finditer(text):
+                tags.add(self._groups[match.lastgroup])
+                if wanted <= tags:
+                    break
+        return frozenset(tags)
+
+
+query_matcher = IntentMatcher(QUERY_RULES)
+product_matcher = IntentMatcher(PRODUCT_RULES)
+
+
+@dataclass(frozen=True)
+class QueryIntents:
+    look: bool
+    exclude_lingerie: bool
+    toys: bool
+    tee: bool
+
+
+def tag_query(q_lower: str, q_ascii: str, q_compact: str) -> QueryIntents:
+    """Intents expressed by a query. Fuzzy toy matching is left to the caller."""
+    tags = query_matcher.tag(q_lower=q_lower, q_ascii=q_ascii, q_compact=q_compact)
+    return QueryIntents(
+        look="look_subject" in tags and "look_trigger" in tags,
+        exclude_lingerie="exclude_lingerie" in tags,
+        toys="toys" in tags,
+        tee="tee" in tags,
+    )
+
+
+def tag_product(blob: str, blob_compact: str, filters_ascii: str) -> FrozenSet[str]:
+    """Product intent tags: subset of {"lingerie", "tee", "toy_like"}."""
+    return product_matcher.tag(blob=blob, blob_compact=blob_compact, filters_ascii=filters_ascii)
@@ -0,0 +1,148 @@
+"""
+JSON Column Decoding
+
+One entry point for decoding JSON columns read from the database
+(`products_cache.product_data`, `orders.items`, ...). Drivers hand these back
+either already decoded or as text, and every read path used to call
+`json.loads` itself; routing them through here lets the decoder be swapped
+for a faster backend and makes decode time measurable as its own stage
+(`decode_stats()`, `/dev/json_decode`).
+
+Backends, in `auto` preference order:
+- orjson   (optional dependency)
+- msgspec  (optional dependency, generic `msgspec.json.decode`)
+- stdlib   (`json.loads`, always available)
+
+Input the fast backends reject but the stdlib accepts (NaN/Infinity literals,
+lone surrogates) is retried with the stdlib. The one remaining difference is
+that orjson decodes integers beyond 64 bits as floats; no product or order
+field carries such values.
+
+Configuration (env):
+- JSON_DECODE_BACKEND (auto | orjson | msgspec | stdlib, default auto)
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import orjson  # type: ignore
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
+try:
+    import msgspec  # type: ignore
+except Exception:  # pragma: no cover
+    msgspec = None  # type: ignore
+
+
+def _available_backends() -> Dict[str, Callable[[Any], Any]]:
+    backends: Dict[str, Callable[[Any], Any]] = {}
+    if orjson is not None:
+        backends["orjson"] = orjson.loads
+    if msgspec is not None:
+        backends["msgspec"] = msgspec.json.decode
+    backends["stdlib"] = json.loads
+    return backends
+
+
+def _select_backend(requested: Optional[str] = None) -> Tuple[str, Callable[[Any], Any]]:
+    backends = _available_backends()
+    name = (requested if requested is not None else os.getenv("JSON_DECODE_BACKEND", "auto")).strip().lower()
+    if name in backends:
+        return name, backends[name]
+    # "auto", or a backend that isn't installed: best available.
+    for candidate in ("orjson", "msgspec", "stdlib"):
+        if candidate in backends:
+            return candidate, backends[candidate]
+    return "stdlib", json.loads  # pragma: no cover
+
+
+_backend_name, _backend = _select_backend()
+
+_counters: Dict[str, Any] = {
+    "calls": 0,
+    "decoded": 0,
+    "passthrough": 0,
+    "errors": 0,
+    "stdlib_retries": 0,
+    "bytes": 0,
+    "decode_s": 0.0,
+}
+
+
+def set_backend(name: str) -> str:
+    """Switch backends at runtime (tests, benchmarks); returns the backend in effect."""
+    global _backend_name, _backend
+    _backend_name, _backend = _select_backend(name)
+    return _backend_name
+
+
+def decode_json(value: Any) -> Any:
+    """
+    Decode a JSON column value.
+
+    `str`/`bytes` are parsed; anything else (the driver already decoded it,
+    or NULL) is returned unchanged. Raises ValueError on malformed JSON.
+    """
+    if not isinstance(value, (str, bytes, bytearray)):
+        _counters["passthrough"] += 1
+        return value
+    _counters["calls"] += 1
+    _counters["bytes"] += len(value)
+    started = time.perf_counter()
+    try:
+        if _backend is json.loads:
+            return json.loads(value)
+        try:
+            return _backend(value)
+        except Exception:
+            # orjson/msgspec are stricter than json.loads; let the stdlib decide.
+            _counters["stdlib_retries"] += 1
+            return json.loads(value)
+    except ValueError:
+        _counters["errors"] += 1
+        raise
+    finally:
+        _counters["decoded"] += 1
+        _counters["decode_s"] += time.perf_counter() - started
+
+
+def decode_object(value: Any) -> Optional[Dict[str, Any]]:
+    """`decode_json` for object columns; None if malformed or not an object."""
+    try:
+        decoded = decode_json(value)
+    except ValueError:
+        return None
+    return decoded if isinstance(decoded, dict) else None
+
+
+def decode_array(value: Any) -> Optional[List[Any]]:
+    """`decode_json` for array columns; None if malformed or not an array."""
+    try:
+        decoded = decode_json(value)
+    except ValueError:
+        return None
+    return decoded if isinstance(decoded, list) else None
+
+
+def decode_stats() -> Dict[str, Any]:
+    decoded = _counters["decoded"]
+    return {
+        "backend": _backend_name,
+        "calls": _counters["calls"],
+        "passthrough": _counters["passthrough"],
+        "errors": _counters["errors"],
+        "stdlib_retries": _counters["stdlib_retries"],
+        "bytes": _counters["bytes"],
+        "decode_ms": round(_counters["decode_s"] * 1000.0, 3),
+        "avg_decode_us": round(_counters["decode_s"] * 1e6 / decoded, 3) if decoded else 0.0,
+    }
+
+
+def reset_decode_stats() -> None:
+    for key in _counters:
+        _counters[key] = 0.0 if key == "decode_s" else 0
@@ -0,0 +1,127 @@
+"""
+Merchant Directory
+
+Process-local list of searchable merchants (not deleted/rejected, PSP
+connected) for `find_products_multi`, which used to read
+`merchant_onboarding` on every call.
+
+Reads are stale-while-revalidate: once loaded, `get` always answers from
+memory and schedules a background refresh when the copy is older than
+`refresh_interval_s`. Only the very first read (or a read against a
+different database handle) waits on the database. A failed refresh keeps
+serving the previous list and is retried on a later read; `stats()` reports
+size, age and whether the list is stale.
+
+The old hard `LIMIT 100` is replaced by `max_merchants`; hitting it is
+logged and reported as `truncated`.
+
+Configuration (env):
+- MERCHANT_DIRECTORY_REFRESH_S     (default 300)
+- MERCHANT_DIRECTORY_MAX_MERCHANTS (default 5000)
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from services.env import env_int
+
+logger = logging.getLogger(__name__)
+
+
+class MerchantDirectory:
+    """merchant_id -> business_name, refreshed in the background."""
+
+    _QUERY = """
+        SELECT merchant_id, business_name
+        FROM merchant_onboarding
+        WHERE status NOT IN ('deleted', 'rejected')
+        AND psp_connected = true
+        ORDER BY merchant_id
+        LIMIT :max_merchants
+    """
+
+    def __init__(self, refresh_interval_s: Optional[float] = None, max_merchants: Optional[int] = None):
+        self.refresh_interval_s = (
+            float(env_int("MERCHANT_DIRECTORY_REFRESH_S", 300)) if refresh_interval_s is None else refresh_interval_s
+        )
+        self.max_merchants = env_int("MERCHANT_DIRECTORY_MAX_MERCHANTS", 5000) if max_merchants is None else max_merchants
+        self._merchants: Dict[str, str] = {}
+        self._source: Any = None  # database handle the list was read from
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._last_error: Optional[str] = None
+        self._counters = {"reads": 0, "stale_reads": 0, "cold_loads": 0, "refreshes": 0, "refresh_errors": 0}
+
+    async def get(self, db: Any) -> Dict[str, str]:
+        """
+        The directory read from `db`. Waits on the database only when nothing
+        has been loaded from this handle yet (errors then propagate).
+        Callers must not mutate the returned dict.
+        """
+        self._counters["reads"] += 1
+        if self._loaded_at is None or db is not self._source:
+            self._counters["cold_loads"] += 1
+            async with self._lock:
+                if self._loaded_at is None or db is not self._source:
+                    await self._load(db)
+            return self._merchants
+        if self.is_stale():
+            self._counters["stale_reads"] += 1
+            self._schedule_refresh()
+        return self._merchants
+
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_interval_s
+
+    def age_s(self) -> Optional[float]:
+        return None if self._loaded_at is None else round(time.monotonic() - self._loaded_at, 3)
+
+    def _schedule_refresh(self) -> None:
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        try:
+            self._refresh_task = asyncio.get_running_loop().create_task(self.refresh())
+        except RuntimeError:
+            self._refresh_task = None
+
+    async def refresh(self) -> None:
+        """Re-read the directory from the database it was loaded from; keeps the old list on failure."""
+        async with self._lock:
+            try:
+                await self._load(self._source)
+                self._counters["refreshes"] += 1
+            except Exception as exc:
+                self._counters["refresh_errors"] += 1
+                self._last_error = exc.__class__.__name__
+                logger.warning("merchant_directory.refresh_failed", extra={"error": self._last_error})
+
+    async def _load(self, db: Any) -> None:
+        rows = await db.fetch_all(self._QUERY, {"max_merchants": self.max_merchants})
+        merchants = {row["merchant_id"]: row["business_name"] for row in rows or []}
+        if len(merchants) >= self.max_merchants:
+            logger.warning("merchant_directory.truncated", extra={"max_merchants": self.max_merchants})
+        self._merchants = merchants
+        self._source = db
+        self._loaded_at = time.monotonic()
+        self._last_error = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "merchants": len(self._merchants),
+            "max_merchants": self.max_merchants,
+            "truncated": len(self._merchants) >= self.max_merchants,
+            "age_s": self.age_s(),
+            "stale": self.is_stale(),
+            "refresh_interval_s": self.refresh_interval_s,
+            "refreshing": self._refresh_task is not None and not self._refresh_task.done(),
+            "last_error": self._last_error,
+            **self._counters,
+        }
+
+
+# Singleton used by find_products_multi.
+merchant_directory = MerchantDirectory()
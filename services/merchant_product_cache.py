@@ -0,0 +1,239 @@
+"""
+Merchant Product Cache
+
+Bounded in-process cache of the parsed, newest-first `StandardProduct` list
+per merchant, for `get_products_hybrid` (find_products' legacy path,
+the cross-merchant fallback of find_products_multi, ...).
+
+Entries are served from memory for `ttl_s`. After that a cheap probe of the
+merchant's `max(cached_at)` (index from migration 061) revalidates them; the
+rows are re-read and re-parsed only when it moved. A request for more
+products than an entry holds reloads it, unless the entry already has every
+row of the merchant. Rows deleted from products_cache don't move
+`max(cached_at)`, so entries are reloaded unconditionally after `max_age_s`.
+
+Size is bounded by merchant count and by a memory budget, evicting least
+recently used merchants first. The budget counts the heap size of the
+hydrated products, not their JSON: a hydrated StandardProduct takes five to
+seven times the bytes of its product_data text, so each load measures a few
+products and scales its JSON size by their ratio (`estimate_heap_bytes`).
+Concurrent misses for the same merchant share one load. Cached products
+are shared between requests and must be treated as read-only.
+
+Configuration (env):
+- MERCHANT_PRODUCT_CACHE_MAX_MERCHANTS (default 256, 0 disables caching)
+- MERCHANT_PRODUCT_CACHE_MAX_MB        (default 64, MiB of hydrated products on the heap)
+- MERCHANT_PRODUCT_CACHE_TTL_S         (default 30)
+- MERCHANT_PRODUCT_CACHE_MAX_AGE_S     (default 600)
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from models.standard_product import StandardProduct
+from services.env import env_int
+
+# (products newest first, newest cached_at, approximate heap bytes, rows read)
+LoadResult = Tuple[List[StandardProduct], Any, int, int]
+Loader = Callable[[str, int], Awaitable[LoadResult]]
+Prober = Callable[[str], Awaitable[Any]]
+
+
+def approx_json_bytes(value: Any, _depth: int = 0) -> int:
+    """Rough serialized size of a decoded JSON value."""
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, dict):
+        if _depth > 8:
+            return 64
+        return 2 + sum(len(str(k)) + 4 + approx_json_bytes(v, _depth + 1) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        if _depth > 8:
+            return 64
+        return 2 + sum(approx_json_bytes(v, _depth + 1) + 1 for v in value)
+    return 8
+
+
+def approx_heap_bytes(value: Any) -> int:
+    """
+    Deep `sys.getsizeof` of a hydrated product: the object, its pydantic
+    field and extra dicts, and everything they reference, each object
+    counted once. Shared singletons and dict keys (interned by the JSON
+    decoder and shared between rows) are not counted.
+    """
+    seen = set()
+    total = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if obj is None or obj is True or obj is False or id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(k for k in obj if not isinstance(k, str))
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif not isinstance(obj, (str, bytes, int, float)):
+            for attr in ("__dict__", "__pydantic_extra__", "__pydantic_fields_set__"):
+                stack.append(getattr(obj, attr, None))
+    return total
+
+
+def estimate_heap_bytes(products: List[StandardProduct], json_bytes: List[int], samples: int = 8) -> int:
+    """
+    Heap size of `products` extrapolated from their JSON sizes: up to
+    `samples` evenly spaced products are measured with `approx_heap_bytes`
+    and their heap/JSON ratio scales the total, so a load costs a handful
+    of walks instead of one per row.
+    """
+    if not products:
+        return 0
+    step = max(1, len(products) // samples)
+    picked = range(0, len(products), step)
+    heap = sum(approx_heap_bytes(products[i]) for i in picked)
+    sampled_json = sum(json_bytes[i] for i in picked)
+    if sampled_json <= 0:
+        return heap * len(products) // len(picked)
+    return int(sum(json_bytes) * heap / sampled_json)
+
+
+@dataclass
+class _Entry:
+    products: List[StandardProduct]
+    limit: int
+    complete: bool  # the merchant has no rows beyond `products`
+    cached_at: Any
+    nbytes: int
+    loaded_at: float
+    checked_at: float
+
+    def covers(self, limit: int) -> bool:
+        return self.complete or self.limit >= limit
+
+
+class MerchantProductCache:
+    """LRU of per-merchant product lists, revalidated against `max(cached_at)`."""
+
+    def __init__(
+        self,
+        loader: Loader,
+        prober: Prober,
+        *,
+        max_merchants: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl_s: Optional[float] = None,
+        max_age_s: Optional[float] = None,
+    ):
+        self.loader = loader
+        self.prober = prober
+        self.max_merchants = (
+            env_int("MERCHANT_PRODUCT_CACHE_MAX_MERCHANTS", 256) if max_merchants is None else max_merchants
+        )
+        self.max_bytes = env_int("MERCHANT_PRODUCT_CACHE_MAX_MB", 64) * 1024 * 1024 if max_bytes is None else max_bytes
+        self.ttl_s = float(env_int("MERCHANT_PRODUCT_CACHE_TTL_S", 30)) if ttl_s is None else ttl_s
+        self.max_age_s = float(env_int("MERCHANT_PRODUCT_CACHE_MAX_AGE_S", 600)) if max_age_s is None else max_age_s
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._in_flight: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "revalidated": 0,
+            "reloaded": 0,
+            "coalesced": 0,
+            "evicted": 0,
+            "oversize": 0,
+        }
+
+    async def get(self, merchant_id: str, limit: int) -> Tuple[List[StandardProduct], str]:
+        """
+        Newest `limit` products of `merchant_id` and the outcome ("hit",
+        "revalidated", "reloaded", "miss" or "bypass"). Database errors propagate.
+        """
+        merchant_id = str(merchant_id)
+        if self.max_merchants <= 0:
+            products, *_ = await self.loader(merchant_id, limit)
+            return products, "bypass"
+
+        now = time.monotonic()
+        entry = self._entries.get(merchant_id)
+        if entry is not None and entry.covers(limit) and now - entry.loaded_at < self.max_age_s:
+            self._entries.move_to_end(merchant_id)
+            if now - entry.checked_at < self.ttl_s:
+                self._counters["hits"] += 1
+                return entry.products[:limit], "hit"
+            if await self.prober(merchant_id) == entry.cached_at:
+                entry.checked_at = time.monotonic()
+                self._counters["revalidated"] += 1
+                return entry.products[:limit], "revalidated"
+        outcome = "miss" if entry is None else "reloaded"
+
+        # A smaller entry is replaced by this load, which fetches at least as much.
+        fetch = max(limit, entry.limit) if entry is not None and not entry.complete else limit
+        products = await self._load(merchant_id, fetch)
+        self._counters["misses" if outcome == "miss" else "reloaded"] += 1
+        return products[:limit], outcome
+
+    async def _load(self, merchant_id: str, limit: int) -> List[StandardProduct]:
+        key = (merchant_id, limit)
+        task = self._in_flight.get(key)
+        if task is not None:
+            self._counters["coalesced"] += 1
+            return await asyncio.shield(task)
+        task = asyncio.ensure_future(self._load_and_store(merchant_id, limit))
+        self._in_flight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load_and_store(self, merchant_id: str, limit: int) -> List[StandardProduct]:
+        try:
+            products, cached_at, nbytes, rows_read = await self.loader(merchant_id, limit)
+        finally:
+            self._in_flight.pop((merchant_id, limit), None)
+        now = time.monotonic()
+        self._store(
+            merchant_id,
+            _Entry(products, limit, rows_read < limit, cached_at, nbytes, loaded_at=now, checked_at=now),
+        )
+        return products
+
+    def _store(self, merchant_id: str, entry: _Entry) -> None:
+        self._drop(merchant_id)
+        if entry.nbytes > self.max_bytes:
+            self._counters["oversize"] += 1
+            return
+        self._entries[merchant_id] = entry
+        self._bytes += entry.nbytes
+        while len(self._entries) > self.max_merchants or self._bytes > self.max_bytes:
+            victim, _ = next(iter(self._entries.items()))
+            self._drop(victim)
+            self._counters["evicted"] += 1
+
+    def _drop(self, merchant_id: str) -> None:
+        entry = self._entries.pop(merchant_id, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    def invalidate(self, merchant_id: Optional[str] = None) -> None:
+        if merchant_id is None:
+            self._entries.clear()
+            self._bytes = 0
+            return
+        self._drop(str(merchant_id))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "merchants": len(self._entries),
+            "max_merchants": self.max_merchants,
+            "approx_bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl_s,
+            "max_age_s": self.max_age_s,
+            **self._counters,
+        }
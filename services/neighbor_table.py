@@ -0,0 +1,437 @@
+"""
+Neighbor Table
+
+Offline item-to-item neighbors for find_similar_products. Instead of up to
+three sequential recall queries per request, `scripts/build_neighbor_table.py`
+precomputes the top-K content neighbors of every active product in
+`products_cache` and the "neighbors" similarity strategy serves them with one
+in-memory lookup.
+
+Neighbors use the same signals and recall order as the live content strategy
+(services/similarity_service.py): same product type inside the 0.7x-1.4x price
+band, then the rest of the type, then other types sharing title tokens, each
+level ranked by the content score from services/similarity_scoring.py.
+
+Layout of a table directory:
+    CURRENT                    name of the live version directory
+    <version>/meta.json        k, count, watermark (newest cached_at read), built_at
+    <version>/ids.json         product ids in row order
+    <version>/features.json    per-product content features (incremental refresh input)
+    <version>/neighbors.npy    int32 [count, k] neighbor rows, -1 padded
+    <version>/scores.npy       float32 [count, k] content scores
+Versions are written next to each other and published by atomically replacing
+`CURRENT`; readers memory-map the arrays. Incremental refreshes re-read only
+rows cached after the watermark and recompute the product types they touch.
+
+Requires NumPy; without it the strategy is unavailable and live recall is used.
+
+Configuration (env):
+- SIMILARITY_NEIGHBOR_TABLE_PATH     (unset disables the "neighbors" strategy)
+- SIMILARITY_NEIGHBOR_TABLE_RELOAD_S (default 60; how often CURRENT is re-checked)
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from db.database import database
+from models.standard_product import ProductStatus, StandardProduct, hydrate_product
+from services.env import env_int
+from services.json_columns import decode_object
+from services.similarity_scoring import TokenMatrix, content_score_array, tokenize, top_k_indices
+
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_K = 100
+SCAN_PAGE_SIZE = 5000
+KEEP_VERSIONS = 2
+
+
+@dataclass(frozen=True)
+class ProductFeatures:
+    """The content signals similarity recall looks at, per product id."""
+
+    product_id: str
+    product_type: str  # lowercased, "" when missing
+    price: Optional[float]
+    text: str  # "<title> <product_type>", tokenized like the live strategy
+    active: bool
+
+    @property
+    def tokens(self):
+        return tokenize(self.text)
+
+
+def features_from_product(product: StandardProduct) -> Optional[ProductFeatures]:
+    pid = product.product_id or product.id
+    if not pid:
+        return None
+    return ProductFeatures(
+        product_id=str(pid),
+        product_type=(product.product_type or "").lower(),
+        price=product.price,
+        text=f"{product.title} {product.product_type or ''}",
+        active=not product.status or product.status == ProductStatus.ACTIVE,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Neighbor computation
+# ---------------------------------------------------------------------------
+
+
+class _Pool:
+    def __init__(self, members: List[ProductFeatures]):
+        self.ids = [m.product_id for m in members]
+        self.matrix = TokenMatrix([m.tokens for m in members])
+        self.types = np.asarray([m.product_type for m in members], dtype=object)
+        self.prices = np.asarray([np.nan if m.price is None else m.price for m in members], dtype=np.float64)
+
+
+def compute_neighbors(
+    features: Dict[str, ProductFeatures],
+    product_ids: Iterable[str],
+    k: int = DEFAULT_K,
+) -> Dict[str, List[Tuple[str, float]]]:
+    """
+    Top-`k` `(neighbor_id, content_score)` for each of `product_ids`, in the
+    live recall order (price band, same type, broad). Only active products
+    are neighbors; inactive bases get an empty list.
+    """
+    if np is None:
+        raise RuntimeError("numpy is required to build the neighbor table")
+    active = sorted((f for f in features.values() if f.active), key=lambda f: f.product_id)
+    by_type: Dict[str, List[ProductFeatures]] = {}
+    for f in active:
+        by_type.setdefault(f.product_type, []).append(f)
+    type_pools: Dict[str, _Pool] = {}
+    broad: Optional[_Pool] = None
+
+    out: Dict[str, List[Tuple[str, float]]] = {}
+    for pid in product_ids:
+        base = features.get(pid)
+        if base is None:
+            continue
+        if not base.active:
+            out[pid] = []
+            continue
+        tokens = base.tokens
+        picked: List[Tuple[str, float]] = []
+        seen: Set[str] = {pid}
+
+        def take(ids: List[str], scores: Any, mask: Any) -> None:
+            candidates = np.flatnonzero(mask)
+            if not len(candidates):
+                return
+            order = top_k_indices(scores[candidates].tolist(), k - len(picked) + len(seen))
+            for j in order:
+                cand = ids[candidates[j]]
+                if cand in seen:
+                    continue
+                seen.add(cand)
+                picked.append((cand, round(float(scores[candidates[j]]), 3)))
+                if len(picked) >= k:
+                    return
+
+        members = by_type.get(base.product_type, [])
+        if members:
+            pool = type_pools.get(base.product_type)
+            if pool is None:
+                pool = type_pools[base.product_type] = _Pool(members)
+            bonus = 0.1 if base.product_type else 0.0
+            scores = content_score_array(pool.matrix, tokens, bonus)
+            in_band = np.zeros(len(members), dtype=bool)
+            if base.price:
+                with np.errstate(invalid="ignore"):
+                    in_band = (pool.prices >= 0.7 * base.price) & (pool.prices <= 1.4 * base.price)
+            take(pool.ids, scores, in_band)
+            if len(picked) < k:
+                take(pool.ids, scores, ~in_band)
+
+        if len(picked) < k:
+            if broad is None:
+                broad = _Pool(active)
+            scores = content_score_array(broad.matrix, tokens, 0.0)
+            take(broad.ids, scores, (broad.types != base.product_type) & (scores > 0))
+        out[pid] = picked
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Storage
+# ---------------------------------------------------------------------------
+
+
+class NeighborTable:
+    """Read-only view of one published table version (arrays memory-mapped)."""
+
+    def __init__(self, path: str, meta: Dict[str, Any], ids: List[str], neighbors: Any, scores: Any):
+        self.path = path
+        self.meta = meta
+        self.ids = ids
+        self.rows = {pid: i for i, pid in enumerate(ids)}
+        self.neighbors = neighbors
+        self.scores = scores
+
+    @classmethod
+    def open(cls, root: str) -> Optional["NeighborTable"]:
+        if np is None:
+            return None
+        version = _read_current(root)
+        if not version:
+            return None
+        path = os.path.join(root, version)
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(path, "ids.json"), "r", encoding="utf-8") as f:
+            ids = json.load(f)
+        neighbors = np.load(os.path.join(path, "neighbors.npy"), mmap_mode="r")
+        scores = np.load(os.path.join(path, "scores.npy"), mmap_mode="r")
+        return cls(path, meta, ids, neighbors, scores)
+
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self.rows
+
+    def lookup(self, product_id: str, limit: int) -> Optional[List[Tuple[str, float]]]:
+        """Neighbors of `product_id`, or None if it is not in the table."""
+        row = self.rows.get(product_id)
+        if row is None:
+            return None
+        out: List[Tuple[str, float]] = []
+        for idx, score in zip(self.neighbors[row, :limit].tolist(), self.scores[row, :limit].tolist()):
+            if idx < 0:
+                break
+            out.append((self.ids[idx], round(score, 3)))
+        return out
+
+    def load_features(self) -> Dict[str, ProductFeatures]:
+        with open(os.path.join(self.path, "features.json"), "r", encoding="utf-8") as f:
+            return {row["product_id"]: ProductFeatures(**row) for row in json.load(f)}
+
+
+def _read_current(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, "CURRENT"), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_table(
+    root: str,
+    features: Dict[str, ProductFeatures],
+    neighbors: Dict[str, List[Tuple[str, float]]],
+    k: int,
+    watermark: Optional[str],
+) -> str:
+    """Write a new version under `root` and publish it; returns the version name."""
+    ids = sorted(neighbors)
+    rows = {pid: i for i, pid in enumerate(ids)}
+    nbr = np.full((len(ids), k), -1, dtype=np.int32)
+    scr = np.zeros((len(ids), k), dtype=np.float32)
+    for pid, items in neighbors.items():
+        i = rows[pid]
+        j = 0
+        for cand, score in items[:k]:
+            if cand in rows:
+                nbr[i, j], scr[i, j] = rows[cand], score
+                j += 1
+
+    os.makedirs(root, exist_ok=True)
+    version = datetime.now(timezone.utc).strftime("v%Y%m%dT%H%M%S%fZ")
+    path = os.path.join(root, version)
+    os.makedirs(path)
+    np.save(os.path.join(path, "neighbors.npy"), nbr)
+    np.save(os.path.join(path, "scores.npy"), scr)
+    with open(os.path.join(path, "ids.json"), "w", encoding="utf-8") as f:
+        json.dump(ids, f)
+    with open(os.path.join(path, "features.json"), "w", encoding="utf-8") as f:
+        json.dump([asdict(features[pid]) for pid in sorted(features)], f)
+    meta = {
+        "version": version,
+        "k": k,
+        "count": len(ids),
+        "watermark": watermark,
+        "built_at": datetime.now(timezone.utc).isoformat(),
+    }
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    tmp = os.path.join(root, f"CURRENT.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(root, "CURRENT"))
+
+    old = sorted(d for d in os.listdir(root) if d.startswith("v") and d != version)
+    for stale in old[: max(0, len(old) - (KEEP_VERSIONS - 1))]:
+        shutil.rmtree(os.path.join(root, stale), ignore_errors=True)
+    return version
+
+
+# ---------------------------------------------------------------------------
+# Build / refresh from products_cache
+# ---------------------------------------------------------------------------
+
+
+async def scan_product_features(after: Optional[Any]) -> Tuple[Dict[str, ProductFeatures], Optional[Any]]:
+    """Features of rows cached after `after` (newest row per product wins) and the new watermark."""
+    out: Dict[str, ProductFeatures] = {}
+    cursor: Optional[Tuple[Any, Any]] = None
+    watermark = after
+    while True:
+        where = ["cached_at IS NOT NULL"]
+        params: Dict[str, Any] = {"limit": SCAN_PAGE_SIZE}
+        if after is not None:
+            where.append("cached_at > :after")
+            params["after"] = after
+        if cursor is not None:
+            where.append("(cached_at, id) > (:cursor_cached_at, :cursor_id)")
+            params["cursor_cached_at"], params["cursor_id"] = cursor
+        rows = await database.fetch_all(
+            f"""
+            SELECT id, product_data, cached_at
+            FROM products_cache
+            WHERE {' AND '.join(where)}
+            ORDER BY cached_at ASC, id ASC
+            LIMIT :limit
+            """,
+            params,
+        )
+        rows = [r if isinstance(r, dict) else dict(r) for r in rows or []]
+        for row in rows:
+            product_data = decode_object(row.get("product_data"))
+            if product_data is None:
+                continue
+            try:
+                features = features_from_product(hydrate_product(product_data))
+            except Exception:
+                continue
+            if features is not None:
+                out[features.product_id] = features
+        if rows:
+            cursor = (rows[-1]["cached_at"], rows[-1]["id"])
+            watermark = rows[-1]["cached_at"]
+        if len(rows) < SCAN_PAGE_SIZE:
+            return out, watermark
+
+
+def _watermark_str(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+async def build_table(root: str, k: int = DEFAULT_K) -> Dict[str, Any]:
+    """Full rebuild from every products_cache row."""
+    started = time.monotonic()
+    features, watermark = await scan_product_features(None)
+    neighbors = compute_neighbors(features, list(features), k)
+    version = write_table(root, features, neighbors, k, _watermark_str(watermark))
+    return {
+        "mode": "full",
+        "version": version,
+        "products": len(neighbors),
+        "recomputed": len(neighbors),
+        "elapsed_s": round(time.monotonic() - started, 3),
+    }
+
+
+async def refresh_table(root: str, k: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Incremental refresh: read rows cached after the published watermark and
+    recompute neighbors only for the products whose candidate pools changed
+    (the changed products, everything in their old and new product types, and
+    products that listed a changed product as a neighbor). Falls back to a
+    full build when no table exists yet.
+
+    Rows deleted from products_cache, and broad-level (cross-type) neighbors
+    of untouched types, only catch up on the next full build.
+    """
+    table = NeighborTable.open(root)
+    if table is None or not table.meta.get("watermark"):
+        return await build_table(root, k or DEFAULT_K)
+    started = time.monotonic()
+    k = k or int(table.meta["k"])
+    features = table.load_features()
+    after = datetime.fromisoformat(table.meta["watermark"])
+    changed, watermark = await scan_product_features(after)
+
+    touched_types: Set[str] = set()
+    for pid, new in changed.items():
+        old = features.get(pid)
+        if old is not None:
+            touched_types.add(old.product_type)
+        touched_types.add(new.product_type)
+        features[pid] = new
+
+    dirty: Set[str] = set(changed)
+    dirty.update(pid for pid, f in features.items() if f.product_type in touched_types)
+    changed_rows = {table.rows[pid] for pid in changed if pid in table.rows}
+    if changed_rows:
+        hit = np.isin(np.asarray(table.neighbors), list(changed_rows)).any(axis=1)
+        dirty.update(table.ids[i] for i in np.flatnonzero(hit).tolist())
+
+    neighbors: Dict[str, List[Tuple[str, float]]] = {}
+    for pid in features:
+        if pid not in dirty:
+            kept = table.lookup(pid, k)
+            if kept is not None:
+                neighbors[pid] = kept
+                continue
+        dirty.add(pid)
+    neighbors.update(compute_neighbors(features, sorted(dirty), k))
+    version = write_table(root, features, neighbors, k, _watermark_str(watermark) or table.meta["watermark"])
+    return {
+        "mode": "incremental",
+        "version": version,
+        "products": len(neighbors),
+        "changed": len(changed),
+        "recomputed": len(dirty),
+        "elapsed_s": round(time.monotonic() - started, 3),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Serving
+# ---------------------------------------------------------------------------
+
+
+class NeighborTableProvider:
+    """Lazily opens the configured table and picks up newly published versions."""
+
+    def __init__(self, root: Optional[str] = None, reload_s: Optional[float] = None):
+        self.root = root if root is not None else (os.getenv("SIMILARITY_NEIGHBOR_TABLE_PATH") or "").strip()
+        self.reload_s = float(env_int("SIMILARITY_NEIGHBOR_TABLE_RELOAD_S", 60)) if reload_s is None else reload_s
+        self._table: Optional[NeighborTable] = None
+        self._version: Optional[str] = None
+        self._checked_at = float("-inf")
+
+    def get(self) -> Optional[NeighborTable]:
+        if not self.root or np is None:
+            return None
+        now = time.monotonic()
+        if now - self._checked_at >= self.reload_s:
+            self._checked_at = now
+            try:
+                version = _read_current(self.root)
+                if version != self._version:
+                    self._table = NeighborTable.open(self.root) if version else None
+                    self._version = version
+            except Exception as exc:
+                logger.warning("neighbor table %s could not be opened: %s", self.root, exc)
+        return self._table
+
+
+# Singleton used by SimilarityService.
+neighbor_tables = NeighborTableProvider()
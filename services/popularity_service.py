@@ -0,0 +1,440 @@
+"""
+Popularity Service
+
+Incrementally maintained top-seller aggregates over `orders`, keyed by
+creator, merchant and product. Cold-start `find_products_multi` requests read
+the ranking from memory instead of scanning and JSON-decoding up to 800
+recent orders per request.
+
+The aggregates keep the exact semantics of the original per-request scans:
+popularity is summed item quantity over the most recent
+`CREATOR_WINDOW_ORDERS` orders of a creator (`GLOBAL_WINDOW_ORDERS` orders
+globally), ties broken by the most recent occurrence. New orders are pulled
+from a `created_at` watermark and slide the windows forward; a periodic full
+reload picks up soft deletes. A full reload pages through `orders` by
+(created_at, id), parses each page in a worker thread and keeps only the
+parsed item counts, then builds new windows (and fresh listener state) in a
+thread and swaps them in, so reads keep using the previous index meanwhile.
+Failed loads are retried once per full reload interval.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import heapq
+import json
+import logging
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Protocol, Tuple
+
+from db.database import database
+from services.env import env_flag, env_int
+from services.json_columns import decode_array
+
+logger = logging.getLogger(__name__)
+
+CREATOR_WINDOW_ORDERS = 400
+GLOBAL_WINDOW_ORDERS = 800
+
+PopularityKey = Tuple[str, str]  # (merchant_id, product_id)
+
+
+def order_item_counts(merchant_id: Any, raw_items: Any) -> List[Tuple[PopularityKey, int]]:
+    """(merchant, product) quantities of one order, in item order."""
+    if not merchant_id:
+        return []
+    raw_items = decode_array(raw_items)
+    if raw_items is None:
+        return []
+    out: List[Tuple[PopularityKey, int]] = []
+    for item in raw_items:
+        if not isinstance(item, dict):
+            continue
+        pid = str(item.get("product_id") or item.get("id") or item.get("platform_product_id") or "").strip()
+        if not pid:
+            continue
+        try:
+            qty = int(item.get("quantity") or 1)
+        except Exception:
+            qty = 1
+        out.append(((str(merchant_id), pid), max(qty, 1)))
+    return out
+
+
+class PopularityWindow:
+    """
+    Quantity counts over the last `max_orders` orders added.
+
+    Orders must be added oldest first. Ties in `top` go to the key seen in the
+    newest order (then earliest in that order), matching a `Counter` filled
+    newest-first.
+    """
+
+    def __init__(self, max_orders: int):
+        self.max_orders = max_orders
+        self._orders: Deque[List[Tuple[PopularityKey, int]]] = deque()
+        self._counts: Dict[PopularityKey, int] = {}
+        self._last_seen: Dict[PopularityKey, Tuple[int, int]] = {}
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def add(self, items: List[Tuple[PopularityKey, int]]) -> None:
+        self._seq += 1
+        for pos, (key, qty) in enumerate(items):
+            self._counts[key] = self._counts.get(key, 0) + qty
+            seen = self._last_seen.get(key)
+            if seen is None or seen[0] != self._seq:
+                self._last_seen[key] = (self._seq, pos)
+        self._orders.append(items)
+        while len(self._orders) > self.max_orders:
+            for key, qty in self._orders.popleft():
+                left = self._counts[key] - qty
+                if left > 0:
+                    self._counts[key] = left
+                else:
+                    del self._counts[key]
+                    del self._last_seen[key]
+
+    def top(self, n: int) -> List[PopularityKey]:
+        last_seen = self._last_seen
+        return heapq.nsmallest(
+            n,
+            self._counts,
+            key=lambda k: (-self._counts[k], -last_seen[k][0], last_seen[k][1]),
+        )
+
+
+class OrderListener(Protocol):
+    """Consumer of the orders stream maintained by `PopularityIndex`."""
+
+    def spawn(self) -> "OrderListener":
+        """An empty listener with the same settings; a full reload fills it off the event loop."""
+
+    def adopt(self, other: "OrderListener") -> None:
+        """Take over the state of a listener returned by `spawn` (the full-reload swap)."""
+
+    def add_order(self, items: List[Tuple[PopularityKey, int]]) -> None:
+        """One order's (merchant, product) quantities; orders arrive oldest first."""
+
+
+class _OrderRow:
+    __slots__ = ("created_at", "creators", "items", "fingerprint")
+
+    def __init__(self, row: Any, fingerprint_at: Iterable[Any] = ()):
+        if not isinstance(row, dict):
+            row = dict(row)
+        self.created_at = row.get("created_at")
+        self.creators = {str(c) for c in (row.get("creator_id"), row.get("creator_id_alt")) if c}
+        raw_items = row.get("items")
+        self.items = order_item_counts(row.get("merchant_id"), raw_items)
+        # Only orders at a watermark timestamp are ever compared by fingerprint.
+        self.fingerprint: Optional[str] = None
+        if self.created_at in fingerprint_at:
+            raw = json.dumps(
+                [str(self.created_at), row.get("merchant_id"), sorted(self.creators), raw_items],
+                sort_keys=True,
+                default=str,
+            )
+            self.fingerprint = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class _Windows:
+    """The state a full reload rebuilds; built off the event loop, then swapped in."""
+
+    def __init__(self, listeners: Iterable[OrderListener] = ()):
+        self.global_window = PopularityWindow(GLOBAL_WINDOW_ORDERS)
+        self.creators: Dict[str, PopularityWindow] = {}
+        self.listeners = list(listeners)
+        self.watermark: Any = None
+        # Orders applied at the watermark timestamp (re-read by `>=`).
+        self.watermark_fingerprints: Counter = Counter()
+        self.applied = 0
+
+    def apply(self, orders: Iterable[_OrderRow]) -> None:
+        """Slide windows forward with orders given oldest first."""
+        for order in orders:
+            self.global_window.add(order.items)
+            for creator in order.creators:
+                window = self.creators.get(creator)
+                if window is None:
+                    window = self.creators[creator] = PopularityWindow(CREATOR_WINDOW_ORDERS)
+                window.add(order.items)
+            for listener in self.listeners:
+                listener.add_order(order.items)
+            if order.created_at != self.watermark:
+                self.watermark = order.created_at
+                self.watermark_fingerprints = Counter()
+            if order.fingerprint is not None:
+                self.watermark_fingerprints[order.fingerprint] += 1
+            self.applied += 1
+
+
+def _parse_orders(rows: List[Any], fingerprint_at: Tuple[Any, ...]) -> List[_OrderRow]:
+    return [_OrderRow(r, fingerprint_at=fingerprint_at) for r in rows]
+
+
+def _build_windows(orders: List[_OrderRow], listeners: List[OrderListener]) -> _Windows:
+    """Replay parsed `orders` (newest first) oldest first into fresh windows."""
+    built = _Windows(listeners)
+    built.apply(reversed(orders))
+    return built
+
+
+class PopularityIndex:
+    """
+    Creator and global popularity windows kept fresh from the `orders` table.
+
+    Like the catalog snapshot, reads never block on the database: until the
+    first load completes (or when a creator's history predates the loaded
+    horizon) `top_keys` falls back to the original per-request scan.
+    """
+
+    def __init__(
+        self,
+        *,
+        enabled: Optional[bool] = None,
+        refresh_interval_s: Optional[float] = None,
+        full_reload_interval_s: Optional[float] = None,
+        max_orders: Optional[int] = None,
+        page_size: int = 5000,
+    ):
+        self.enabled = env_flag("POPULARITY_INDEX_ENABLED", True) if enabled is None else enabled
+        self.refresh_interval_s = (
+            float(env_int("POPULARITY_INDEX_REFRESH_S", 30)) if refresh_interval_s is None else refresh_interval_s
+        )
+        self.full_reload_interval_s = (
+            float(env_int("POPULARITY_INDEX_FULL_RELOAD_S", 1800))
+            if full_reload_interval_s is None
+            else full_reload_interval_s
+        )
+        # Most recent orders loaded on a full reload.
+        self.max_orders = env_int("POPULARITY_INDEX_MAX_ORDERS", 200000) if max_orders is None else max_orders
+        self.page_size = page_size
+
+        self._windows = _Windows()
+        # True when the last full load hit `max_orders`, i.e. older orders exist.
+        self._truncated = False
+        self._loaded = False
+        self._refreshed_at: Optional[float] = None
+        self._full_loaded_at: Optional[float] = None
+        # Last full load attempt; a failing load is retried per interval, not per read.
+        self._full_attempted_at: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._listeners: List[OrderListener] = []
+        self._counters = {
+            "full_loads": 0,
+            "incremental_refreshes": 0,
+            "orders_applied": 0,
+            "refresh_errors": 0,
+            "memory_reads": 0,
+            "scan_fallbacks": 0,
+        }
+
+    def add_listener(self, listener: "OrderListener") -> None:
+        """Feed `listener` the same order stream (oldest first) the windows see."""
+        self._listeners.append(listener)
+        self._windows.listeners.append(listener)
+
+    # ------------------------------------------------------------------ reads
+
+    @property
+    def ready(self) -> bool:
+        return self.enabled and self._loaded
+
+    def _creator_window(self, creator_id: str) -> Optional[PopularityWindow]:
+        """Creator window if it holds the creator's full recent history."""
+        window = self._windows.creators.get(creator_id)
+        if self._truncated and (window is None or len(window) < CREATOR_WINDOW_ORDERS):
+            return None
+        return window or PopularityWindow(CREATOR_WINDOW_ORDERS)
+
+    async def top_keys(self, creator_id: Optional[str], n: int) -> List[PopularityKey]:
+        """Most popular (merchant_id, product_id) pairs for a creator, or globally."""
+        if await self.ensure_fresh():
+            window = self._creator_window(creator_id) if creator_id else self._windows.global_window
+            if window is not None:
+                self._counters["memory_reads"] += 1
+                return window.top(n)
+        self._counters["scan_fallbacks"] += 1
+        return await self._scan_top_keys(creator_id, n)
+
+    async def _scan_top_keys(self, creator_id: Optional[str], n: int) -> List[PopularityKey]:
+        if creator_id:
+            rows = await database.fetch_all(
+                """
+                SELECT merchant_id, items
+                FROM orders
+                WHERE is_deleted IS NOT TRUE
+                  AND (
+                    metadata->>'creator_id' = :creator_id
+                    OR metadata->>'creatorId' = :creator_id
+                  )
+                ORDER BY created_at DESC
+                LIMIT :window
+                """,
+                {"creator_id": creator_id, "window": CREATOR_WINDOW_ORDERS},
+            )
+            window = PopularityWindow(CREATOR_WINDOW_ORDERS)
+        else:
+            rows = await database.fetch_all(
+                """
+                SELECT merchant_id, items
+                FROM orders
+                WHERE is_deleted IS NOT TRUE
+                ORDER BY created_at DESC
+                LIMIT :window
+                """,
+                {"window": GLOBAL_WINDOW_ORDERS},
+            )
+            window = PopularityWindow(GLOBAL_WINDOW_ORDERS)
+        for row in reversed(list(rows or [])):
+            if not isinstance(row, dict):
+                row = dict(row)
+            window.add(order_item_counts(row.get("merchant_id"), row.get("items")))
+        return window.top(n)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "creators": len(self._windows.creators),
+            "global_orders": len(self._windows.global_window),
+            "truncated": self._truncated,
+            "watermark": str(self._windows.watermark) if self._windows.watermark is not None else None,
+            "age_s": round(now - self._refreshed_at, 3) if self._refreshed_at is not None else None,
+            **self._counters,
+        }
+
+    # ---------------------------------------------------------------- refresh
+
+    async def ensure_fresh(self) -> bool:
+        """Schedule a background refresh if stale; return whether reads can use memory."""
+        if not self.enabled:
+            return False
+        now = time.monotonic()
+        if self._full_attempted_at is None or now - self._full_attempted_at >= self.full_reload_interval_s:
+            self._schedule_refresh(full=True)
+        elif self._loaded and (self._refreshed_at is None or now - self._refreshed_at >= self.refresh_interval_s):
+            self._schedule_refresh(full=False)
+        return self.ready
+
+    def _schedule_refresh(self, *, full: bool) -> None:
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        try:
+            self._refresh_task = asyncio.get_running_loop().create_task(self.refresh(full=full))
+        except RuntimeError:
+            self._refresh_task = None
+
+    async def refresh(self, *, full: bool = False) -> None:
+        """Rebuild from the newest `max_orders` orders, or apply orders since the watermark."""
+        async with self._lock:
+            try:
+                if full or not self._loaded:
+                    await self._full_load()
+                else:
+                    await self._incremental_refresh()
+            except Exception as exc:  # pragma: no cover - defensive
+                self._counters["refresh_errors"] += 1
+                logger.warning("popularity_index.refresh_failed", extra={"error": exc.__class__.__name__})
+
+    _SELECT = """
+        SELECT id, merchant_id, items, created_at,
+               metadata->>'creator_id' AS creator_id,
+               metadata->>'creatorId' AS creator_id_alt
+        FROM orders
+    """
+
+    async def _fetch_orders(self) -> List[_OrderRow]:
+        """Newest `max_orders` live orders, paged by (created_at, id) and parsed per page."""
+        orders: List[_OrderRow] = []
+        after: Optional[Tuple[Any, Any]] = None
+        newest: Any = None
+        while len(orders) < self.max_orders:
+            where = ["is_deleted IS NOT TRUE", "created_at IS NOT NULL"]
+            params: Dict[str, Any] = {"page_size": min(self.page_size, self.max_orders - len(orders))}
+            if after is not None:
+                where.append("(created_at, id) < (:after_created_at, :after_id)")
+                params["after_created_at"], params["after_id"] = after
+            page = await database.fetch_all(
+                self._SELECT
+                + f"""
+                WHERE {' AND '.join(where)}
+                ORDER BY created_at DESC, id DESC
+                LIMIT :page_size
+                """,
+                params,
+            )
+            page = [r if isinstance(r, dict) else dict(r) for r in page or []]
+            if not page:
+                break
+            if newest is None:
+                newest = page[0].get("created_at")
+            # Keep only the parsed item counts; the raw items JSON is dropped per page.
+            orders.extend(await asyncio.to_thread(_parse_orders, page, (newest,)))
+            if len(page) < params["page_size"]:
+                break
+            after = (page[-1].get("created_at"), page[-1].get("id"))
+        return orders
+
+    async def _full_load(self) -> None:
+        self._full_attempted_at = time.monotonic()
+        orders = await self._fetch_orders()
+        # Replaying 200k orders is CPU-bound: build new windows and listener
+        # state in a thread, then swap them in while nothing else can run.
+        spawned = [listener.spawn() for listener in self._listeners]
+        built = await asyncio.to_thread(_build_windows, orders, spawned)
+        for listener, fresh in zip(self._listeners, spawned):
+            listener.adopt(fresh)
+        built.listeners = list(self._listeners)
+        self._windows = built
+        self._truncated = len(orders) >= self.max_orders
+        self._counters["orders_applied"] += built.applied
+
+        now = time.monotonic()
+        self._loaded = True
+        self._full_loaded_at = now
+        self._refreshed_at = now
+        self._counters["full_loads"] += 1
+
+    async def _incremental_refresh(self) -> None:
+        windows = self._windows
+        if windows.watermark is None:
+            await self._full_load()
+            return
+        rows = await database.fetch_all(
+            self._SELECT
+            + """
+            WHERE is_deleted IS NOT TRUE AND created_at >= :since
+            ORDER BY created_at ASC
+            LIMIT :page_size
+            """,
+            {"since": windows.watermark, "page_size": self.page_size},
+        )
+        rows = list(rows or [])
+        if len(rows) >= self.page_size:
+            # Too far behind to catch up incrementally.
+            await self._full_load()
+            return
+        newest = (rows[-1] if isinstance(rows[-1], dict) else dict(rows[-1])).get("created_at") if rows else None
+        already_applied = Counter(windows.watermark_fingerprints)
+        fresh: List[_OrderRow] = []
+        for order in (_OrderRow(r, fingerprint_at=(windows.watermark, newest)) for r in rows):
+            if order.created_at == windows.watermark and already_applied[order.fingerprint] > 0:
+                already_applied[order.fingerprint] -= 1
+                continue
+            fresh.append(order)
+        applied = windows.applied
+        windows.apply(fresh)
+        self._counters["orders_applied"] += windows.applied - applied
+        self._refreshed_at = time.monotonic()
+        self._counters["incremental_refreshes"] += 1
+
+
+# Singleton used by routes.
+popularity_index = PopularityIndex()
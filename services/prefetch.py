@@ -0,0 +1,102 @@
+"""
+Prefetch Graph
+
+Runs a handler's independent data loads concurrently. Each named branch
+starts as soon as the branches it depends on have finished and receives their
+results as keyword arguments.
+
+A branch with a `fallback` is optional: if it fails or exceeds its timeout,
+the fallback value is used and the rest of the graph carries on. A branch
+without one is required, and its error is raised from `run()` (pending
+branches are cancelled). Per-branch timings are kept for response metadata.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+_REQUIRED = object()
+
+
+@dataclass
+class _Branch:
+    load: Callable[..., Awaitable[Any]]
+    after: Tuple[str, ...]
+    timeout_s: Optional[float]
+    fallback: Any
+
+
+class PrefetchGraph:
+    """A small async dependency graph of named loads."""
+
+    def __init__(self) -> None:
+        self._branches: Dict[str, _Branch] = {}
+        self.timings: Dict[str, Dict[str, Any]] = {}
+
+    def add(
+        self,
+        name: str,
+        load: Callable[..., Awaitable[Any]],
+        *,
+        after: Tuple[str, ...] = (),
+        timeout_s: Optional[float] = None,
+        fallback: Any = _REQUIRED,
+    ) -> None:
+        """
+        Register `load`; it is called with the results of `after` (which must
+        already be registered) as keyword arguments. `timeout_s` of None or
+        <= 0 means no timeout.
+        """
+        for dep in after:
+            if dep not in self._branches:
+                raise ValueError(f"prefetch branch {name!r} depends on unknown branch {dep!r}")
+        self._branches[name] = _Branch(load, tuple(after), timeout_s if timeout_s and timeout_s > 0 else None, fallback)
+
+    async def run(self) -> Dict[str, Any]:
+        """Run every branch; returns results by name."""
+        started = time.perf_counter()
+        tasks: Dict[str, asyncio.Future] = {}
+
+        async def run_branch(name: str, branch: _Branch) -> Any:
+            deps = {dep: await tasks[dep] for dep in branch.after}
+            branch_started = time.perf_counter()
+            status = "ok"
+            try:
+                if branch.timeout_s is None:
+                    return await branch.load(**deps)
+                return await asyncio.wait_for(branch.load(**deps), branch.timeout_s)
+            except asyncio.CancelledError:
+                status = "cancelled"
+                raise
+            except asyncio.TimeoutError:
+                status = "timeout"
+                if branch.fallback is _REQUIRED:
+                    raise
+                return branch.fallback
+            except Exception:
+                status = "error"
+                if branch.fallback is _REQUIRED:
+                    raise
+                return branch.fallback
+            finally:
+                now = time.perf_counter()
+                self.timings[name] = {
+                    "start_ms": round((branch_started - started) * 1000.0, 3),
+                    "ms": round((now - branch_started) * 1000.0, 3),
+                    "status": status,
+                }
+
+        for name, branch in self._branches.items():
+            tasks[name] = asyncio.ensure_future(run_branch(name, branch))
+        try:
+            results = await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+            # Let cancelled branches finish so none outlives the request.
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return dict(zip(tasks, results))
@@ -0,0 +1,146 @@
+"""
+Product Detail Cache
+
+Point lookups of a single `(merchant_id, product_id)` for `get_product_detail`,
+backed by a bounded LRU of hydrated `StandardProduct`s.
+
+Entries are served from memory for `ttl_s`; after that a cached_at-only probe
+revalidates them, and the product row is re-read and re-parsed only when its
+`cached_at` changed. Misses are cached too, so repeated lookups of an unknown
+product cost one query per `ttl_s` (a product created meanwhile shows up once
+the negative entry expires). Cached products are shared between requests and
+must be treated as read-only.
+
+Every match arm is indexed: data_product_id and platform_product_id
+(migration 060) and (merchant_id, product_data->>'id') (migration 062), so
+the lookup is one point read.
+
+Configuration (env):
+- PRODUCT_DETAIL_CACHE_MAX_ENTRIES (default 5000, 0 disables caching)
+- PRODUCT_DETAIL_CACHE_TTL_S       (default 60)
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from db.database import database
+from models.standard_product import StandardProduct, hydrate_product
+from services.env import env_int
+from services.json_columns import decode_object
+
+# Each arm has its own index (migrations 060 and 062); the newest match wins.
+_ID_MATCH = "(data_product_id = :pid OR platform_product_id = :pid OR product_data->>'id' = :pid)"
+
+
+@dataclass
+class _Entry:
+    product: Optional[StandardProduct]  # None: cached "not found"
+    cached_at: Any
+    checked_at: float
+
+
+class ProductDetailCache:
+    """LRU + TTL cache of single products, revalidated against `cached_at`."""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_s: Optional[float] = None):
+        self.max_entries = env_int("PRODUCT_DETAIL_CACHE_MAX_ENTRIES", 5000) if max_entries is None else max_entries
+        self.ttl_s = float(env_int("PRODUCT_DETAIL_CACHE_TTL_S", 60)) if ttl_s is None else ttl_s
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._counters = {"hits": 0, "misses": 0, "revalidated": 0, "reloaded": 0, "not_found": 0, "negative_hits": 0}
+
+    async def get(self, merchant_id: str, product_id: str) -> Tuple[Optional[StandardProduct], str]:
+        """
+        Return `(product, outcome)`; outcome is one of "hit", "revalidated",
+        "reloaded", "miss" or "not_found". Database errors propagate.
+        """
+        key = (str(merchant_id), str(product_id))
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry.product is None:
+            if now - entry.checked_at < self.ttl_s:
+                self._entries.move_to_end(key)
+                self._counters["negative_hits"] += 1
+                return None, "not_found"
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            if now - entry.checked_at < self.ttl_s:
+                self._counters["hits"] += 1
+                return entry.product, "hit"
+            current = await self._fetch(key, cached_at_only=True)
+            if current is not None and current[1] == entry.cached_at:
+                entry.checked_at = now
+                self._counters["revalidated"] += 1
+                return entry.product, "revalidated"
+            outcome = "reloaded"
+        else:
+            outcome = "miss"
+
+        row = await self._fetch(key, cached_at_only=False)
+        product = self._parse(row[0], key[0]) if row is not None else None
+        if product is None:
+            self._remember(key, _Entry(None, None, now))
+            self._counters["not_found"] += 1
+            return None, "not_found"
+        self._counters["misses" if outcome == "miss" else "reloaded"] += 1
+        self._remember(key, _Entry(product, row[1], now))
+        return product, outcome
+
+    def invalidate(self, merchant_id: str, product_id: Optional[str] = None) -> None:
+        if product_id is not None:
+            self._entries.pop((str(merchant_id), str(product_id)), None)
+            return
+        for key in [k for k in self._entries if k[0] == str(merchant_id)]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "ttl_s": self.ttl_s, **self._counters}
+
+    def _remember(self, key: Tuple[str, str], entry: _Entry) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _fetch(self, key: Tuple[str, str], *, cached_at_only: bool) -> Optional[Tuple[Any, Any]]:
+        columns = "cached_at" if cached_at_only else "product_data, cached_at"
+        row = await database.fetch_one(
+            f"""
+            SELECT {columns}
+            FROM products_cache
+            WHERE merchant_id = :merchant_id
+              AND {_ID_MATCH}
+            ORDER BY cached_at DESC
+            LIMIT 1
+            """,
+            {"merchant_id": key[0], "pid": key[1]},
+        )
+        if not row:
+            return None
+        row = row if isinstance(row, dict) else dict(row)
+        return (None if cached_at_only else row.get("product_data")), row.get("cached_at")
+
+    @staticmethod
+    def _parse(product_data: Any, merchant_id: str) -> Optional[StandardProduct]:
+        product_data = decode_object(product_data)
+        if product_data is None:
+            return None
+        try:
+            product = hydrate_product(product_data)
+        except Exception:
+            return None
+        if not product.merchant_id:
+            product.merchant_id = merchant_id
+        return product
+
+
+# Singleton used by routes.
+product_detail_cache = ProductDetailCache()
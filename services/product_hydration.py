@@ -0,0 +1,211 @@
+"""
+Product Hydration
+
+Batched `products_cache` lookups: resolve many product references with one
+query instead of one `fetch_one` per product. IN lists are capped at
+`PRODUCT_HYDRATION_MAX_IN_LIST` ids (default 200) per query so large requests
+become a few bounded queries rather than one unbounded statement.
+
+Product-id filters use the indexed `data_product_id` generated column
+(migration 060) rather than `product_data->>'product_id'`.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, TypeVar
+
+from db.database import database
+from models.standard_product import StandardProduct, hydrate_product
+from services.env import env_int
+from services.json_columns import decode_object
+
+logger = logging.getLogger(__name__)
+
+MerchantProductKey = Tuple[str, str]
+
+T = TypeVar("T")
+
+
+def _max_in_list() -> int:
+    return max(1, env_int("PRODUCT_HYDRATION_MAX_IN_LIST", 200))
+
+
+def _chunks(values: Sequence[T], size: int) -> Iterator[Sequence[T]]:
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def _unique(values: Sequence[T]) -> List[T]:
+    return list(dict.fromkeys(values))
+
+
+def _placeholders(prefix: str, values: Sequence[str], params: Dict[str, Any]) -> str:
+    names = []
+    for i, value in enumerate(values):
+        name = f"{prefix}{i}"
+        params[name] = value
+        names.append(f":{name}")
+    return ",".join(names)
+
+
+def _as_dict(row: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(row, dict):
+        return row
+    try:
+        return dict(row)
+    except Exception:
+        return None
+
+
+def _row_product_data(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    return decode_object(row.get("product_data"))
+
+
+async def _load_merchant_chunk(
+    keys: Sequence[MerchantProductKey],
+) -> Dict[MerchantProductKey, StandardProduct]:
+    wanted = set(keys)
+    params: Dict[str, Any] = {}
+    merchants = _placeholders("m", sorted({m for m, _ in wanted}), params)
+    pids = _placeholders("p", sorted({p for _, p in wanted}), params)
+    rows = await database.fetch_all(
+        f"""
+        SELECT merchant_id, platform_product_id, product_data, cached_at
+        FROM products_cache
+        WHERE merchant_id IN ({merchants})
+          AND (
+            platform_product_id IN ({pids})
+            OR product_data->>'id' IN ({pids})
+            OR data_product_id IN ({pids})
+          )
+        ORDER BY cached_at DESC
+        """,
+        params,
+    )
+
+    out: Dict[MerchantProductKey, StandardProduct] = {}
+    # Only the newest row per key counts, even if it fails to parse.
+    resolved: Set[MerchantProductKey] = set()
+    for raw in rows or []:
+        row = _as_dict(raw)
+        if row is None:
+            continue
+        merchant_id = str(row.get("merchant_id") or "")
+        product_data = _row_product_data(row)
+        if not merchant_id or product_data is None:
+            continue
+        matched: List[MerchantProductKey] = []
+        for pid in (row.get("platform_product_id"), product_data.get("id"), product_data.get("product_id")):
+            key = (merchant_id, str(pid or ""))
+            if key in wanted and key not in resolved and key not in matched:
+                matched.append(key)
+        if not matched:
+            continue
+        resolved.update(matched)
+        try:
+            product = hydrate_product(product_data)
+        except Exception:
+            continue
+        product.merchant_id = merchant_id
+        for key in matched:
+            out[key] = product
+    return out
+
+
+async def load_merchant_products(
+    keys: Sequence[MerchantProductKey],
+) -> Dict[MerchantProductKey, StandardProduct]:
+    """
+    Hydrate `(merchant_id, product_id)` pairs, one query per bounded chunk.
+
+    A pair matches a row of that merchant whose `platform_product_id`,
+    `product_data.id` or `product_data.product_id` equals the product id; the
+    most recently cached match wins. Missing or unparsable products are
+    simply absent from the result.
+    """
+    wanted = _unique([(str(m), str(p)) for m, p in keys if m and p])
+    out: Dict[MerchantProductKey, StandardProduct] = {}
+    for chunk in _chunks(wanted, _max_in_list()):
+        out.update(await _load_merchant_chunk(chunk))
+    return out
+
+
+async def load_merchant_products_ordered(
+    keys: Sequence[MerchantProductKey],
+    limit: Optional[int] = None,
+) -> List[StandardProduct]:
+    """
+    Products for `keys` in the given (e.g. popularity) order, skipping misses.
+
+    Chunks are hydrated lazily, so once `limit` products are found the
+    remaining keys are never queried.
+    """
+    wanted = _unique([(str(m), str(p)) for m, p in keys if m and p])
+    products: List[StandardProduct] = []
+    for chunk in _chunks(wanted, _max_in_list()):
+        hydrated = await _load_merchant_chunk(chunk)
+        for key in chunk:
+            product = hydrated.get(key)
+            if product is None:
+                continue
+            products.append(product)
+            if limit is not None and len(products) >= limit:
+                return products
+    return products
+
+
+async def load_products_by_ids(product_ids: Sequence[str]) -> Dict[str, StandardProduct]:
+    """
+    Hydrate products by id across merchants, keyed by the requested id.
+
+    An id matches `product_data.product_id` or, failing that,
+    `platform_product_id`; among several matches the most recently cached row
+    wins.
+    """
+    wanted = _unique([str(pid) for pid in product_ids if pid])
+    out: Dict[str, StandardProduct] = {}
+    for chunk in _chunks(wanted, _max_in_list()):
+        params: Dict[str, Any] = {}
+        pids = _placeholders("pid", chunk, params)
+        rows = await database.fetch_all(
+            f"""
+            SELECT merchant_id, platform_product_id, product_data, cached_at
+            FROM products_cache
+            WHERE data_product_id IN ({pids})
+               OR platform_product_id IN ({pids})
+            ORDER BY cached_at DESC
+            """,
+            params,
+        )
+        by_product_id: Dict[str, Tuple[Dict[str, Any], str]] = {}
+        by_platform_id: Dict[str, Tuple[Dict[str, Any], str]] = {}
+        for raw in rows or []:
+            row = _as_dict(raw)
+            if row is None:
+                continue
+            product_data = _row_product_data(row)
+            if product_data is None:
+                continue
+            merchant_id = str(row.get("merchant_id") or "")
+            by_product_id.setdefault(str(product_data.get("product_id") or ""), (product_data, merchant_id))
+            by_platform_id.setdefault(str(row.get("platform_product_id") or ""), (product_data, merchant_id))
+        for pid in chunk:
+            hit = by_product_id.get(pid) or by_platform_id.get(pid)
+            if hit is None:
+                continue
+            product_data, merchant_id = hit
+            try:
+                product = hydrate_product(product_data)
+            except Exception:
+                continue
+            if merchant_id and not product.merchant_id:
+                product.merchant_id = merchant_id
+            out[pid] = product
+    return out
+
+
+async def load_product_by_id(product_id: str) -> Optional[StandardProduct]:
+    """Single-id convenience wrapper around `load_products_by_ids`."""
+    if not product_id:
+        return None
+    return (await load_products_by_ids([product_id])).get(str(product_id))
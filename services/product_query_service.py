@@ -1,10 +1,17 @@
 from __future__ import annotations
 
+import base64
+import hashlib
 import json
-from typing import Any, List, Optional, Tuple
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
 
-from db.database import database
-from models.standard_product import StandardProduct
+from db.database import database, is_null_database
+from models.standard_product import StandardProduct, hydrate_product
+from services.json_columns import decode_object
+from services.merchant_product_cache import LoadResult, MerchantProductCache, approx_json_bytes, estimate_heap_bytes
 
 
 async def get_products_hybrid(
@@ -18,41 +25,331 @@ async def get_products_hybrid(
     Best-effort product fetch for the Python Shopping Gateway routes.
 
     This implementation intentionally stays minimal:
-    - Prefer cache reads from `products_cache` when DB is available.
+    - Prefer cache reads from `products_cache` when DB is available, through
+      the per-merchant `merchant_product_cache` (parsed lists revalidated
+      against the merchant's newest `cached_at`).
     - If DB isn't configured/connected, return an empty list with an error note.
+
+    Returned products may be shared with other callers; treat them as read-only.
     """
     _ = agent_id
     _ = background_tasks
 
+    try:
+        if is_null_database(database):
+            products, *_ = await _load_merchant_products(merchant_id, limit)
+        else:
+            products, _outcome = await merchant_product_cache.get(merchant_id, limit)
+    except Exception as e:
+        return [], "cache", f"DB unavailable: {e.__class__.__name__}"
+    return products, "cache", None
+
+
+async def _load_merchant_products(merchant_id: str, limit: int) -> LoadResult:
     query = """
-        SELECT product_data
+        SELECT product_data, cached_at
         FROM products_cache
         WHERE merchant_id = :merchant_id
         ORDER BY cached_at DESC
         LIMIT :limit
     """
-    try:
-        rows = await database.fetch_all(query, {"merchant_id": merchant_id, "limit": limit})
-    except Exception as e:
-        return [], "cache", f"DB unavailable: {e.__class__.__name__}"
+    rows = await database.fetch_all(query, {"merchant_id": merchant_id, "limit": limit})
 
     products: List[StandardProduct] = []
+    newest = None
+    json_bytes: List[int] = []
     for row in rows or []:
-        pdata = row.get("product_data") if isinstance(row, dict) else None
-        if isinstance(pdata, str):
-            try:
-                pdata = json.loads(pdata)
-            except Exception:
-                continue
-        if not isinstance(pdata, dict):
+        if not isinstance(row, dict):
+            continue
+        if newest is None:
+            newest = row.get("cached_at")
+        raw = row.get("product_data")
+        pdata = decode_object(raw)
+        if pdata is None:
             continue
         try:
-            p = StandardProduct(**pdata)
+            p = hydrate_product(pdata)
             if not p.merchant_id:
                 p.merchant_id = merchant_id
             products.append(p)
         except Exception:
             continue
+        json_bytes.append(len(raw) if isinstance(raw, (str, bytes)) else approx_json_bytes(pdata))
 
-    return products, "cache", None
+    return products, newest, estimate_heap_bytes(products, json_bytes), len(rows or [])
+
+
+async def _newest_cached_at(merchant_id: str) -> Any:
+    row = await database.fetch_one(
+        "SELECT max(cached_at) AS cached_at FROM products_cache WHERE merchant_id = :merchant_id",
+        {"merchant_id": merchant_id},
+    )
+    if not row:
+        return None
+    return (row if isinstance(row, dict) else dict(row)).get("cached_at")
+
+
+# Shared by every get_products_hybrid caller.
+merchant_product_cache = MerchantProductCache(_load_merchant_products, _newest_cached_at)
+
+
+# ---------------------------------------------------------------------------
+# Keyset pagination
+# ---------------------------------------------------------------------------
+
+# `total` is an exact count up to this many matches, then reported as capped.
+TOTAL_COUNT_CAP = 10000
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded or belongs to another query."""
+
+
+@dataclass
+class ProductPage:
+    products: List[StandardProduct]
+    next_cursor: Optional[str]
+    total: int
+    total_capped: bool
+    source: str = "cache"
+
+
+def _like_pattern(text: str) -> str:
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+# Text and category predicates match the trigram expression indexes from
+# migration 037 verbatim (gin_trgm serves `LIKE '%...%'`; a btree column does
+# not); price uses the generated data_price column from migration 060.
+_TYPE_COLUMN = "lower(coalesce(product_data->>'product_type', ''))"
+_TEXT_COLUMNS = (
+    "lower(coalesce(product_data->>'title', ''))",
+    "lower(coalesce(product_data->>'description', ''))",
+    _TYPE_COLUMN,
+)
+
+
+@dataclass(frozen=True)
+class ProductFilter:
+    """
+    find_products predicates, renderable as SQL or evaluated in Python.
+
+    `sql()` is what normally runs; `matches()` keeps identical semantics for
+    the in-memory fallback (no database configured, or the SQL path failed).
+    """
+
+    query: str = ""
+    category: Optional[str] = None
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+
+    @classmethod
+    def build(
+        cls,
+        query: Optional[str] = "",
+        category: Optional[str] = None,
+        price_min: Optional[float] = None,
+        price_max: Optional[float] = None,
+    ) -> "ProductFilter":
+        return cls(
+            query=(query or "").strip().lower(),
+            category=(category or "").strip().lower() or None,
+            price_min=price_min,
+            price_max=price_max,
+        )
+
+    def sql(self, merchant_id: str) -> Tuple[str, Dict[str, Any]]:
+        where = ["merchant_id = :merchant_id", "cached_at IS NOT NULL"]
+        params: Dict[str, Any] = {"merchant_id": merchant_id}
+        if self.query:
+            where.append("(" + " OR ".join(f"{col} LIKE :q_like" for col in _TEXT_COLUMNS) + ")")
+            params["q_like"] = _like_pattern(self.query)
+        if self.category:
+            where.append(f"{_TYPE_COLUMN} LIKE :cat_like")
+            params["cat_like"] = _like_pattern(self.category)
+        if self.price_min is not None:
+            where.append("data_price >= :price_min")
+            params["price_min"] = self.price_min
+        if self.price_max is not None:
+            where.append("data_price <= :price_max")
+            params["price_max"] = self.price_max
+        return " AND ".join(where), params
+
+    def matches(self, product: StandardProduct) -> bool:
+        if self.query:
+            fields = (product.title, product.description, product.product_type)
+            if not any(self.query in (value or "").lower() for value in fields):
+                return False
+        if self.category and self.category not in (product.product_type or "").lower():
+            return False
+        if self.price_min is not None and not product.price >= self.price_min:
+            return False
+        if self.price_max is not None and not product.price <= self.price_max:
+            return False
+        return True
+
+    def fingerprint(self, merchant_id: str) -> str:
+        raw = json.dumps([merchant_id, self.query, self.category, self.price_min, self.price_max], default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def filter_products(products: List[StandardProduct], product_filter: ProductFilter) -> List[StandardProduct]:
+    """Python-side equivalent of the SQL predicates, for fallback paths."""
+    return [p for p in products if product_filter.matches(p)]
+
+
+# The in-memory path can only see this many of a merchant's newest products.
+IN_MEMORY_SCAN_CAP = 500
+
+
+async def _page_in_memory(
+    merchant_id: str, limit: int, offset: int, product_filter: ProductFilter
+) -> ProductPage:
+    products, source, _ = await get_products_hybrid(
+        merchant_id=merchant_id, limit=IN_MEMORY_SCAN_CAP, agent_id="find_products"
+    )
+    filtered = filter_products(products, product_filter)
+    return ProductPage(
+        products=filtered[offset : offset + limit],
+        next_cursor=None,
+        total=len(filtered),
+        total_capped=len(products) >= IN_MEMORY_SCAN_CAP,
+        source=source,
+    )
+
+
+# SQL type the keyset predicate casts the cursor's row id back to, keyed by the
+# kind recorded in the cursor. Ids travel as strings so any key type encodes.
+_CURSOR_ID_TYPES = {"int": "bigint", "uuid": "uuid", "str": "text"}
+
+
+def _cursor_id_kind(row_id: Any) -> str:
+    if isinstance(row_id, int) and not isinstance(row_id, bool):
+        return "int"
+    if isinstance(row_id, uuid.UUID):
+        return "uuid"
+    return "str"
+
+
+def encode_cursor(cached_at: Any, row_id: Any, total: int, total_capped: bool, fingerprint: str) -> str:
+    if isinstance(cached_at, datetime):
+        cached_at = cached_at.isoformat()
+    doc = {
+        "c": cached_at,
+        "i": str(row_id),
+        "k": _cursor_id_kind(row_id),
+        "t": total,
+        "tc": total_capped,
+        "f": fingerprint,
+    }
+    raw = json.dumps(doc, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        doc = json.loads(raw)
+        cached_at = datetime.fromisoformat(doc["c"]) if isinstance(doc["c"], str) else doc["c"]
+        doc["c"] = cached_at
+        doc["i"] = str(doc["i"])
+    except Exception as exc:
+        raise InvalidCursor("malformed cursor") from exc
+    if doc.get("k") not in _CURSOR_ID_TYPES:
+        raise InvalidCursor("malformed cursor")
+    if doc.get("f") != fingerprint:
+        raise InvalidCursor("cursor does not match the current filters")
+    return doc
+
+
+async def get_products_page(
+    *,
+    merchant_id: str,
+    limit: int,
+    query: str = "",
+    category: Optional[str] = None,
+    price_min: Optional[float] = None,
+    price_max: Optional[float] = None,
+    cursor: Optional[str] = None,
+    offset: int = 0,
+) -> ProductPage:
+    """
+    One page of a merchant's products, newest first, filtered in SQL.
+
+    Pages are addressed by an opaque keyset cursor over (cached_at, id), so
+    page N costs the same as page 1. `offset` is only honoured without a
+    cursor (legacy page-number requests). `total` is counted once on the first
+    page (capped at TOTAL_COUNT_CAP) and carried forward in the cursor.
+    Database errors propagate; InvalidCursor signals a bad cursor.
+
+    Predicates come from ProductFilter.sql(); the keyset order is served by
+    idx_products_cache_merchant_recent (migration 061). Without a configured
+    database the page is produced by filter_products() over the legacy
+    newest-first read instead.
+    """
+    product_filter = ProductFilter.build(query, category, price_min, price_max)
+    if is_null_database(database):
+        return await _page_in_memory(merchant_id, limit, offset, product_filter)
+    fingerprint = product_filter.fingerprint(merchant_id)
+    filter_sql, params = product_filter.sql(merchant_id)
+
+    state = decode_cursor(cursor, fingerprint) if cursor else None
+    if state is not None:
+        total, total_capped = int(state["t"]), bool(state["tc"])
+    else:
+        count_row = await database.fetch_one(
+            f"""
+            SELECT COUNT(*) AS n FROM (
+                SELECT 1 FROM products_cache WHERE {filter_sql} LIMIT :count_cap
+            ) AS matched
+            """,
+            {**params, "count_cap": TOTAL_COUNT_CAP + 1},
+        )
+        counted = int((dict(count_row) if count_row else {}).get("n") or 0)
+        total, total_capped = min(counted, TOTAL_COUNT_CAP), counted > TOTAL_COUNT_CAP
+
+    page_where = filter_sql
+    page_params: Dict[str, Any] = {**params, "limit": limit + 1}
+    offset_sql = ""
+    if state is not None:
+        id_type = _CURSOR_ID_TYPES[state["k"]]
+        page_where += f" AND (cached_at, id) < (:after_cached_at, CAST(:after_id AS {id_type}))"
+        page_params["after_cached_at"], page_params["after_id"] = state["c"], state["i"]
+    elif offset > 0:
+        offset_sql = "OFFSET :offset"
+        page_params["offset"] = offset
+
+    rows = await database.fetch_all(
+        f"""
+        SELECT id, product_data, cached_at
+        FROM products_cache
+        WHERE {page_where}
+        ORDER BY cached_at DESC, id DESC
+        LIMIT :limit {offset_sql}
+        """,
+        page_params,
+    )
+    rows = [r if isinstance(r, dict) else dict(r) for r in rows or []]
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    products: List[StandardProduct] = []
+    for row in rows:
+        pdata = row.get("product_data")
+        pdata = decode_object(pdata)
+        if pdata is None:
+            continue
+        try:
+            p = hydrate_product(pdata)
+        except Exception:
+            continue
+        if not p.merchant_id:
+            p.merchant_id = merchant_id
+        products.append(p)
 
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(last["cached_at"], last["id"], total, total_capped, fingerprint)
+    return ProductPage(products=products, next_cursor=next_cursor, total=total, total_capped=total_capped)
@@ -0,0 +1,218 @@
+"""
+Similarity Scoring
+
+Batch scoring for find_similar_products. Candidates are scored as arrays
+instead of one Python set operation per product:
+
+- token sets become a sparse row matrix (CSR-style `indices`/`row_ids` over a
+  per-batch vocabulary), so Jaccard / query overlap against one reference set
+  is a membership gather plus a `bincount`;
+- price proximity, merchant match and the weighted final score are
+  element-wise array ops;
+- top-k uses `argpartition` with a stable tie-break (a plain sort for small
+  batches); it is shared with the gateway's page ranking.
+
+Scores are bit-for-bit those of the per-candidate code this replaces (same
+float operations in the same order, Python `round`), so rankings don't move.
+The vocabulary is exact rather than feature-hashed for the same reason: hash
+collisions would change Jaccard values.
+
+NumPy is optional; without it every function falls back to the equivalent
+pure-Python loop.
+"""
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence
+
+try:
+    import numpy as np  # type: ignore
+except Exception:
+    np = None  # type: ignore
+
+_TOKEN_SPLIT = re.compile(r"[^a-z0-9]+")
+
+
+@lru_cache(maxsize=65536)
+def tokenize(text: str) -> FrozenSet[str]:
+    """Lowercased alphanumeric tokens longer than two characters (cached per text)."""
+    return frozenset(t for t in _TOKEN_SPLIT.split(text.lower()) if len(t) > 2)
+
+
+class TokenMatrix:
+    """Sparse 0/1 rows of token sets over a vocabulary built from the batch."""
+
+    def __init__(self, rows: Sequence[Iterable[str]]):
+        self.n_rows = len(rows)
+        vocab: Dict[str, int] = {}
+        indices: List[int] = []
+        row_ids: List[int] = []
+        lengths: List[int] = []
+        for row_id, tokens in enumerate(rows):
+            count = 0
+            for token in tokens:
+                indices.append(vocab.setdefault(token, len(vocab)))
+                row_ids.append(row_id)
+                count += 1
+            lengths.append(count)
+        self.vocab = vocab
+        if np is not None:
+            self.indices = np.asarray(indices, dtype=np.int64)
+            self.row_ids = np.asarray(row_ids, dtype=np.int64)
+            self.lengths = np.asarray(lengths, dtype=np.int64)
+        else:
+            self.indices, self.row_ids, self.lengths = indices, row_ids, lengths
+
+    def overlap(self, reference: Iterable[str]) -> Any:
+        """Per row, how many of its tokens are in `reference`."""
+        hits = [self.vocab[t] for t in set(reference) if t in self.vocab]
+        if np is None:
+            member = set(hits)
+            counts = [0] * self.n_rows
+            for idx, row in zip(self.indices, self.row_ids):
+                if idx in member:
+                    counts[row] += 1
+            return counts
+        in_reference = np.zeros(len(self.vocab), dtype=np.float64)
+        in_reference[hits] = 1.0
+        weights = in_reference[self.indices] if len(self.indices) else np.zeros(0)
+        return np.bincount(self.row_ids, weights=weights, minlength=self.n_rows)
+
+
+def content_scores(
+    base_tokens: FrozenSet[str],
+    base_type: str,
+    candidate_tokens: Sequence[FrozenSet[str]],
+    candidate_types: Sequence[Optional[str]],
+) -> List[float]:
+    """
+    Content similarity per candidate: token Jaccard against the base, +0.1
+    for the same product type, capped at 1 and rounded to 3 places.
+    """
+    if not candidate_tokens:
+        return []
+    base_type = (base_type or "").lower()
+    same_type = [bool(base_type and t and t.lower() == base_type) for t in candidate_types]
+    matrix = TokenMatrix(candidate_tokens)
+    if np is None:
+        overlap = matrix.overlap(base_tokens)
+        out = []
+        for ov, length, same in zip(overlap, matrix.lengths, same_type):
+            score = ov / max(len(base_tokens) + length - ov, 1) + (0.1 if same else 0.0)
+            out.append(round(min(1.0, score), 3))
+        return out
+    scores = content_score_array(matrix, base_tokens, np.where(same_type, 0.1, 0.0))
+    return [round(v, 3) for v in scores.tolist()]
+
+
+def content_score_array(matrix: TokenMatrix, base_tokens: FrozenSet[str], type_bonus: Any) -> Any:
+    """
+    Unrounded `content_scores` over a prebuilt matrix (NumPy only), for
+    scoring many bases against one candidate pool; `type_bonus` is 0.1 where
+    the candidate shares the base's product type, else 0.
+    """
+    overlap = matrix.overlap(base_tokens)
+    union = np.maximum(len(base_tokens) + matrix.lengths - overlap, 1)
+    return np.minimum(1.0, overlap / union + type_bonus)
+
+
+def rank_scores(
+    similarity: Sequence[float],
+    prices: Sequence[Optional[float]],
+    merchant_match: Sequence[bool],
+    personalization: Sequence[float],
+    base_price: float,
+    weights: Dict[str, float],
+) -> Dict[str, List[float]]:
+    """
+    Component and weighted final scores for ranking similar products.
+
+    price = max(0, 1 - |price - base_price| / base_price) when base_price > 0,
+    otherwise 0 (also 0 for candidates without a price).
+    """
+    n = len(similarity)
+    if np is None:
+        sim = [max(0.0, float(s or 0.0)) for s in similarity]
+        price = [
+            max(0.0, 1.0 - abs(p - base_price) / base_price) if base_price > 0 and p is not None else 0.0
+            for p in prices
+        ]
+        merchant = [1.0 if m else 0.0 for m in merchant_match]
+        pers = [float(p) for p in personalization]
+        final = [
+            weights["similarity"] * s + weights["price"] * pr + weights["merchant"] * m + weights["personalization"] * pe
+            for s, pr, m, pe in zip(sim, price, merchant, pers)
+        ]
+        return {"similarity": sim, "price": price, "merchant": merchant, "personalization": pers, "final": final}
+
+    sim = np.maximum(0.0, np.asarray([float(s or 0.0) for s in similarity], dtype=np.float64))
+    price_arr = np.asarray([np.nan if p is None else p for p in prices], dtype=np.float64)
+    if base_price > 0:
+        with np.errstate(invalid="ignore"):
+            price = np.maximum(0.0, 1.0 - np.abs(price_arr - base_price) / base_price)
+        price = np.where(np.isnan(price_arr), 0.0, price)
+    else:
+        price = np.zeros(n, dtype=np.float64)
+    merchant = np.asarray(merchant_match, dtype=np.float64).reshape(n)
+    pers = np.asarray(personalization, dtype=np.float64).reshape(n)
+    final = (
+        weights["similarity"] * sim
+        + weights["price"] * price
+        + weights["merchant"] * merchant
+        + weights["personalization"] * pers
+    )
+    return {
+        "similarity": sim.tolist(),
+        "price": price.tolist(),
+        "merchant": merchant.tolist(),
+        "personalization": pers.tolist(),
+        "final": final.tolist(),
+    }
+
+
+def personalization_scores(titles: Sequence[Optional[str]], recent_queries: Sequence[Optional[str]]) -> List[float]:
+    """
+    Share of the user's recent-query tokens that appear in each title
+    (0 when there are no usable query tokens).
+    """
+    q_tokens: set = set()
+    for q in recent_queries:
+        q_tokens |= tokenize(q or "")
+    if not q_tokens or not titles:
+        return [0.0] * len(titles)
+    overlap = TokenMatrix([tokenize(t or "") for t in titles]).overlap(q_tokens)
+    denom = max(len(q_tokens), 1)
+    if np is None:
+        return [min(1.0, ov / denom) for ov in overlap]
+    return np.minimum(1.0, overlap / denom).tolist()
+
+
+# Below this many scores a plain sort beats the NumPy conversion overhead.
+_TOP_K_NUMPY_MIN = 512
+
+
+def top_k_indices(scores: Sequence[float], k: int, preferred: Optional[Sequence[bool]] = None) -> List[int]:
+    """
+    Indices of the `k` highest scores, best first; equal scores keep their
+    input order (same result as a stable sort by score, descending). With
+    `preferred`, flagged items rank ahead of all others, each group by score.
+    """
+    if preferred is not None:
+        first = [i for i in range(len(scores)) if preferred[i]]
+        rest = [i for i in range(len(scores)) if not preferred[i]]
+        picked = [first[j] for j in top_k_indices([scores[i] for i in first], k)]
+        return picked + [rest[j] for j in top_k_indices([scores[i] for i in rest], k - len(picked))]
+    n = len(scores)
+    k = max(0, min(k, n))
+    if k == 0:
+        return []
+    if np is None or k == n or n < _TOP_K_NUMPY_MIN:
+        return sorted(range(n), key=lambda i: -scores[i])[:k]
+    arr = np.asarray(scores, dtype=np.float64)
+    threshold = arr[np.argpartition(-arr, k - 1)[k - 1]]
+    above = np.flatnonzero(arr > threshold)
+    ties = np.flatnonzero(arr == threshold)[: k - len(above)]
+    chosen = np.concatenate([above, ties])
+    order = np.lexsort((chosen, -arr[chosen]))
+    return chosen[order].tolist()
@@ -4,17 +4,51 @@ Similarity Service
 Provides a pluggable interface to fetch similar product IDs. The handler
 is responsible for loading full product objects and applying any ranking
 boosts (e.g., same_merchant_first).
+
+Content recall has three levels (same type + price band, same type, broad)
+and uses the first one that yields `limit` candidates. How the levels are
+fetched is set by the recall mode; every mode returns the same candidates:
+- union:      one UNION ALL query returns the row ids of all levels tagged
+              with their level; only the level that wins is then read by id
+              and hydrated. Two round trips and one pooled connection; the
+              database still evaluates all three LIMIT branches, but through
+              the lookup indexes without reading product_data, and only
+              about one level of product_data is shipped. Falls back to
+              parallel if the id query fails. The default;
+- parallel:   all levels are queried concurrently and unneeded ones are
+              cancelled, so a short level 1 costs one round trip of latency
+              instead of two to four, but every request runs up to three
+              queries on three connections and ships their product_data;
+- sequential: the original cascade, one level at a time: one query (and one
+              level of product_data) when level 1 suffices, up to four
+              round trips otherwise.
+Per-level latency (p50/p95) is kept in `recall_stats`.
+
+Configuration (env):
+- SIMILARITY_RECALL_MODE (union | parallel | sequential, default union)
 """
 from __future__ import annotations
 
-import re
+import asyncio
+import os
+import time
+from collections import Counter, deque
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
 
 from db.database import database
-from models.standard_product import StandardProduct, ProductStatus
+from models.standard_product import StandardProduct, ProductStatus, hydrate_product
+from services.co_purchase_service import CoPurchaseIndex, co_purchase_index
+from services.embedding_index import EmbeddingIndexProvider, embedding_indexes
+from services.json_columns import decode_object
+from services.neighbor_table import NeighborTableProvider, neighbor_tables
+from services.similarity_scoring import content_scores, tokenize
+
+SimilarityStrategy = str  # "content_embedding" | "co_view" | "same_merchant_first" | "neighbors"
 
-SimilarityStrategy = str  # "content_embedding" | "co_view" | "same_merchant_first"
+
+RECALL_MODES = ("union", "parallel", "sequential")
+RECALL_LATENCY_WINDOW = 1024
 
 
 @dataclass
@@ -23,15 +57,68 @@ class SimilarCandidate:
     score: Optional[float] = None  # normalized 0..1 if available
 
 
+class RecallStats:
+    """Recent content-recall latencies per level, and which level served each request."""
+
+    def __init__(self, window: int = RECALL_LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self.served_by_level: Counter = Counter()
+
+    def record(self, name: str, seconds: float) -> None:
+        samples = self._samples.get(name)
+        if samples is None:
+            samples = self._samples[name] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    @staticmethod
+    def _percentile_ms(ordered: List[float], q: float) -> float:
+        idx = min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))
+        return round(ordered[idx] * 1000.0, 3)
+
+    def snapshot(self) -> Dict[str, Any]:
+        latency = {}
+        for name, samples in sorted(self._samples.items()):
+            ordered = sorted(samples)
+            latency[name] = {
+                "count": len(ordered),
+                "p50_ms": self._percentile_ms(ordered, 0.50),
+                "p95_ms": self._percentile_ms(ordered, 0.95),
+            }
+        return {"latency": latency, "served_by_level": dict(sorted(self.served_by_level.items()))}
+
+    def reset(self) -> None:
+        self._samples.clear()
+        self.served_by_level.clear()
+
+
 class SimilarityService:
     """Basic, replaceable similarity service with multiple strategies."""
 
-    def __init__(self, max_pool_size: int = 200):
+    def __init__(
+        self,
+        max_pool_size: int = 200,
+        neighbor_tables: NeighborTableProvider = neighbor_tables,
+        co_purchase: CoPurchaseIndex = co_purchase_index,
+        embedding_indexes: EmbeddingIndexProvider = embedding_indexes,
+        recall_mode: Optional[str] = None,
+    ):
         self.max_pool_size = max_pool_size
+        mode = (recall_mode or os.getenv("SIMILARITY_RECALL_MODE") or "union").strip().lower()
+        self.recall_mode = mode if mode in RECALL_MODES else "union"
+        self.recall_stats = RecallStats()
+        self.neighbor_tables = neighbor_tables
+        self.co_purchase = co_purchase
+        self.embedding_indexes = embedding_indexes
 
     async def hasCoViewData(self, product_id: str) -> bool:
-        """Placeholder: no co-view data yet."""
-        return False
+        """True when the co-purchase graph has enough support for `product_id` (O(1))."""
+        return await self.co_purchase.has_data(product_id)
+
+    async def hasNeighborData(self, product_id: str) -> bool:
+        """True when the precomputed neighbor table covers `product_id`."""
+        table = self.neighbor_tables.get()
+        return table is not None and str(product_id) in table
 
     async def findSimilar(
         self,
@@ -46,13 +133,28 @@ class SimilarityService:
           userId?: string
         }
         """
+        strategy: SimilarityStrategy = input.get("strategy") or "content_embedding"
+        if strategy == "neighbors":
+            # One table lookup; products the table doesn't cover use live recall.
+            neighbors = self._find_similar_by_neighbors(input)
+            if neighbors is not None:
+                return neighbors
+        if strategy == "content_embedding":
+            # Indexed products are served from the ANN index without a database read.
+            embedded = self._find_similar_by_embedding(input)
+            if embedded:
+                return embedded
+
         base_product = await self._load_base_product(input.get("baseProductId"))
         if not base_product:
             return []
 
-        strategy: SimilarityStrategy = input.get("strategy") or "content_embedding"
         if strategy == "co_view":
             return await self._find_similar_by_co_view(input, base_product)
+        if strategy == "content_embedding":
+            embedded = self._find_similar_by_embedding(input, base_product)
+            if embedded:
+                return embedded
         # same_merchant_first uses content similarity; handler will apply merchant boost.
         return await self._find_similar_by_content(input, base_product)
 
@@ -73,21 +175,11 @@ class SimilarityService:
         base_price = base_product.price or 0
         base_type = (base_product.product_type or "").lower()
 
-        base_tokens = self._tokenize(f"{base_product.title} {base_product.product_type or ''}")
+        base_tokens = tokenize(f"{base_product.title} {base_product.product_type or ''}")
         text_query = f"{base_product.title or ''} {base_product.product_type or ''}".strip()
 
-        def score_candidate(sp: StandardProduct) -> float:
-            tokens = self._tokenize(f"{sp.title} {sp.product_type or ''}")
-            overlap = len(base_tokens & tokens)
-            denom = max(len(base_tokens | tokens), 1)
-            token_score = overlap / denom
-            bonus = 0.0
-            if base_type and sp.product_type and base_type == sp.product_type.lower():
-                bonus += 0.1
-            return round(min(1.0, token_score + bonus), 3)
-
         def build_candidates(pool: List[StandardProduct]) -> List[SimilarCandidate]:
-            out: List[SimilarCandidate] = []
+            kept: List[StandardProduct] = []
             seen = set()
             for sp in pool:
                 pid = sp.product_id or sp.id
@@ -95,54 +187,151 @@ class SimilarityService:
                     continue
                 if sp.status and sp.status != ProductStatus.ACTIVE:
                     continue
-                out.append(SimilarCandidate(productId=pid, score=score_candidate(sp)))
+                kept.append(sp)
                 seen.add(pid)
-                if len(out) >= fetch_size:
+                if len(kept) >= fetch_size:
                     break
-            return out
+            scores = content_scores(
+                base_tokens,
+                base_type,
+                [tokenize(f"{sp.title} {sp.product_type or ''}") for sp in kept],
+                [sp.product_type for sp in kept],
+            )
+            return [
+                SimilarCandidate(productId=sp.product_id or sp.id, score=score) for sp, score in zip(kept, scores)
+            ]
+
+        price_band = (0.7 * base_price if base_price else None, 1.4 * base_price if base_price else None)
+        # (require_same_category, price_band) per level, in priority order.
+        levels = [(True, price_band), (True, None), (False, None)]
+
+        def fetch_level(i: int) -> Awaitable[List[StandardProduct]]:
+            same, band = levels[i]
+            return self._timed_level(i + 1, self._search_candidates_content, base_product, fetch_size, same, band, text_query)
+
+        started = time.perf_counter()
+        try:
+            if self.recall_mode == "union":
+                level_ids = await self._search_candidates_union(base_product, fetch_size, price_band)
+                if level_ids is not None:
+                    loaded: Dict[Any, Any] = {}
 
-        # Level 1: same category + price band
-        level1_pool = await self._search_candidates_content(
-            base_product,
-            fetch_size,
-            require_same_category=True,
-            price_band=(0.7 * base_price if base_price else None, 1.4 * base_price if base_price else None),
-            text_query=text_query,
-        )
-        level1_candidates = build_candidates(level1_pool)
-        if len(level1_candidates) >= limit:
-            return level1_candidates
-
-        # Level 2: same category, no price band
-        level2_pool = await self._search_candidates_content(
-            base_product,
-            fetch_size,
-            require_same_category=True,
-            price_band=None,
-            text_query=text_query,
-        )
-        level2_candidates = build_candidates(level2_pool)
-        if len(level2_candidates) >= limit:
-            return level2_candidates
-
-        # Level 3: broad fallback (no category filter)
-        level3_pool = await self._search_candidates_content(
-            base_product,
-            fetch_size,
-            require_same_category=False,
-            price_band=None,
-            text_query=text_query,
-        )
-        level3_candidates = build_candidates(level3_pool)
-        return level3_candidates[:fetch_size]
+                    async def hydrate(ids: List[Any]) -> List[StandardProduct]:
+                        missing = [row_id for row_id in ids if row_id not in loaded]
+                        loaded.update((row["id"], row) for row in await self._load_rows_by_id(missing))
+                        return self._hydrate_rows([loaded[row_id] for row_id in ids if row_id in loaded])
+
+                    async def hydrate_level(ids: List[Any]) -> List[StandardProduct]:
+                        # An empty same-category level takes the broad pool, as its fallback query would.
+                        return await hydrate(ids) or await hydrate(level_ids[-1])
+
+                    # Hydrate lazily: most requests stop at level 1.
+                    return await self._first_sufficient_level(
+                        [lambda ids=ids: hydrate_level(ids) for ids in level_ids], build_candidates, limit
+                    )
+            if self.recall_mode == "sequential":
+                return await self._first_sufficient_level(
+                    [lambda i=i: fetch_level(i) for i in range(len(levels))], build_candidates, limit
+                )
+
+            tasks: List[asyncio.Future] = []
+            for i in range(len(levels)):
+                if i == 1 and not _has_band(price_band):
+                    # Without a usable band, levels 1 and 2 are the same query.
+                    tasks.append(tasks[0])
+                else:
+                    tasks.append(asyncio.ensure_future(fetch_level(i)))
+            try:
+                return await self._first_sufficient_level([lambda t=t: t for t in tasks], build_candidates, limit)
+            finally:
+                for task in tasks:
+                    _discard(task)
+        finally:
+            self.recall_stats.record("total", time.perf_counter() - started)
+
+    async def _first_sufficient_level(
+        self,
+        fetches: List[Callable[[], Awaitable[List[StandardProduct]]]],
+        build_candidates: Callable[[List[StandardProduct]], List[SimilarCandidate]],
+        limit: int,
+    ) -> List[SimilarCandidate]:
+        """Candidates of the first level (in priority order) with at least `limit`, else of the last level."""
+        for i, fetch in enumerate(fetches):
+            candidates = build_candidates(await fetch())
+            if len(candidates) >= limit or i == len(fetches) - 1:
+                self.recall_stats.served_by_level[f"level{i + 1}"] += 1
+                return candidates
+        return []
+
+    async def _timed_level(self, level: int, search, *args) -> List[StandardProduct]:
+        started = time.perf_counter()
+        result = await search(*args)
+        self.recall_stats.record(f"level{level}", time.perf_counter() - started)
+        return result
+
+    def _find_similar_by_neighbors(self, input: dict) -> Optional[List[SimilarCandidate]]:
+        table = self.neighbor_tables.get()
+        product_id = input.get("baseProductId")
+        if table is None or not product_id:
+            return None
+        limit = int(input.get("limit") or 10)
+        neighbors = table.lookup(str(product_id), min(limit * 5, self.max_pool_size))
+        if neighbors is None:
+            return None
+        return [SimilarCandidate(productId=pid, score=score) for pid, score in neighbors]
+
+    def _find_similar_by_embedding(
+        self,
+        input: dict,
+        base_product: Optional[StandardProduct] = None,
+    ) -> Optional[List[SimilarCandidate]]:
+        """
+        Top-k by vector similarity from the embedding index. Without
+        `base_product` only indexed products are answered; with it, products
+        missing from the index are embedded from their title and type.
+        Returns None when there is no index (or the product isn't indexed).
+        """
+        index = self.embedding_indexes.get()
+        product_id = input.get("baseProductId")
+        if index is None or not product_id:
+            return None
+        limit = int(input.get("limit") or 10)
+        fetch_size = min(limit * 5, self.max_pool_size)
+        if base_product is None:
+            hits = index.search_by_id(str(product_id), fetch_size)
+        else:
+            text = f"{base_product.title} {base_product.product_type or ''}"
+            base_pid = base_product.product_id or base_product.id
+            hits = index.search(index.embed(text), fetch_size, exclude={str(product_id), str(base_pid)})
+        if hits is None:
+            return None
+        return [SimilarCandidate(productId=pid, score=score) for pid, score in hits]
 
     async def _find_similar_by_co_view(
         self,
         input: dict,
         base_product: StandardProduct,
     ) -> List[SimilarCandidate]:
-        # TODO: replace with real co-view/co-purchase signals.
-        return await self._find_similar_by_content(input, base_product)
+        """
+        Products most often bought together with the base product, topped up
+        with content similarity when there are fewer than `limit`.
+        """
+        limit = int(input.get("limit") or 10)
+        fetch_size = min(limit * 5, self.max_pool_size)
+        base_pid = base_product.product_id or base_product.id
+        out = [
+            SimilarCandidate(productId=pid, score=score)
+            for pid, score in await self.co_purchase.neighbors(base_pid, fetch_size)
+            if pid != base_pid
+        ]
+        if len(out) >= limit:
+            return out
+        seen = {c.productId for c in out}
+        for cand in await self._find_similar_by_content(input, base_product):
+            if cand.productId not in seen:
+                seen.add(cand.productId)
+                out.append(cand)
+        return out[:fetch_size]
 
     async def _search_candidates_content(
         self,
@@ -161,13 +350,12 @@ class SimilarityService:
         where_clauses = ["1=1"]
         if require_same_category:
             params["ptype"] = (base_product.product_type or "").lower()
-            where_clauses.append("LOWER(product_data->>'product_type') = :ptype")
-        if price_band and price_band[0] is not None and price_band[1] is not None:
+            # Generated columns (migration 060) keep these filters indexable.
+            where_clauses.append("data_product_type_lower = :ptype")
+        if _has_band(price_band):
             params["pmin"] = price_band[0]
             params["pmax"] = price_band[1]
-            where_clauses.append(
-                "(CAST(product_data->>'price' AS FLOAT) BETWEEN :pmin AND :pmax)"
-            )
+            where_clauses.append("(data_price BETWEEN :pmin AND :pmax)")
 
         where_sql = " AND ".join(where_clauses)
         query = f"""
@@ -183,14 +371,7 @@ class SimilarityService:
         except Exception:
             rows = []
 
-        products: List[StandardProduct] = []
-        for row in rows:
-            try:
-                pdata = row.get("product_data") or row
-                sp = StandardProduct.parse_obj(pdata)
-                products.append(sp)
-            except Exception:
-                continue
+        products = self._hydrate_rows(rows)
 
         # If nothing found and category was required, try without category as a fallback within this level
         if not products and require_same_category:
@@ -203,16 +384,82 @@ class SimilarityService:
                     """,
                     {"limit": limit},
                 )
-                for row in rows:
-                    try:
-                        pdata = row.get("product_data") or row
-                        sp = StandardProduct.parse_obj(pdata)
-                        products.append(sp)
-                    except Exception:
-                        continue
             except Exception:
                 return []
+            products = self._hydrate_rows(rows)
+
+        return products
+
+    async def _search_candidates_union(
+        self,
+        base_product: StandardProduct,
+        limit: int,
+        price_band: Optional[Tuple[Optional[float], Optional[float]]],
+    ) -> Optional[List[List[Any]]]:
+        """
+        Row ids of all three recall levels from one UNION ALL query, each
+        branch tagged with its level; same filters, order and limits as
+        `_search_candidates_content`. Returns None if the query fails.
+        """
+        params: Dict[str, Any] = {"limit": limit, "ptype": (base_product.product_type or "").lower()}
+        level1_where = "data_product_type_lower = :ptype"
+        if _has_band(price_band):
+            params["pmin"], params["pmax"] = price_band
+            level1_where += " AND (data_price BETWEEN :pmin AND :pmax)"
+        query = f"""
+        SELECT recall_level, id FROM (
+            (SELECT 1 AS recall_level, id, cached_at FROM products_cache
+             WHERE {level1_where} ORDER BY cached_at DESC LIMIT :limit)
+            UNION ALL
+            (SELECT 2 AS recall_level, id, cached_at FROM products_cache
+             WHERE data_product_type_lower = :ptype ORDER BY cached_at DESC LIMIT :limit)
+            UNION ALL
+            (SELECT 3 AS recall_level, id, cached_at FROM products_cache
+             ORDER BY cached_at DESC LIMIT :limit)
+        ) AS recall
+        ORDER BY recall_level, cached_at DESC
+        """
+        started = time.perf_counter()
+        try:
+            rows = await database.fetch_all(query, params)
+        except Exception:
+            return None
+        self.recall_stats.record("union", time.perf_counter() - started)
+
+        by_level: List[List[Any]] = [[], [], []]
+        for row in rows:
+            by_level[int(row["recall_level"]) - 1].append(row["id"])
+        return by_level
+
+    async def _load_rows_by_id(self, ids: List[Any]) -> List[Any]:
+        """`id, product_data` rows for `ids` (one query; missing ids are skipped)."""
+        if not ids:
+            return []
+        params: Dict[str, Any] = {}
+        for i, row_id in enumerate(ids):
+            params[f"id{i}"] = row_id
+        started = time.perf_counter()
+        try:
+            rows = await database.fetch_all(
+                f"SELECT id, product_data FROM products_cache WHERE id IN ({', '.join(':' + k for k in params)})",
+                params,
+            )
+        except Exception:
+            return []
+        self.recall_stats.record("union_hydrate", time.perf_counter() - started)
+        return list(rows or [])
 
+    @staticmethod
+    def _hydrate_rows(rows: List[Any]) -> List[StandardProduct]:
+        products: List[StandardProduct] = []
+        for row in rows or []:
+            pdata = decode_object(row.get("product_data") or row)
+            if pdata is None:
+                continue
+            try:
+                products.append(hydrate_product(pdata))
+            except Exception:
+                continue
         return products
 
     async def _load_base_product(self, product_id: Optional[str]) -> Optional[StandardProduct]:
@@ -222,7 +469,7 @@ class SimilarityService:
             """
             SELECT product_data
             FROM products_cache
-            WHERE product_data->>'product_id' = :pid
+            WHERE data_product_id = :pid
             LIMIT 1
             """,
             """
@@ -235,15 +482,32 @@ class SimilarityService:
         for q in queries:
             try:
                 row = await database.fetch_one(q, {"pid": product_id})
-                if row and "product_data" in row:
-                    return StandardProduct.parse_obj(row["product_data"])
+                pdata = decode_object(row["product_data"]) if row and "product_data" in row else None
+                if pdata is not None:
+                    return hydrate_product(pdata)
             except Exception:
                 continue
         return None
 
     @staticmethod
     def _tokenize(text: str) -> set[str]:
-        return {t for t in re.split(r"[^a-z0-9]+", text.lower()) if len(t) > 2}
+        return set(tokenize(text))
+
+
+def _has_band(price_band: Optional[Tuple[Optional[float], Optional[float]]]) -> bool:
+    return bool(price_band) and price_band[0] is not None and price_band[1] is not None
+
+
+async def _value(value: Any) -> Any:
+    return value
+
+
+def _discard(task: asyncio.Future) -> None:
+    """Cancel a recall level nobody needs, and consume the error of one that failed."""
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()
 
 
 # Singleton instance
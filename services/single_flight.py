@@ -0,0 +1,153 @@
+"""
+Single-flight request coalescing
+
+Identical gateway invocations that arrive while one is already being
+computed wait on that computation instead of starting their own. Results can
+optionally be reused for a short TTL after completion.
+
+Configuration (env):
+- SHOP_GATEWAY_SINGLE_FLIGHT_ENABLED     (default true)
+- SHOP_GATEWAY_SINGLE_FLIGHT_TTL_S       (default 0, i.e. only coalesce in-flight calls)
+- SHOP_GATEWAY_SINGLE_FLIGHT_MAX_ENTRIES (default 256)
+"""
+from __future__ import annotations
+
+import asyncio
+import copy
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from services.env import env_flag, env_float, env_int
+
+# Observability-only fields that never change a result.
+VOLATILE_METADATA_KEYS = ("trace_id",)
+
+
+def _strip_keys(value: Any, keys: Iterable[str]) -> Any:
+    if not isinstance(value, dict):
+        return value
+    return {k: v for k, v in value.items() if k not in keys}
+
+
+def canonical_request_key(
+    operation: str,
+    payload: Dict[str, Any],
+    metadata: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Stable hash of an invocation; key order and trace ids do not matter."""
+    payload = dict(payload or {})
+    if "metadata" in payload:
+        payload["metadata"] = _strip_keys(payload["metadata"], VOLATILE_METADATA_KEYS)
+    doc = {
+        "operation": operation,
+        "payload": payload,
+        "metadata": _strip_keys(metadata or {}, VOLATILE_METADATA_KEYS),
+    }
+    raw = json.dumps(doc, sort_keys=True, separators=(",", ":"), default=str, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls sharing a key onto one computation."""
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        ttl_s: Optional[float] = None,
+        max_entries: Optional[int] = None,
+    ):
+        self.enabled = env_flag("SHOP_GATEWAY_SINGLE_FLIGHT_ENABLED", True) if enabled is None else enabled
+        self.ttl_s = env_float("SHOP_GATEWAY_SINGLE_FLIGHT_TTL_S", 0.0) if ttl_s is None else ttl_s
+        self.max_entries = env_int("SHOP_GATEWAY_SINGLE_FLIGHT_MAX_ENTRIES", 256) if max_entries is None else max_entries
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._followers: Dict[str, int] = {}
+        self._results: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._counters = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+    def _cached(self, key: str) -> Tuple[bool, Any]:
+        item = self._results.get(key)
+        if item is None:
+            return False, None
+        expires_at, value = item
+        if time.monotonic() >= expires_at:
+            del self._results[key]
+            return False, None
+        self._results.move_to_end(key)
+        return True, value
+
+    def _remember(self, key: str, value: Any) -> None:
+        if self.ttl_s <= 0 or self.max_entries <= 0:
+            return
+        self._results[key] = (time.monotonic() + self.ttl_s, value)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    async def run(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return `compute()`'s result, sharing it with concurrent callers of `key`.
+
+        Shared results are deep-copied per caller so one caller mutating its
+        response cannot leak into another's (a result can customize this with
+        `__deepcopy__`). Errors are propagated to every waiter and never cached.
+        """
+        if not self.enabled:
+            return await compute()
+
+        hit, value = self._cached(key)
+        if hit:
+            self._counters["hits"] += 1
+            return copy.deepcopy(value)
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self._counters["coalesced"] += 1
+            # Counts followers that have not copied the result yet.
+            self._followers[key] = self._followers.get(key, 0) + 1
+            try:
+                return copy.deepcopy(await asyncio.shield(task))
+            finally:
+                remaining = self._followers.get(key, 0) - 1
+                if remaining > 0:
+                    self._followers[key] = remaining
+                else:
+                    self._followers.pop(key, None)
+
+        self._counters["misses"] += 1
+        # Run detached so a cancelled leader does not cancel its followers.
+        task = asyncio.ensure_future(compute())
+        self._in_flight[key] = task
+
+        def _done(t: asyncio.Future) -> None:
+            if self._in_flight.get(key) is t:
+                del self._in_flight[key]
+            if t.cancelled():
+                return
+            if t.exception() is not None:
+                self._counters["errors"] += 1
+                return
+            self._remember(key, t.result())
+
+        task.add_done_callback(_done)
+        result = await asyncio.shield(task)
+        # The leader keeps the original object unless a follower still has to copy it.
+        shared = self._followers.get(key, 0) > 0
+        return copy.deepcopy(result) if shared or self.ttl_s > 0 else result
+
+    def stats(self) -> Dict[str, Any]:
+        computed = self._counters["misses"]
+        served = computed + self._counters["hits"] + self._counters["coalesced"]
+        return {
+            "enabled": self.enabled,
+            "ttl_s": self.ttl_s,
+            "in_flight": len(self._in_flight),
+            "cached_results": len(self._results),
+            **self._counters,
+            "fan_in": round(served / computed, 3) if computed else None,
+        }
+
+    def clear(self) -> None:
+        self._results.clear()
@@ -0,0 +1,191 @@
+"""
+Upstream HTTP clients
+
+Long-lived, pooled `httpx.AsyncClient`s for the gateway's upstreams (Agent
+API, shop mainline invoke) so proxied calls reuse keep-alive connections
+instead of paying TCP/TLS setup per request.
+
+Configuration (env):
+- SHOP_GATEWAY_UPSTREAM_MAX_CONNECTIONS   (default 100)
+- SHOP_GATEWAY_UPSTREAM_MAX_KEEPALIVE     (default 20)
+- SHOP_GATEWAY_UPSTREAM_KEEPALIVE_EXPIRY_S (default 30)
+- SHOP_GATEWAY_UPSTREAM_HTTP2             (default false; needs the `h2` package)
+- SHOP_GATEWAY_TIMEOUT_<OPERATION>_S      per-operation timeout override
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from services.env import env_flag, env_float
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # type: ignore  # noqa: F401
+
+    _HTTP2_AVAILABLE = True
+except Exception:  # pragma: no cover
+    _HTTP2_AVAILABLE = False
+
+
+def default_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(env_float("SHOP_GATEWAY_UPSTREAM_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=int(env_float("SHOP_GATEWAY_UPSTREAM_MAX_KEEPALIVE", 20)),
+        keepalive_expiry=env_float("SHOP_GATEWAY_UPSTREAM_KEEPALIVE_EXPIRY_S", 30.0),
+    )
+
+
+class UpstreamClient:
+    """
+    One pooled AsyncClient per upstream base URL.
+
+    The client is created lazily on first use and re-created if the running
+    event loop changes (connections are bound to the loop that opened them).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        *,
+        default_timeout_s: float,
+        operation_timeouts: Optional[Dict[str, float]] = None,
+        limits: Optional[httpx.Limits] = None,
+        http2: Optional[bool] = None,
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.default_timeout_s = default_timeout_s
+        self.operation_timeouts = dict(operation_timeouts or {})
+        self.limits = limits or default_limits()
+        wants_http2 = env_flag("SHOP_GATEWAY_UPSTREAM_HTTP2", False) if http2 is None else http2
+        if wants_http2 and not _HTTP2_AVAILABLE:
+            logger.warning("upstream.http2_unavailable", extra={"upstream": name})
+        self.http2 = wants_http2 and _HTTP2_AVAILABLE
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._in_flight = 0
+        self._counters = {
+            "requests": 0,
+            "errors": 0,
+            "clients_created": 0,
+            "peak_in_flight": 0,
+            "total_latency_ms": 0.0,
+        }
+
+    def timeout_for(self, operation: Optional[str]) -> float:
+        if operation:
+            env_key = f"SHOP_GATEWAY_TIMEOUT_{operation.upper()}_S"
+            if os.getenv(env_key):
+                return env_float(env_key, self.default_timeout_s)
+            if operation in self.operation_timeouts:
+                return self.operation_timeouts[operation]
+        return self.default_timeout_s
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            # A client from another (finished) loop cannot be closed from here; drop it.
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=self.limits,
+                http2=self.http2,
+                timeout=self.default_timeout_s,
+            )
+            self._loop = loop
+            self._counters["clients_created"] += 1
+        return self._client
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        operation: Optional[str] = None,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        client = self._get_client()
+        kwargs.setdefault("timeout", self.timeout_for(operation))
+        self._in_flight += 1
+        self._counters["requests"] += 1
+        self._counters["peak_in_flight"] = max(self._counters["peak_in_flight"], self._in_flight)
+        started = time.perf_counter()
+        try:
+            return await client.request(method, path, **kwargs)
+        except httpx.HTTPError:
+            self._counters["errors"] += 1
+            raise
+        finally:
+            self._in_flight -= 1
+            self._counters["total_latency_ms"] += (time.perf_counter() - started) * 1000.0
+
+    async def post(self, path: str, *, operation: Optional[str] = None, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", path, operation=operation, **kwargs)
+
+    def _pool_connections(self) -> Dict[str, Optional[int]]:
+        # httpx keeps its httpcore pool private; report what we can, best effort.
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        if connections is None:
+            return {"connections": None, "idle_connections": None}
+        try:
+            return {
+                "connections": len(connections),
+                "idle_connections": sum(1 for c in connections if c.is_idle()),
+            }
+        except Exception:
+            return {"connections": None, "idle_connections": None}
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self._counters["requests"]
+        max_connections = self.limits.max_connections
+        pool = self._pool_connections()
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "http2": self.http2,
+            "max_connections": max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "in_flight": self._in_flight,
+            "utilization": round(self._in_flight / max_connections, 4) if max_connections else None,
+            **pool,
+            "requests": requests,
+            "errors": self._counters["errors"],
+            "clients_created": self._counters["clients_created"],
+            "peak_in_flight": self._counters["peak_in_flight"],
+            "avg_latency_ms": round(self._counters["total_latency_ms"] / requests, 3) if requests else None,
+        }
+
+    async def aclose(self) -> None:
+        client, self._client, self._loop = self._client, None, None
+        if client is not None and not client.is_closed:
+            try:
+                await client.aclose()
+            except RuntimeError:
+                # Loop that owned the connections is already gone.
+                pass
+
+
+_registry: Dict[str, UpstreamClient] = {}
+
+
+def register_upstream(client: UpstreamClient) -> UpstreamClient:
+    _registry[client.name] = client
+    return client
+
+
+def upstream_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: client.stats() for name, client in _registry.items()}
+
+
+async def aclose_upstreams() -> None:
+    for client in list(_registry.values()):
+        await client.aclose()
@@ -0,0 +1,148 @@
+"""
+User Signal Cache
+
+Bounded in-process cache of the personalization signals `find_products_multi`
+derives from a user's recent orders (purchased product ids and tokenized
+product titles), so a session's searches read `orders` once instead of on
+every query.
+
+Entries are keyed by the identities the orders lookup matches on (user id,
+explicit email, email given as the id) and expire after `ttl_s`. Creating an
+order invalidates every entry that mentions the order's customer email.
+Orders attributed only by user id are picked up when the entry expires.
+A load that started before an invalidation is returned to its caller but
+not stored, so a stale read can't outlive the order that made it stale.
+
+Memory is capped at `max_users` entries, least recently used first. Loads
+run detached from the caller: a request that gives up on a slow lookup still
+warms the cache for the next one, and concurrent misses share one load.
+Cached signals are shared between requests and are immutable.
+
+Configuration (env):
+- USER_SIGNAL_CACHE_MAX_USERS (default 10000, 0 disables caching)
+- USER_SIGNAL_CACHE_TTL_S     (default 300)
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Optional, Set, Tuple
+
+from services.env import env_int
+
+UserKey = Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class UserSignals:
+    product_ids: FrozenSet[str]
+    terms: FrozenSet[str]
+
+
+EMPTY_SIGNALS = UserSignals(frozenset(), frozenset())
+
+Loader = Callable[[], Awaitable[UserSignals]]
+
+
+class UserSignalCache:
+    """LRU + TTL cache of `UserSignals`, invalidated by customer identity."""
+
+    def __init__(self, *, max_users: Optional[int] = None, ttl_s: Optional[float] = None):
+        self.max_users = env_int("USER_SIGNAL_CACHE_MAX_USERS", 10000) if max_users is None else max_users
+        self.ttl_s = float(env_int("USER_SIGNAL_CACHE_TTL_S", 300)) if ttl_s is None else ttl_s
+        self._entries: "OrderedDict[UserKey, Tuple[UserSignals, float]]" = OrderedDict()
+        self._by_identity: Dict[str, Set[UserKey]] = {}
+        self._in_flight: Dict[UserKey, asyncio.Future] = {}
+        self._epoch = 0  # bumped by every invalidation
+        self._counters = {"hits": 0, "misses": 0, "coalesced": 0, "expired": 0, "evicted": 0, "invalidated": 0}
+
+    @staticmethod
+    def _identities(key: UserKey) -> Set[str]:
+        return {part.strip().lower() for part in key if part and part.strip()}
+
+    async def get(self, key: UserKey, loader: Loader) -> UserSignals:
+        """Signals for `key`, loading them with `loader` on a miss. Loader errors propagate."""
+        if self.max_users <= 0:
+            return await loader()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            signals, loaded_at = entry
+            if time.monotonic() - loaded_at < self.ttl_s:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return signals
+            self._counters["expired"] += 1
+            self._drop(key)
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self._counters["coalesced"] += 1
+        else:
+            self._counters["misses"] += 1
+            task = asyncio.ensure_future(self._load_and_store(key, loader))
+            self._in_flight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load_and_store(self, key: UserKey, loader: Loader) -> UserSignals:
+        epoch = self._epoch
+        try:
+            signals = await loader()
+        finally:
+            self._in_flight.pop(key, None)
+        if epoch == self._epoch:
+            self._store(key, signals)
+        return signals
+
+    def _store(self, key: UserKey, signals: UserSignals) -> None:
+        self._drop(key)
+        self._entries[key] = (signals, time.monotonic())
+        for identity in self._identities(key):
+            self._by_identity.setdefault(identity, set()).add(key)
+        while len(self._entries) > self.max_users:
+            victim = next(iter(self._entries))
+            self._drop(victim)
+            self._counters["evicted"] += 1
+
+    def _drop(self, key: UserKey) -> None:
+        if self._entries.pop(key, None) is None:
+            return
+        for identity in self._identities(key):
+            keys = self._by_identity.get(identity)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_identity[identity]
+
+    def invalidate(self, *identities: Optional[str]) -> int:
+        """Drop every entry keyed by any of `identities` (user ids or emails); returns how many."""
+        self._epoch += 1
+        dropped = 0
+        for identity in identities:
+            if not identity or not identity.strip():
+                continue
+            for key in list(self._by_identity.get(identity.strip().lower(), ())):
+                self._drop(key)
+                dropped += 1
+        self._counters["invalidated"] += dropped
+        return dropped
+
+    def clear(self) -> None:
+        self._epoch += 1
+        self._entries.clear()
+        self._by_identity.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._entries),
+            "max_users": self.max_users,
+            "ttl_s": self.ttl_s,
+            "in_flight": len(self._in_flight),
+            **self._counters,
+        }
+
+
+# Singleton used by find_products_multi and invalidated by create_order.
+user_signal_cache = UserSignalCache()
@@ -0,0 +1,66 @@
+-- Generated lookup columns for the Python shopping gateway's products_cache reads
+-- (services/product_hydration.py, services/similarity_service.py).
+--
+-- Why: those queries filter on JSON expressions -- product_data->>'product_id',
+-- LOWER(product_data->>'product_type'), CAST(product_data->>'price' AS FLOAT) --
+-- that no index covers, so every find_similar_products base lookup, candidate
+-- fetch and batched hydration seq-scans products_cache and detoasts
+-- product_data per row.
+--
+-- Fix: STORED generated columns mirroring each expression, each with a plain
+-- btree index; the Python services filter on the columns directly.
+--   data_product_id          product_data->>'product_id'
+--   data_product_type_lower  lower(product_data->>'product_type')
+--   data_price               numeric price; NULL when price is not a plain number
+--                            (the old CAST raised and failed the whole query)
+-- Status filters keep using lower(coalesce(product_data->>'status', '')),
+-- which 037's idx_products_cache_status_expr already serves.
+-- The content-candidate index is (type, cached_at DESC) so the
+-- "same category, newest first, LIMIT n" read is a bounded index scan.
+--
+-- Prod rollout: ADD COLUMN ... STORED rewrites the table; run this out of band
+-- in a maintenance window (or pre-create the columns), after which IF NOT EXISTS
+-- makes the file a no-op. Fresh environments run it inline.
+
+DO $$
+BEGIN
+  IF to_regclass('public.products_cache') IS NULL THEN
+    RAISE NOTICE 'products_cache table not found; skipping generated lookup columns';
+    RETURN;
+  END IF;
+
+  EXECUTE $sql$
+    ALTER TABLE products_cache
+      ADD COLUMN IF NOT EXISTS data_product_id text
+        GENERATED ALWAYS AS (product_data->>'product_id') STORED,
+      ADD COLUMN IF NOT EXISTS data_product_type_lower text
+        GENERATED ALWAYS AS (lower(product_data->>'product_type')) STORED,
+      ADD COLUMN IF NOT EXISTS data_price double precision
+        GENERATED ALWAYS AS (
+          CASE
+            WHEN (product_data->>'price') ~ '^\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$'
+            THEN (product_data->>'price')::double precision
+          END
+        ) STORED
+  $sql$;
+
+  EXECUTE $sql$
+    CREATE INDEX IF NOT EXISTS idx_products_cache_data_product_id
+    ON products_cache (data_product_id)
+  $sql$;
+
+  EXECUTE $sql$
+    CREATE INDEX IF NOT EXISTS idx_products_cache_platform_product_id
+    ON products_cache (platform_product_id)
+  $sql$;
+
+  EXECUTE $sql$
+    CREATE INDEX IF NOT EXISTS idx_products_cache_data_type_recent
+    ON products_cache (data_product_type_lower, cached_at DESC)
+  $sql$;
+
+  EXECUTE $sql$
+    CREATE INDEX IF NOT EXISTS idx_products_cache_data_price
+    ON products_cache (data_price)
+  $sql$;
+END $$;
@@ -0,0 +1,28 @@
+-- Keyset index for the Python shopping gateway's paginated find_products
+-- (services/product_query_service.py:get_products_page).
+--
+-- Why: find_products used to fetch page * limit rows (capped at 500), filter
+-- in Python and slice, so page N cost N pages of I/O and anything past row
+-- 500 was unreachable. Pages are now addressed by an opaque cursor over
+-- (cached_at, id) and read with
+--   WHERE merchant_id = :m AND (cached_at, id) < (:after_cached_at, :after_id)
+--   ORDER BY cached_at DESC, id DESC LIMIT :n
+-- which needs a composite index in exactly that order to be a bounded index
+-- range scan regardless of page depth. idx_products_cache_merchant_lookup
+-- (merchant_id) alone forces a sort of the merchant's whole catalog.
+--
+-- Prod rollout: on a large products_cache build the index CONCURRENTLY out of
+-- band first; IF NOT EXISTS then makes this file a no-op.
+
+DO $$
+BEGIN
+  IF to_regclass('public.products_cache') IS NULL THEN
+    RAISE NOTICE 'products_cache table not found; skipping merchant keyset index';
+    RETURN;
+  END IF;
+
+  EXECUTE $sql$
+    CREATE INDEX IF NOT EXISTS idx_products_cache_merchant_recent
+    ON products_cache (merchant_id, cached_at DESC, id DESC)
+  $sql$;
+END $$;
@@ -0,0 +1,31 @@
+-- Expression index for the Python shopping gateway's get_product_detail point
+-- lookup (services/product_detail_cache.py).
+--
+-- Why: the lookup matches a product by data_product_id, platform_product_id
+-- or product_data->>'id'. Rows whose product_data has an `id` but no
+-- `product_id` have a NULL data_product_id (migration 060), so they and every
+-- miss fell through to product_data->>'id', which no index covers: a scan of
+-- the merchant's rows that detoasts product_data per row.
+--
+-- Fix: a (merchant_id, product_data->>'id') expression index, so all three
+-- arms of
+--   WHERE merchant_id = :merchant_id
+--     AND (data_product_id = :pid OR platform_product_id = :pid
+--          OR product_data->>'id' = :pid)
+-- are index lookups (BitmapOr) and the query is a point read.
+--
+-- Prod rollout: on a large products_cache build the index CONCURRENTLY out of
+-- band first; IF NOT EXISTS then makes this file a no-op.
+
+DO $$
+BEGIN
+  IF to_regclass('public.products_cache') IS NULL THEN
+    RAISE NOTICE 'products_cache table not found; skipping json id index';
+    RETURN;
+  END IF;
+
+  EXECUTE $sql$
+    CREATE INDEX IF NOT EXISTS idx_products_cache_merchant_json_id
+    ON products_cache (merchant_id, (product_data->>'id'))
+  $sql$;
+END $$;
@@ -76,17 +76,11 @@ async def test_proxy_public_shop_invoke_keeps_reply_for_non_grounded_beauty_resu
                 },
             }
 
-    class FakeClient:
-        async def __aenter__(self):
-            return self
-
-        async def __aexit__(self, exc_type, exc, tb):
-            return False
-
-        async def post(self, url, json, headers):
+    class FakeUpstream:
+        async def post(self, path, *, operation=None, json, headers):
             return FakeResponse()
 
-    monkeypatch.setattr(agent_shop_gateway.httpx, "AsyncClient", lambda timeout=25.0: FakeClient())
+    monkeypatch.setattr(agent_shop_gateway, "mainline_upstream", FakeUpstream())
 
     result = await agent_shop_gateway._proxy_public_shop_invoke(
         {
@@ -0,0 +1,17 @@
+import random
+
+from services.candidate_batch import CandidateBatch
+
+
+def test_pages_match_a_stable_sort_of_scored_rows():
+    rng = random.Random(4)
+    rows = [(row, rng.choice([0.5, 0.8, 0.8, 1.0, 1.45])) for row in range(0, 600, 3)]
+    batch = CandidateBatch()
+    for row, score in rows:
+        batch.add(row, score)
+
+    ranked = [row for row, _ in sorted(rows, key=lambda r: r[1], reverse=True)]
+    assert len(batch) == len(rows)
+    for start, end in ((0, 20), (20, 40), (180, 220)):
+        assert batch.page(start, end) == ranked[start:end]
+    assert CandidateBatch().page(0, 20) == []
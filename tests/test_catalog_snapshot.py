@@ -0,0 +1,229 @@
+import asyncio
+import json
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import BackgroundTasks
+
+from routes import agent_shop_gateway
+from services import catalog_snapshot as catalog_snapshot_module
+from services.catalog_snapshot import CatalogSnapshot
+
+T0 = datetime(2025, 1, 1, 12, 0, 0)
+
+
+def _row(row_id, merchant_id, pid, title, minutes, **extra):
+    data = {"id": pid, "title": title, "price": 10.0, "currency": "USD", **extra}
+    return {
+        "id": row_id,
+        "merchant_id": merchant_id,
+        "product_data": json.dumps(data),
+        "cached_at": T0 + timedelta(minutes=minutes),
+    }
+
+
+class FakeProductsCache:
+    """Just enough of products_cache to serve the snapshot's keyset pages."""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.queries = 0
+
+    async def fetch_all(self, query, values=None):
+        self.queries += 1
+        values = values or {}
+        rows = sorted(self.rows, key=lambda r: (r["cached_at"], r["id"]))
+        if "since" in values:
+            rows = [r for r in rows if r["cached_at"] >= values["since"]]
+        if "after_cached_at" in values:
+            after = (values["after_cached_at"], values["after_id"])
+            rows = [r for r in rows if (r["cached_at"], r["id"]) > after]
+        return rows[: values["page_size"]]
+
+
+@pytest.mark.asyncio
+async def test_full_load_then_incremental_refresh(monkeypatch):
+    fake = FakeProductsCache(
+        [
+            _row(1, "m1", "p1", "Red Tee", 1),
+            _row(2, "m1", "p2", "Café Mug", 2),
+            _row(3, "m2", "p3", "Blue Hoodie", 3),
+        ]
+    )
+    monkeypatch.setattr(catalog_snapshot_module, "database", fake)
+    snap = CatalogSnapshot(enabled=True, page_size=2)
+
+    await snap.refresh(full=True)
+    assert snap.ready
+    assert len(snap) == 3
+    assert [e.row_key for e in snap.select_matching(["m1", "m2"], 10, ["mug"])] == ["2"]
+    assert snap.get("2").title == "café mug"
+
+    # Row 1 is re-cached with a new title and row 4 arrives.
+    fake.rows[0] = _row(1, "m1", "p1", "Green Tee", 10)
+    fake.rows.append(_row(4, "m2", "p4", "Grey Hoodie", 11))
+    await snap.refresh()
+
+    assert len(snap) == 4
+    assert snap.select_matching(["m1", "m2"], 10, ["red"]) == []
+    assert [e.row_key for e in snap.select_matching(["m1", "m2"], 10, ["green"])] == ["1"]
+    assert [e.row_key for e in snap.select(["m2", "m1"], 1)] == ["1", "4"]
+    assert [e.row_key for e in snap.select(["m1"], 5)] == ["1", "2"]
+
+    stats = snap.stats()
+    assert stats["full_loads"] == 1
+    assert stats["incremental_refreshes"] == 1
+    assert stats["memory_bytes"] > 0
+    assert stats["age_s"] is not None and stats["age_s"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_oversized_catalog_is_not_served(monkeypatch):
+    fake = FakeProductsCache([_row(i, "m1", f"p{i}", f"Tee {i}", i) for i in range(5)])
+    monkeypatch.setattr(catalog_snapshot_module, "database", fake)
+    snap = CatalogSnapshot(enabled=True, max_rows=3, page_size=2)
+
+    for _ in range(5):
+        assert await snap.ensure_fresh() is False
+        await snap._refresh_task
+    assert not snap.ready
+    assert snap.stats()["oversized"] is True
+    # The oversized scan is not repeated per request until the reload interval.
+    assert snap.stats()["full_loads"] == 1
+    assert fake.queries == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_full_load_backs_off(monkeypatch):
+    class BrokenDB:
+        queries = 0
+
+        async def fetch_all(self, query, values=None):
+            BrokenDB.queries += 1
+            raise ConnectionError("down")
+
+    monkeypatch.setattr(catalog_snapshot_module, "database", BrokenDB())
+    snap = CatalogSnapshot(enabled=True)
+    for _ in range(5):
+        assert await snap.ensure_fresh() is False
+        await snap._refresh_task
+    assert BrokenDB.queries == 1
+    assert snap.stats()["refresh_errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_find_products_multi_reads_from_snapshot(monkeypatch):
+    fake = FakeProductsCache(
+        [
+            _row(1, "m1", "p1", "Red Tee", 1),
+            _row(2, "m1", "p2", "Blue Hoodie", 2),
+            _row(3, "m2", "p3", "Green Tee", 3),
+        ]
+    )
+    monkeypatch.setattr(catalog_snapshot_module, "database", fake)
+    snap = CatalogSnapshot(enabled=True)
+    await snap.refresh(full=True)
+    monkeypatch.setattr(agent_shop_gateway, "catalog_snapshot", snap)
+
+    class FakeGatewayDB:
+        async def fetch_all(self, query, values=None):
+            if "merchant_onboarding" in query:
+                return [
+                    {"merchant_id": "m1", "business_name": "Shop One"},
+                    {"merchant_id": "m2", "business_name": "Shop Two"},
+                ]
+            if "products_cache" in query:
+                raise AssertionError("snapshot path should not query products_cache")
+            return []
+
+    monkeypatch.setattr("db.database.database", FakeGatewayDB())
+
+    payload = agent_shop_gateway.FindProductsMultiPayload(search={"query": "tee", "limit": 10})
+    result = await agent_shop_gateway._handle_find_products_multi(payload, None, BackgroundTasks())
+
+    assert {p["id"] for p in result["products"]} == {"p1", "p3"}
+    assert {p["merchant_name"] for p in result["products"]} == {"Shop One", "Shop Two"}
+    assert result["metadata"]["merchant_products_source"] == "catalog_snapshot"
+    assert result["metadata"]["merchant_products_loaded"] == 3
+
+
+@pytest.mark.asyncio
+async def test_reads_during_index_rebuild_use_the_previous_snapshot(monkeypatch):
+    fake = FakeProductsCache([_row(i, f"m{i % 3}", f"p{i}", f"Red Tee {i}", i) for i in range(30)])
+    monkeypatch.setattr(catalog_snapshot_module, "database", fake)
+    snap = CatalogSnapshot(enabled=True)
+    snap.index_rebuild_ratio = 0.0
+    await snap.refresh(full=True)
+    merchants = ["m0", "m1", "m2"]
+    before = [e.row_key for e in snap.select_matching(merchants, 50, ["tee"])]
+    assert len(before) == 30
+
+    entered, release = threading.Event(), threading.Event()
+    build = catalog_snapshot_module._build_text_index
+
+    def slow_build(entries):
+        entered.set()
+        release.wait(5)
+        return build(entries)
+
+    monkeypatch.setattr(catalog_snapshot_module, "_build_text_index", slow_build)
+
+    async def while_building(refresh):
+        entered.clear()
+        release.clear()
+        task = asyncio.ensure_future(refresh)
+        while not entered.is_set():
+            await asyncio.sleep(0.005)
+        try:
+            return snap.ready, snap.select_matching(merchants, 50, ["tee"])
+        finally:
+            release.set()
+            await task
+
+    # Full reload: every row re-cached; the old snapshot serves until the swap.
+    fake.rows = [_row(i, f"m{i % 3}", f"p{i}", f"Red Tee {i}", 100 + i) for i in range(30)]
+    ready, during = await while_building(snap.refresh(full=True))
+    assert ready and sorted(e.row_key for e in during) == sorted(before)
+    assert len(snap.select_matching(merchants, 50, ["tee"])) == 30
+
+    # Incremental refresh that triggers a rebuild: dirty rows stay visible.
+    fake.rows.append(_row(30, "m0", "p30", "Blue Tee", 200))
+    ready, during = await while_building(snap.refresh())
+    assert ready and len(during) == 31
+    assert len(snap.select_matching(merchants, 50, ["tee"])) == 31
+
+
+@pytest.mark.asyncio
+async def test_typo_correction_is_the_same_on_snapshot_and_batch_paths(monkeypatch):
+    rows = [
+        _row(1, "m1", "p1", "Grey Hoodie", 1),
+        _row(2, "m1", "p2", "Red Tee", 2),
+        _row(3, "m2", "p3", "Zip Hoodie", 3),
+    ]
+    monkeypatch.setattr(catalog_snapshot_module, "database", FakeProductsCache(rows))
+
+    class FakeGatewayDB:
+        async def fetch_all(self, query, values=None):
+            if "merchant_onboarding" in query:
+                return [{"merchant_id": "m1", "business_name": "One"}, {"merchant_id": "m2", "business_name": "Two"}]
+            if "products_cache" in query:
+                return sorted(rows, key=lambda r: (r["merchant_id"], -r["id"]))
+            return []
+
+    monkeypatch.setattr("db.database.database", FakeGatewayDB())
+    payload = agent_shop_gateway.FindProductsMultiPayload(search={"query": "hodie", "limit": 10})
+
+    results = {}
+    for enabled in (True, False):
+        snap = CatalogSnapshot(enabled=enabled)
+        if enabled:
+            await snap.refresh(full=True)
+        monkeypatch.setattr(agent_shop_gateway, "catalog_snapshot", snap)
+        result = await agent_shop_gateway._handle_find_products_multi(payload, None, BackgroundTasks())
+        results[result["metadata"]["merchant_products_source"]] = (
+            [p["id"] for p in result["products"]],
+            result["metadata"]["typo_corrections"],
+        )
+
+    assert results["catalog_snapshot"] == results["batch_cache_query"] == (["p1", "p3"], {"hodie": ["hoodie"]})
@@ -0,0 +1,187 @@
+import glob
+import itertools
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import BackgroundTasks
+
+from routes import agent_shop_gateway
+from services import catalog_snapshot as catalog_snapshot_module
+from services.catalog_snapshot import CatalogEntry, CatalogSnapshot
+from services.catalog_text_index import CatalogTextIndex
+from models.standard_product import StandardProduct
+
+TEE_DIR = os.path.join(os.path.dirname(__file__), "tee")
+
+TITLES = [
+    "Oversized Graphic Tee",
+    "Quick-Dry Running T-Shirt",
+    "Basic T Shirt",
+    "Merino Wool Tee",
+    "Camiseta básica negra",
+    "Playera oversize",
+    "CloudFit Hoodie",
+    "Sudadera con capucha",
+    "AeroFlex Joggers",
+    "Pantalones jogger",
+    "Lace Lingerie Set",
+    "Conjunto de lencería",
+    "Silk Bathrobe",
+    "Bata de casa",
+    "Denim Jacket",
+    "Chaqueta de cuero",
+    "Pleated Midi Skirt",
+    "Falda plisada",
+    "Cropped Top",
+    "Labubu Vinyl Figure",
+    "Plush Teddy Doll",
+    "Designer Art Toy Blind Box",
+    "Juguete educativo de madera",
+    "Teeth Whitening Kit",
+    "Teen Streetwear Set",
+    "Little Black Dress",
+    "T恤 classic",
+]
+DESCRIPTIONS = [
+    "",
+    "Soft cotton, perfect for a first date or a coffee date.",
+    "Streetwear staple with a relaxed fit.",
+    "Ropa elegante para una cita.",
+    "Waterproof and quick dry for running and diving.",
+    "Great gift for collectors and kids.",
+    "Sin tops cortos, ideal para la noche.",
+    "Comfortable underwear basics.",
+]
+TYPES = ["T-Shirts", "Tees", "Hoodies", "Joggers", "Lingerie", "Outerwear", "Skirts", "Toys", "Beauty", "Dresses", ""]
+
+
+def _tee_case_queries():
+    queries = []
+    for path in sorted(glob.glob(os.path.join(TEE_DIR, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        for case in cfg.get("cases", []):
+            req = case.get("request") or {}
+            queries.append((req.get("query", ""), req.get("recent_queries") or []))
+    return sorted(set((q, tuple(r)) for q, r in queries))
+
+
+def _synthetic_rows(n_merchants=4, per_merchant=60, seed=7):
+    rng = random.Random(seed)
+    t0 = datetime(2025, 1, 1)
+    rows = []
+    row_id = 0
+    for m in range(n_merchants):
+        for i in range(per_merchant):
+            row_id += 1
+            data = {
+                "id": f"p{row_id}",
+                "title": f"{rng.choice(TITLES)} {rng.choice(['', 'Negra', 'Navy', 'XL'])}".strip(),
+                "description": rng.choice(DESCRIPTIONS),
+                "product_type": rng.choice(TYPES),
+                "price": float(rng.randint(5, 120)),
+                "currency": "USD",
+            }
+            rows.append(
+                {
+                    "id": row_id,
+                    "merchant_id": f"m{m}",
+                    "product_data": json.dumps(data),
+                    "cached_at": t0 + timedelta(minutes=rng.randint(0, 10000), seconds=row_id),
+                }
+            )
+    return rows
+
+
+class FakeDB:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetch_all(self, query, values=None):
+        values = values or {}
+        if "merchant_onboarding" in query:
+            return [{"merchant_id": f"m{i}", "business_name": f"Shop {i}"} for i in range(4)]
+        if "FROM products_cache" in query and "page_size" in values:
+            rows = sorted(self.rows, key=lambda r: (r["cached_at"], r["id"]))
+            return rows[: values["page_size"]]
+        if "products_cache" in query:
+            raise AssertionError(f"unexpected products_cache query: {query}")
+        return []
+
+
+async def _run(payload):
+    result = await agent_shop_gateway._handle_find_products_multi(payload, None, BackgroundTasks())
+    return [p["id"] for p in result["products"]], result["total"], result["metadata"]
+
+
+@pytest.mark.asyncio
+async def test_index_candidates_match_full_scan_on_tee_cases(monkeypatch):
+    fake = FakeDB(_synthetic_rows())
+    monkeypatch.setattr(catalog_snapshot_module, "database", fake)
+    monkeypatch.setattr("db.database.database", fake)
+
+    snap = CatalogSnapshot(enabled=True, page_size=10000)
+    await snap.refresh(full=True)
+    monkeypatch.setattr(agent_shop_gateway, "catalog_snapshot", snap)
+    index = snap._text_index
+    assert index is not None
+    # Typo corrections are covered separately; keep both runs exact-match only.
+    snap._vocabulary = None
+
+    checked = 0
+    for query, recent in _tee_case_queries():
+        if not query.strip():
+            continue
+        payload = agent_shop_gateway.FindProductsMultiPayload(
+            search={"query": query, "limit": 100},
+            user={"recent_queries": list(recent)},
+        )
+        snap._text_index = index
+        indexed = await _run(payload)
+        snap._text_index = None
+        scanned = await _run(payload)
+        assert indexed[:2] == scanned[:2], query
+        assert indexed[2]["merchant_products_loaded"] == scanned[2]["merchant_products_loaded"]
+        checked += 1
+    assert checked > 50
+
+
+def test_containing_is_exact_and_short_needles_are_not_narrowed():
+    entries = [
+        CatalogEntry.from_product(StandardProduct(id=f"p{i}", title=title), "m1")
+        for i, title in enumerate(["Red T-Shirt", "Tshirt dress", "Blue Hoodie", "Café tee"])
+    ]
+    index = CatalogTextIndex(entries)
+
+    assert [e.product.id for e in index.containing("tshirt")] == ["p0", "p1"]
+    assert [e.product.id for e in index.containing("hood")] == ["p2"]
+    assert index.containing("zzz") == []
+    assert index.containing("te") is None
+
+
+def test_candidate_lookup_stays_flat_as_catalog_grows():
+    def build(n):
+        words = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel"]
+        entries = []
+        for i, combo in zip(range(n), itertools.cycle(itertools.permutations(words, 3))):
+            title = " ".join(combo) + f" item{i}"
+            entries.append(CatalogEntry.from_product(StandardProduct(id=f"p{i}", title=title), "m1"))
+        # One rare product that every size must find.
+        entries.append(CatalogEntry.from_product(StandardProduct(id="rare", title="Zebra Kimono"), "m1"))
+        return CatalogTextIndex(entries)
+
+    def lookup_cost(index):
+        started = time.perf_counter()
+        for _ in range(200):
+            found = index.containing("zebrakimono")
+        assert [e.product.id for e in found] == ["rare"]
+        return time.perf_counter() - started
+
+    small, large = build(500), build(20000)
+    lookup_cost(small)
+    # A selective needle touches only its own postings, not the whole catalog.
+    assert lookup_cost(large) < lookup_cost(small) * 5 + 0.05
@@ -0,0 +1,86 @@
+import json
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import combinations
+
+import pytest
+
+from services import popularity_service
+from services.co_purchase_service import CoPurchaseGraph, CoPurchaseIndex
+from services.popularity_service import PopularityIndex
+
+
+def _items(*pids, merchant="m1"):
+    return [((merchant, pid), 1) for pid in pids]
+
+
+def test_counts_pairs_once_per_order_and_ranks():
+    graph = CoPurchaseGraph(max_neighbors=10)
+    graph.add_order(_items("a", "b", "c"))
+    graph.add_order(_items("a", "b", "b"))  # duplicates within an order count once
+    graph.add_order(_items("a"))  # single-item orders add nothing
+    assert graph.neighbors("a", 5) == [("b", 2), ("c", 1)]
+    assert graph.neighbors("a", 5, min_support=2) == [("b", 2)]
+    assert graph.has_data("c", 1) and not graph.has_data("c", 2) and not graph.has_data("zzz")
+
+
+def test_memory_stays_bounded_and_strong_pairs_survive():
+    rng = random.Random(1)
+    graph = CoPurchaseGraph(max_neighbors=5, max_products=300)
+    exact = Counter()
+    for _ in range(5000):
+        # "hub" is bought with its partner most of the time, plus random noise.
+        order = ["hub", "partner"] if rng.random() < 0.3 else []
+        order += [f"p{rng.randint(1, 2000)}" for _ in range(rng.randint(1, 4))]
+        order = list(dict.fromkeys(order))
+        graph.add(order)
+        exact.update(combinations(sorted(order), 2))
+
+    assert len(graph) <= 300
+    assert all(len(row) <= 2 * 5 for row in graph._pairs.values())
+    assert graph.pruned_pairs > 0 and graph.evicted_products > 0
+    assert graph.neighbors("hub", 1) == [("partner", exact[("hub", "partner")])]
+
+
+class FakeOrdersDB:
+    def __init__(self, orders):
+        self.orders = orders
+
+    async def fetch_all(self, query, values=None):
+        values = values or {}
+        rows = sorted(({**o, "id": i} for i, o in enumerate(self.orders)), key=lambda o: (o["created_at"], o["id"]))
+        if "since" in values:
+            return [o for o in rows if o["created_at"] >= values["since"]][: values["page_size"]]
+        rows.reverse()
+        if "after_created_at" in values:
+            after = (values["after_created_at"], values["after_id"])
+            rows = [o for o in rows if (o["created_at"], o["id"]) < after]
+        return rows[: values["page_size"]]
+
+
+def _order(ts, *pids):
+    items = json.dumps([{"product_id": p, "quantity": 1} for p in pids])
+    return {"merchant_id": "m1", "items": items, "created_at": ts, "creator_id": None, "creator_id_alt": None}
+
+
+@pytest.mark.asyncio
+async def test_fed_incrementally_by_the_popularity_order_stream(monkeypatch):
+    t0 = datetime(2025, 1, 1)
+    orders = [_order(t0, "a", "b"), _order(t0 + timedelta(seconds=1), "a", "b", "c")]
+    monkeypatch.setattr(popularity_service, "database", FakeOrdersDB(orders))
+    source = PopularityIndex(enabled=True, refresh_interval_s=0, full_reload_interval_s=3600)
+    index = CoPurchaseIndex(source, enabled=True, min_support=2)
+
+    assert await index.has_data("a") is False  # cold: schedules the first load, never blocks
+    await source.refresh(full=True)
+    assert await index.has_data("a") and not await index.has_data("c")
+    assert await index.neighbors("a", 5) == [("b", 1.0)]
+
+    orders.append(_order(t0 + timedelta(seconds=2), "c", "a"))
+    await source.refresh()
+    assert await index.neighbors("a", 5) == [("b", 1.0), ("c", 1.0)]
+
+    # A full reload replays from scratch instead of double counting.
+    await source.refresh(full=True)
+    assert index.graph.neighbors("a", 5) == [("b", 2), ("c", 2)]
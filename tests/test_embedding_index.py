@@ -0,0 +1,116 @@
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from services import neighbor_table as nt
+from services.embedding_index import EmbeddingIndex, EmbeddingIndexProvider, HashedTfidfFeaturizer, build_index, write_index
+from services.similarity_service import SimilarityService
+
+TOPICS = {
+    "shirts": "cotton linen tee shirt polo collar sleeve button oxford flannel",
+    "toys": "plush bear robot puzzle blocks train doll kite marble yoyo",
+    "serums": "vitamin serum retinol hyaluronic niacinamide peptide toner essence glow",
+    "shoes": "sneaker boot loafer sandal heel trainer runner leather suede lace",
+}
+
+
+def _corpus(n, seed=3):
+    rng = random.Random(seed)
+    noise = "red blue green black white large small classic premium vintage".split()
+    ids, texts = [], []
+    for i in range(n):
+        topic = rng.choice(sorted(TOPICS))
+        words = rng.sample(TOPICS[topic].split(), rng.randint(2, 4)) + rng.sample(noise, 2)
+        ids.append(f"p{i}")
+        texts.append(f"{' '.join(words)} {topic}")
+    return ids, texts
+
+
+def test_hashed_tfidf_vectors_are_normalized_and_stable():
+    featurizer = HashedTfidfFeaturizer(dim=64).fit(["red cotton tee", "blue cotton tee", "plush bear"])
+    vectors = featurizer.transform(["Red Cotton Tee", "red cotton tee!", "plush bear", ""])
+    assert np.allclose(np.linalg.norm(vectors[:3], axis=1), 1.0) and not vectors[3].any()
+    assert vectors[0] @ vectors[1] == pytest.approx(1.0)
+    assert vectors[0] @ vectors[2] < 0.5
+    # Rare tokens weigh more than common ones.
+    assert featurizer.idf[featurizer._buckets("plush")[0]] > featurizer.idf[featurizer._buckets("cotton")[0]]
+    restored = HashedTfidfFeaturizer.restore(featurizer.config(), featurizer.arrays())
+    assert np.array_equal(restored.transform(["plush bear"]), vectors[2:3])
+
+
+def test_ivf_recall_at_10_against_brute_force(tmp_path):
+    ids, texts = _corpus(4000)
+    write_index(str(tmp_path), ids, texts, HashedTfidfFeaturizer(dim=128))
+    index = EmbeddingIndex.open(str(tmp_path), nprobe=8)
+    assert index.meta["nlist"] == 63 and isinstance(index.vectors, np.memmap)
+
+    rng = random.Random(0)
+    hits = total = 0
+    for pid in rng.sample(ids, 200):
+        vector = np.asarray(index.vectors[index.rows[pid]])
+        exact = index.search(vector, 10, exclude={pid}, exact=True)
+        approx = index.search_by_id(pid, 10)
+        # Score-based recall: ties at the 10th score are interchangeable.
+        kth = exact[-1][1]
+        hits += sum(1 for _, score in approx if score >= kth)
+        total += len(exact)
+    assert hits / total >= 0.9
+
+    # Scanning every cell is exact.
+    index.nprobe = index.meta["nlist"]
+    vector = np.asarray(index.vectors[0])
+    assert index.search(vector, 10) == index.search(vector, 10, exact=True)
+
+
+T0 = datetime(2025, 1, 1)
+
+
+class FakeDB:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetch_all(self, query, values=None):
+        rows = sorted(self.rows, key=lambda r: (r["cached_at"], r["id"]))
+        if "cursor_cached_at" in values:
+            rows = [r for r in rows if (r["cached_at"], r["id"]) > (values["cursor_cached_at"], values["cursor_id"])]
+        return rows[: values["limit"]]
+
+
+@pytest.mark.asyncio
+async def test_content_embedding_strategy_serves_from_index(monkeypatch, tmp_path):
+    rows = [
+        {"id": i, "cached_at": T0 + timedelta(minutes=i), "product_data": {"id": pid, "title": title, "product_type": ptype, "price": 10.0}}
+        for i, (pid, title, ptype) in enumerate(
+            [
+                ("tee1", "Red Cotton Tee", "Shirts"),
+                ("tee2", "Blue Cotton Tee", "Shirts"),
+                ("bear", "Plush Bear", "Toys"),
+                ("gone", "Red Cotton Tee", "Shirts"),
+            ]
+        )
+    ]
+    rows[3]["product_data"]["status"] = "inactive"
+    monkeypatch.setattr(nt, "database", FakeDB(rows))
+    built = await build_index(str(tmp_path), dim=64)
+    assert built["products"] == 3  # inactive products are not indexed
+
+    svc = SimilarityService(embedding_indexes=EmbeddingIndexProvider(str(tmp_path), reload_s=0))
+
+    async def no_db(*_args, **_kwargs):
+        raise AssertionError("indexed products must not touch the database")
+
+    monkeypatch.setattr(svc, "_load_base_product", no_db)
+    result = await svc.findSimilar({"baseProductId": "tee1", "limit": 2, "strategy": "content_embedding"})
+    assert result[0].productId == "tee2" and "tee1" not in [c.productId for c in result]
+
+    # Products missing from the index are embedded from their text.
+    async def load_base(pid):
+        from models.standard_product import StandardProduct
+
+        return StandardProduct(id=pid, title="Teddy Plush Bear", product_type="Toys")
+
+    monkeypatch.setattr(svc, "_load_base_product", load_base)
+    result = await svc.findSimilar({"baseProductId": "new", "limit": 2, "strategy": "content_embedding"})
+    assert result[0].productId == "bear"
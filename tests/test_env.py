@@ -0,0 +1,37 @@
+import pytest
+
+from services.co_purchase_service import CoPurchaseIndex
+from services.env import env_flag, env_float, env_int
+from services.popularity_service import PopularityIndex
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [(None, True), ("", True), ("  ", True), ("0", False), ("OFF", False), (" no ", False), ("1", True), ("enabled", True)],
+)
+def test_env_flag(monkeypatch, raw, expected):
+    if raw is None:
+        monkeypatch.delenv("TEST_FLAG", raising=False)
+    else:
+        monkeypatch.setenv("TEST_FLAG", raw)
+    assert env_flag("TEST_FLAG", True) is expected
+
+
+def test_env_numbers_fall_back_on_missing_or_bad_values(monkeypatch):
+    monkeypatch.delenv("TEST_NUM", raising=False)
+    assert env_int("TEST_NUM", 7) == 7 and env_float("TEST_NUM", 1.5) == 1.5
+    monkeypatch.setenv("TEST_NUM", " 42 ")
+    assert env_int("TEST_NUM", 7) == 42 and env_float("TEST_NUM", 1.5) == 42.0
+    monkeypatch.setenv("TEST_NUM", "4.5")
+    assert env_int("TEST_NUM", 7) == 7 and env_float("TEST_NUM", 1.5) == 4.5
+    monkeypatch.setenv("TEST_NUM", "lots")
+    assert env_int("TEST_NUM", 7) == 7 and env_float("TEST_NUM", 1.5) == 1.5
+
+
+def test_services_parse_flags_the_same_way(monkeypatch):
+    monkeypatch.setenv("CO_PURCHASE_ENABLED", "enabled")
+    assert CoPurchaseIndex(PopularityIndex(enabled=False)).enabled is True
+    monkeypatch.setenv("CO_PURCHASE_ENABLED", "")
+    assert CoPurchaseIndex(PopularityIndex(enabled=False)).enabled is True
+    monkeypatch.setenv("CO_PURCHASE_ENABLED", "off")
+    assert CoPurchaseIndex(PopularityIndex(enabled=False)).enabled is False
@@ -0,0 +1,222 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import BackgroundTasks, HTTPException
+
+from routes import agent_shop_gateway
+from db.database import _NullDatabase
+from models.standard_product import StandardProduct
+from services import product_query_service as query_module
+from services.product_query_service import ProductFilter, filter_products
+
+T0 = datetime(2025, 1, 1)
+
+
+def _unlike(pattern):
+    return pattern[1:-1].replace("\\%", "%").replace("\\_", "_").replace("\\\\", "\\")
+
+
+class FakeDB:
+    """Evaluates the paged products_cache queries from their bound values."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def _match(self, values):
+        out = []
+        for r in self.rows:
+            d = r["product_data"]
+            if r["merchant_id"] != values["merchant_id"]:
+                continue
+            if "q_like" in values:
+                needle = _unlike(values["q_like"])
+                if not any(needle in (d.get(k) or "").lower() for k in ("title", "description", "product_type")):
+                    continue
+            if "cat_like" in values and _unlike(values["cat_like"]) not in (d.get("product_type") or "").lower():
+                continue
+            if "price_min" in values and not d["price"] >= values["price_min"]:
+                continue
+            if "price_max" in values and not d["price"] <= values["price_max"]:
+                continue
+            out.append(r)
+        return sorted(out, key=lambda r: (r["cached_at"], r["id"]), reverse=True)
+
+    async def fetch_one(self, query, values=None):
+        self.queries.append((query, dict(values)))
+        assert "COUNT(*)" in query
+        return {"n": min(len(self._match(values)), values["count_cap"])}
+
+    async def fetch_all(self, query, values=None):
+        self.queries.append((query, dict(values)))
+        rows = self._match(values)
+        if "after_id" in values:
+            after_id = values["after_id"]
+            assert isinstance(after_id, str)
+            if "AS bigint" in query:
+                after_id = int(after_id)
+            elif "AS uuid" in query:
+                after_id = uuid.UUID(after_id)
+            after = (values["after_cached_at"], after_id)
+            rows = [r for r in rows if (r["cached_at"], r["id"]) < after]
+        rows = rows[values.get("offset", 0) :]
+        return rows[: values["limit"]]
+
+
+def _catalog(n=120):
+    rows = []
+    for i in range(n):
+        rows.append(
+            {
+                "id": i + 1,
+                # Pairs of rows share a cached_at so the id tie-breaker matters.
+                "cached_at": T0 + timedelta(minutes=i // 2),
+                "merchant_id": "m1",
+                "product_data": {
+                    "id": f"p{i}",
+                    "title": f"{'Red' if i % 3 == 0 else 'Blue'} 100%_cotton tee {i}",
+                    "product_type": "T-Shirts" if i % 2 else "Hoodies",
+                    "price": float(i),
+                    "currency": "USD",
+                },
+            }
+        )
+    return rows
+
+
+async def _find(**search):
+    filters = agent_shop_gateway.SearchFilters(merchant_id="m1", **search)
+    return await agent_shop_gateway._handle_find_products(filters, BackgroundTasks())
+
+
+@pytest.mark.asyncio
+async def test_cursor_walk_matches_full_filtered_listing(monkeypatch):
+    fake = FakeDB(_catalog())
+    monkeypatch.setattr(query_module, "database", fake)
+
+    expected = [r["product_data"]["id"] for r in fake._match({"merchant_id": "m1", "q_like": "%red%"})]
+    seen, cursor, pages = [], None, 0
+    while True:
+        result = await _find(query="Red", limit=7, cursor=cursor)
+        assert result["total"] == len(expected)
+        seen.extend(p["id"] for p in result["products"])
+        pages += 1
+        cursor = result["next_cursor"]
+        if not cursor:
+            break
+    assert seen == expected
+    assert pages == -(-len(expected) // 7)
+
+    # Later pages never re-count and never scan from the start.
+    assert sum("COUNT(*)" in q for q, _ in fake.queries) == 1
+    assert all("OFFSET" not in q for q, _ in fake.queries)
+    assert all(v["limit"] == 8 for q, v in fake.queries if "COUNT(*)" not in q)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("make_id", [lambda i: uuid.UUID(int=i), lambda i: f"row-{i:04d}"])
+async def test_cursor_walk_with_non_integer_ids(monkeypatch, make_id):
+    rows = _catalog(30)
+    for row in rows:
+        row["id"] = make_id(row["id"])
+    fake = FakeDB(rows)
+    monkeypatch.setattr(query_module, "database", fake)
+
+    seen, cursor = [], None
+    while True:
+        result = await _find(limit=4, cursor=cursor)
+        seen.extend(p["id"] for p in result["products"])
+        cursor = result["next_cursor"]
+        if not cursor:
+            break
+    assert seen == [f"p{i}" for i in range(29, -1, -1)]
+    id_type = "uuid" if isinstance(rows[0]["id"], uuid.UUID) else "text"
+    assert any(f"CAST(:after_id AS {id_type})" in q for q, _ in fake.queries)
+
+
+@pytest.mark.asyncio
+async def test_filters_are_pushed_down_and_like_is_escaped(monkeypatch):
+    fake = FakeDB(_catalog())
+    monkeypatch.setattr(query_module, "database", fake)
+
+    result = await _find(query="100%_c", category="shirt", price_min=10, price_max=20, limit=50)
+    assert [p["id"] for p in result["products"]] == [f"p{i}" for i in (19, 17, 15, 13, 11)]
+    assert result["next_cursor"] is None
+    _, values = fake.queries[-1]
+    assert values["q_like"] == "%100\\%\\_c%"
+    assert values["cat_like"] == "%shirt%"
+    query, _ = fake.queries[-1]
+    assert "lower(coalesce(product_data->>'product_type', '')) LIKE :cat_like" in query
+
+
+@pytest.mark.asyncio
+async def test_page_number_without_cursor_uses_offset(monkeypatch):
+    fake = FakeDB(_catalog())
+    monkeypatch.setattr(query_module, "database", fake)
+    page3 = await _find(page=3, limit=10)
+    assert [p["id"] for p in page3["products"]][0] == "p99"
+    assert page3["total"] == 120 and page3["next_cursor"]
+    # The cursor returned by an offset page continues from it.
+    page4 = await _find(limit=10, cursor=page3["next_cursor"])
+    assert page4["products"][0]["id"] == "p89"
+
+
+@pytest.mark.asyncio
+async def test_bad_cursor_is_rejected_and_db_errors_fall_back(monkeypatch):
+    fake = FakeDB(_catalog())
+    monkeypatch.setattr(query_module, "database", fake)
+    first = await _find(query="red", limit=5)
+
+    with pytest.raises(HTTPException) as exc:
+        await _find(query="blue", limit=5, cursor=first["next_cursor"])
+    assert exc.value.status_code == 400
+    with pytest.raises(HTTPException):
+        await _find(limit=5, cursor="not-a-cursor")
+
+    class BrokenDB:
+        async def fetch_one(self, *_a, **_k):
+            raise ConnectionError("down")
+
+    monkeypatch.setattr(query_module, "database", BrokenDB())
+
+    async def legacy(**kwargs):
+        return [], "cache", None
+
+    monkeypatch.setattr(agent_shop_gateway, "get_products_hybrid", legacy)
+    result = await _find(limit=5)
+    assert result["metadata"]["pagination"] == "legacy" and result["products"] == []
+
+
+FILTER_CASES = [
+    dict(query="red"),
+    dict(query="  100%_COTTON "),
+    dict(category="Hood", price_min=30),
+    dict(query="tee 1", category="shirt", price_max=60),
+    dict(price_min=5, price_max=5),
+]
+
+
+@pytest.mark.parametrize("case", FILTER_CASES)
+def test_python_fallback_matches_sql_semantics(case):
+    rows = _catalog()
+    product_filter = ProductFilter.build(**case)
+    where, values = product_filter.sql("m1")
+    assert "lower(coalesce(product_data->>'title', '')) LIKE :q_like" in where or "q_like" not in values
+    sql_ids = [r["product_data"]["id"] for r in FakeDB(rows)._match(values)]
+    products = [StandardProduct(**r["product_data"]) for r in FakeDB(rows)._match({"merchant_id": "m1"})]
+    assert [p.id for p in filter_products(products, product_filter)] == sql_ids
+
+
+@pytest.mark.asyncio
+async def test_null_database_filters_in_python(monkeypatch):
+    rows = FakeDB(_catalog())._match({"merchant_id": "m1"})
+    monkeypatch.setattr(query_module, "database", _NullDatabase())
+
+    async def newest(*, merchant_id, limit, agent_id, background_tasks=None):
+        return [StandardProduct(**r["product_data"]) for r in rows[:limit]], "cache", None
+
+    monkeypatch.setattr(query_module, "get_products_hybrid", newest)
+    result = await _find(category="hoodies", price_max=40, page=2, limit=5)
+    assert [p["id"] for p in result["products"]] == [f"p{i}" for i in (30, 28, 26, 24, 22)]
+    assert result["total"] == 21 and result["next_cursor"] is None
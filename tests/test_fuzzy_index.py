@@ -0,0 +1,76 @@
+import json
+import random
+import string
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import BackgroundTasks
+
+from routes import agent_shop_gateway
+from services import catalog_snapshot as catalog_snapshot_module
+from services.catalog_snapshot import CatalogSnapshot
+from services.fuzzy_index import DeletionIndex, edit_distance_leq, fuzzy_token_match
+
+
+def _random_vocab(n, seed=3):
+    rng = random.Random(seed)
+    return sorted({"".join(rng.choice("abcdeilnorst") for _ in range(rng.randint(3, 9))) for _ in range(n)})
+
+
+@pytest.mark.parametrize("max_dist", [1, 2])
+def test_lookup_matches_brute_force_dp(max_dist):
+    vocab = _random_vocab(2000)
+    index = DeletionIndex(vocab, max_distance=2)
+    rng = random.Random(11)
+    for _ in range(200):
+        word = rng.choice(vocab)
+        pos = rng.randrange(len(word))
+        query = word[:pos] + rng.choice(string.ascii_lowercase) + word[pos + 1 :]
+        expected = {t for t in vocab if edit_distance_leq(query, t, max_dist)}
+        assert set(index.lookup(query, max_dist)) == expected, query
+
+
+def test_fuzzy_token_match_keeps_toy_semantics():
+    targets = ["doll", "dolls", "toys"]
+    assert fuzzy_token_match(["tolls", "for", "collectors"], targets, max_dist=1)
+    assert fuzzy_token_match(["toys"], targets, max_dist=1)
+    # Tokens under four chars only match exactly.
+    assert not fuzzy_token_match(["toy"], targets, max_dist=1)
+    assert not fuzzy_token_match(["tables"], targets, max_dist=1)
+
+
+@pytest.mark.asyncio
+async def test_find_products_multi_corrects_query_typos_against_catalog_vocabulary(monkeypatch):
+    t0 = datetime(2025, 1, 1)
+    titles = ["Porcelain Dolls Set", "Velvet Blazer", "Wool Scarf"]
+    rows = [
+        {
+            "id": i,
+            "merchant_id": "m1",
+            "product_data": json.dumps({"id": f"p{i}", "title": title, "price": 20.0}),
+            "cached_at": t0 + timedelta(minutes=i),
+        }
+        for i, title in enumerate(titles)
+    ]
+
+    class FakeDB:
+        async def fetch_all(self, query, values=None):
+            if "merchant_onboarding" in query:
+                return [{"merchant_id": "m1", "business_name": "Shop"}]
+            if "products_cache" in query:
+                return rows
+            return []
+
+    monkeypatch.setattr(catalog_snapshot_module, "database", FakeDB())
+    monkeypatch.setattr("db.database.database", FakeDB())
+    snap = CatalogSnapshot(enabled=True)
+    await snap.refresh(full=True)
+    monkeypatch.setattr(agent_shop_gateway, "catalog_snapshot", snap)
+
+    assert snap.typo_corrections("blazr") == ["blazer"]
+    assert snap.typo_corrections("blazer") == []
+
+    payload = agent_shop_gateway.FindProductsMultiPayload(search={"query": "velvet blazr", "limit": 10})
+    result = await agent_shop_gateway._handle_find_products_multi(payload, None, BackgroundTasks())
+    assert [p["id"] for p in result["products"]] == ["p1"]
+    assert result["metadata"]["typo_corrections"] == {"blazr": ["blazer"]}
@@ -0,0 +1,106 @@
+import glob
+import json
+import os
+import re
+
+from services.catalog_snapshot import compact, strip_accents
+from services.intent_lexicon import tag_product, tag_query
+
+TEE_DIR = os.path.join(os.path.dirname(__file__), "tee")
+
+
+def _legacy_query_intents(q_lower, q_ascii, q_compact):
+    look = "nina studio" in q_lower and any(
+        token in q_lower for token in ["exact outfit", "shop", "look", "wear", "ropa", "outfit"]
+    )
+    exclude_lingerie = any(
+        p in q_lower for p in ("no lingerie", "without lingerie", "sin lenceria", "sin lencería", "sin ropa interior")
+    )
+    toys = any(
+        p in q_ascii
+        for p in ("toy", "toys", "juguete", "juguetes", "art toy", "art toys", "designer toy", "designer toys", "labubu")
+    )
+    tee = bool(
+        q_compact == "tee"
+        or "tshirt" in q_compact
+        or re.search(r"\btees?\b", q_lower)
+        or re.search(r"\bt\s*-?\s*shirts?\b", q_lower)
+        or "t恤" in q_lower
+        or "t 恤" in q_lower
+    )
+    return look, exclude_lingerie, toys, tee
+
+
+def _legacy_product_tags(blob, blob_compact, filters_ascii):
+    tags = set()
+    lingerie = ["lingerie", "lenceria", "lencería", "underwear", "bra", "panties", "ropa interior", "sujetador", "bragas"]
+    if any(tok in blob for tok in lingerie):
+        tags.add("lingerie")
+    if (
+        "tshirt" in blob_compact
+        or re.search(r"\btees?\b", blob)
+        or re.search(r"\bt\s*-?\s*shirts?\b", blob)
+        or "t恤" in blob
+        or "t 恤" in blob
+    ):
+        tags.add("tee")
+    toy_like = [
+        "toy", "toys", "juguete", "juguetes", "doll", "dolls", "plush", "plushie", "peluche", "figure",
+        "figures", "vinyl", "blind box", "collectible", "designer toy", "art toy", "labubu",
+    ]
+    if any(tok in filters_ascii for tok in toy_like):
+        tags.add("toy_like")
+    return tags
+
+
+def _tee_case_queries():
+    out = set()
+    for path in glob.glob(os.path.join(TEE_DIR, "*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            for case in json.load(f).get("cases", []):
+                req = case.get("request") or {}
+                out.add(req.get("query", ""))
+                out.update(req.get("recent_queries") or [])
+    return sorted(out)
+
+
+def test_query_tags_match_legacy_checks():
+    queries = _tee_case_queries() + [
+        "shop the nina studio look without lingerie",
+        "nina studio sin ropa interior",
+        "t恤",
+        "designer toys",
+        "Labubu",
+        "teeth",
+    ]
+    for query in queries:
+        q_lower = query.strip().lower()
+        q_ascii = strip_accents(q_lower)
+        q_compact = compact(q_lower)
+        intents = tag_query(q_lower, q_ascii, q_compact)
+        assert (intents.look, intents.exclude_lingerie, intents.toys, intents.tee) == _legacy_query_intents(
+            q_lower, q_ascii, q_compact
+        ), query
+
+
+def test_product_tags_match_legacy_checks():
+    texts = [
+        "oversized graphic tee",
+        "basic t - shirts pack",
+        "tshirt dress",
+        "teeth whitening kit",
+        "lace bra set",
+        "conjunto de lencería",
+        "zebra print hoodie",
+        "designer art toy blind box",
+        "labubu vinyl figure",
+        "peluche suave",
+        "classic t恤",
+        "wool sweater",
+    ]
+    for blob in texts:
+        blob_compact = compact(blob)
+        filters_ascii = strip_accents(blob)
+        assert set(tag_product(blob, blob_compact, filters_ascii)) == _legacy_product_tags(
+            blob, blob_compact, filters_ascii
+        ), blob
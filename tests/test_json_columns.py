@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from services import json_columns
+from services.json_columns import decode_array, decode_json, decode_object, decode_stats
+
+DOCS = [
+    '{"id": "p1", "price": 19.5, "images": ["a.jpg"], "nested": {"k": [1, 2.5, null, true]}}',
+    '[{"product_id": "p1", "quantity": 2}, {"product_id": "p2"}]',
+    '{"title": "Caf\\u00e9 \\ud83d\\ude00", "lone": "\\ud800", "big": 9007199254740993}',
+    '{"price": NaN, "weird": Infinity}',
+    '{"dup": 1, "dup": 2}',
+    "  [] ",
+]
+
+
+@pytest.fixture(autouse=True)
+def _restore_backend():
+    name = json_columns._backend_name
+    yield
+    json_columns.set_backend(name)
+
+
+@pytest.mark.parametrize("backend", ["orjson", "msgspec", "stdlib"])
+def test_backends_match_stdlib(backend):
+    if backend != "stdlib":
+        pytest.importorskip(backend)
+    assert json_columns.set_backend(backend) == backend
+    for doc in DOCS:
+        expected = json.dumps(json.loads(doc), sort_keys=True)
+        assert json.dumps(decode_json(doc), sort_keys=True) == expected
+        assert json.dumps(decode_json(doc.encode("utf-8")), sort_keys=True) == expected
+
+
+def test_unknown_or_missing_backend_falls_back():
+    assert json_columns.set_backend("does-not-exist") in {"orjson", "msgspec", "stdlib"}
+    assert json_columns.set_backend("stdlib") == "stdlib"
+
+
+def test_typed_helpers_and_stats():
+    json_columns.reset_decode_stats()
+    assert decode_object('{"a": 1}') == {"a": 1}
+    assert decode_object({"already": "decoded"}) == {"already": "decoded"}
+    assert decode_object("[1]") is None
+    assert decode_object("{not json") is None
+    assert decode_object(None) is None
+    assert decode_array('[{"product_id": "p1"}]') == [{"product_id": "p1"}]
+    assert decode_array('{"a": 1}') is None
+
+    stats = decode_stats()
+    assert stats["calls"] == 5 and stats["passthrough"] == 2 and stats["errors"] == 1
+    assert stats["bytes"] > 0 and stats["decode_ms"] >= 0
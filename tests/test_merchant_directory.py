@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import BackgroundTasks
+
+from routes import agent_shop_gateway
+from services.catalog_snapshot import CatalogSnapshot
+from services.merchant_directory import MerchantDirectory
+from services.user_signal_cache import UserSignalCache
+
+
+class FakeDB:
+    def __init__(self, merchants, delay_s=0.0):
+        self.merchants = merchants
+        self.delay_s = delay_s
+        self.reads = 0
+        self.fail = False
+
+    async def fetch_all(self, query, values=None):
+        if "merchant_onboarding" not in query:
+            return []
+        self.reads += 1
+        await asyncio.sleep(self.delay_s)
+        if self.fail:
+            raise ConnectionError("down")
+        rows = [{"merchant_id": m, "business_name": f"Shop {m}"} for m in sorted(self.merchants)]
+        return rows[: values["max_merchants"]]
+
+
+@pytest.mark.asyncio
+async def test_stale_while_revalidate_and_failed_refresh_keeps_serving():
+    db = FakeDB(["m1", "m2"], delay_s=0.01)
+    directory = MerchantDirectory(refresh_interval_s=60)
+
+    # Concurrent cold reads share one load.
+    first = await asyncio.gather(*(directory.get(db) for _ in range(3)))
+    assert first[0] == {"m1": "Shop m1", "m2": "Shop m2"} and db.reads == 1
+    assert (await directory.get(db)) is first[0] and db.reads == 1 and not directory.is_stale()
+
+    db.merchants.append("m3")
+    directory.refresh_interval_s = 0
+    served = await directory.get(db)  # stale copy now, refresh in the background
+    assert "m3" not in served and directory.stats()["stale_reads"] == 1
+    await directory._refresh_task
+    assert "m3" in await directory.get(db)
+
+    db.fail = True
+    await directory.refresh()
+    stats = directory.stats()
+    assert stats["merchants"] == 3 and stats["refresh_errors"] == 1 and stats["last_error"] == "ConnectionError"
+
+
+@pytest.mark.asyncio
+async def test_no_hard_limit_of_100_and_truncation_is_reported():
+    db = FakeDB([f"m{i:04d}" for i in range(250)])
+    assert len(await MerchantDirectory().get(db)) == 250
+
+    capped = MerchantDirectory(max_merchants=200)
+    assert len(await capped.get(db)) == 200 and capped.stats()["truncated"] is True
+
+
+@pytest.mark.asyncio
+async def test_find_products_multi_reads_the_directory(monkeypatch):
+    db = FakeDB([])
+    directory = MerchantDirectory(refresh_interval_s=60)
+    monkeypatch.setattr("db.database.database", db)
+    monkeypatch.setattr(agent_shop_gateway, "merchant_directory", directory)
+
+    payload = agent_shop_gateway.FindProductsMultiPayload(search={"query": "tee", "limit": 10})
+    for _ in range(3):
+        result = await agent_shop_gateway._handle_find_products_multi(payload, None, BackgroundTasks())
+    assert result["metadata"]["merchants_searched"] == 0
+    assert result["metadata"]["merchant_directory_age_s"] is not None
+    assert db.reads == 1
+
+
+class CatalogDB(FakeDB):
+    def __init__(self, merchants):
+        super().__init__(merchants)
+        self.batches = []
+
+    async def fetch_all(self, query, values=None):
+        if "products_cache" not in query:
+            return await super().fetch_all(query, values)
+        mids = [v for k, v in values.items() if k.startswith("mid_")]
+        self.batches.append(mids)
+        return [
+            {"merchant_id": m, "product_data": json.dumps({"id": f"tee-{m}", "title": f"Tee {m}", "price": 10.0})}
+            for m in mids
+        ]
+
+
+@pytest.mark.asyncio
+async def test_find_products_multi_caps_merchants_and_chunks_the_batch_query(monkeypatch):
+    db = CatalogDB([f"m{i}" for i in range(5)])
+    monkeypatch.setattr("db.database.database", db)
+    monkeypatch.setattr(agent_shop_gateway, "merchant_directory", MerchantDirectory(refresh_interval_s=60))
+    monkeypatch.setattr(agent_shop_gateway, "catalog_snapshot", CatalogSnapshot(enabled=False))
+    monkeypatch.setattr(agent_shop_gateway, "user_signal_cache", UserSignalCache(max_users=0))
+    monkeypatch.setattr(agent_shop_gateway, "MULTI_MAX_MERCHANTS", 3)
+    monkeypatch.setattr(agent_shop_gateway, "MULTI_MERCHANT_IN_LIST", 2)
+
+    payload = agent_shop_gateway.FindProductsMultiPayload(search={"query": "tee", "limit": 10})
+    result = await agent_shop_gateway._handle_find_products_multi(payload, None, BackgroundTasks())
+
+    assert db.batches == [["m0", "m1"], ["m2"]]
+    assert result["metadata"]["merchants_searched"] == 3
+    assert sorted(p["id"] for p in result["products"]) == ["tee-m0", "tee-m1", "tee-m2"]
@@ -0,0 +1,119 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from services import product_query_service as query_module
+from services.merchant_product_cache import MerchantProductCache, approx_heap_bytes
+from services.product_query_service import get_products_hybrid
+
+T0 = datetime(2025, 1, 1)
+
+
+class FakeDB:
+    def __init__(self, rows, delay_s=0.0):
+        self.rows = rows
+        self.delay_s = delay_s
+        self.scans = 0
+        self.probes = 0
+
+    async def fetch_all(self, query, values=None):
+        self.scans += 1
+        await asyncio.sleep(self.delay_s)
+        rows = [r for r in self.rows if r["merchant_id"] == values["merchant_id"]]
+        rows.sort(key=lambda r: r["cached_at"], reverse=True)
+        return [{"product_data": r["product_data"], "cached_at": r["cached_at"]} for r in rows[: values["limit"]]]
+
+    async def fetch_one(self, query, values=None):
+        self.probes += 1
+        times = [r["cached_at"] for r in self.rows if r["merchant_id"] == values["merchant_id"]]
+        return {"cached_at": max(times) if times else None}
+
+
+def _rows(merchant, n):
+    return [
+        {
+            "merchant_id": merchant,
+            "cached_at": T0 + timedelta(minutes=i),
+            "product_data": f'{{"id": "{merchant}-{i}", "title": "Item {i}", "price": 10.0}}',
+        }
+        for i in range(n)
+    ]
+
+
+def _cache(**kwargs):
+    kwargs.setdefault("ttl_s", 60)
+    return MerchantProductCache(query_module._load_merchant_products, query_module._newest_cached_at, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_hit_revalidate_and_reload_on_cached_at_change(monkeypatch):
+    rows = _rows("m1", 5)
+    db = FakeDB(rows)
+    monkeypatch.setattr(query_module, "database", db)
+    cache = _cache()
+    monkeypatch.setattr(query_module, "merchant_product_cache", cache)
+
+    products, source, error = await get_products_hybrid(merchant_id="m1", limit=3, agent_id="t")
+    assert ([p.id for p in products], source, error) == (["m1-4", "m1-3", "m1-2"], "cache", None)
+    assert products[0].merchant_id == "m1"
+
+    assert (await cache.get("m1", 2))[1] == "hit" and db.scans == 1 and db.probes == 0
+
+    cache.ttl_s = 0
+    again, outcome = await cache.get("m1", 3)
+    assert outcome == "revalidated" and again[0] is products[0]
+    assert (db.scans, db.probes) == (1, 1)
+
+    rows.append({**rows[0], "cached_at": T0 + timedelta(days=1), "product_data": '{"id": "m1-new", "title": "New"}'})
+    fresh, outcome = await cache.get("m1", 3)
+    assert outcome == "reloaded" and fresh[0].id == "m1-new" and db.scans == 2
+
+    # A complete entry (fewer rows than asked for) serves any larger limit.
+    cache.ttl_s = 60
+    assert (await cache.get("m1", 10))[1] == "reloaded"
+    assert (await cache.get("m1", 50))[1] == "hit"
+    assert cache.stats()["misses"] == 1 and cache.stats()["reloaded"] == 2
+
+
+@pytest.mark.asyncio
+async def test_bounded_by_merchants_and_bytes(monkeypatch):
+    db = FakeDB(_rows("m1", 3) + _rows("m2", 3) + _rows("m3", 3) + _rows("big", 50))
+    monkeypatch.setattr(query_module, "database", db)
+    cache = _cache(max_merchants=2)
+    for mid in ("m1", "m2", "m1", "m3"):
+        await cache.get(mid, 3)
+    assert list(cache._entries) == ["m1", "m3"] and cache.stats()["evicted"] == 1
+
+    # The budget counts hydrated products, several times their JSON size.
+    per_merchant = cache._entries["m1"].nbytes
+    assert per_merchant >= sum(approx_heap_bytes(p) for p in cache._entries["m1"].products) * 0.9
+    assert per_merchant > 3 * sum(len(r["product_data"]) for r in _rows("m1", 3))
+    cache = _cache(max_bytes=per_merchant * 2)
+    for mid in ("m1", "m2", "m3"):
+        await cache.get(mid, 3)
+    assert list(cache._entries) == ["m2", "m3"] and cache.stats()["approx_bytes"] <= per_merchant * 2
+    await cache.get("big", 50)
+    assert "big" not in cache._entries and cache.stats()["oversize"] == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_load_and_errors_keep_contract(monkeypatch):
+    db = FakeDB(_rows("m1", 3), delay_s=0.01)
+    monkeypatch.setattr(query_module, "database", db)
+    cache = _cache()
+    results = await asyncio.gather(*(cache.get("m1", 3) for _ in range(5)))
+    assert db.scans == 1 and cache.stats()["coalesced"] == 4
+    assert all(r[0] == results[0][0] for r in results)
+
+    class BrokenDB:
+        async def fetch_all(self, *_args, **_kwargs):
+            raise ConnectionError("down")
+
+    monkeypatch.setattr(query_module, "database", BrokenDB())
+    monkeypatch.setattr(query_module, "merchant_product_cache", _cache())
+    assert await get_products_hybrid(merchant_id="m1", limit=3, agent_id="t") == (
+        [],
+        "cache",
+        "DB unavailable: ConnectionError",
+    )
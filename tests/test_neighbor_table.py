@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models.standard_product import StandardProduct
+from services import neighbor_table as nt
+from services.neighbor_table import NeighborTable, NeighborTableProvider, compute_neighbors, features_from_product
+from services.similarity_service import SimilarityService
+
+T0 = datetime(2025, 1, 1)
+
+
+def _features(*products):
+    return {f.product_id: f for f in (features_from_product(StandardProduct(**p)) for p in products)}
+
+
+def test_neighbors_follow_live_recall_order():
+    features = _features(
+        {"id": "base", "title": "Red Cotton Tee", "product_type": "Shirts", "price": 20.0},
+        {"id": "band", "title": "Blue Linen Top", "product_type": "shirts", "price": 25.0},
+        {"id": "close", "title": "Red Cotton Tee Jumbo", "product_type": "Shirts", "price": 90.0},
+        {"id": "hoodie", "title": "Red Cotton Hoodie", "product_type": "Hoodies", "price": 20.0},
+        {"id": "toy", "title": "Plush Bear", "product_type": "Toys", "price": 20.0},
+        {"id": "gone", "title": "Red Cotton Tee", "product_type": "Shirts", "price": 20.0, "status": "deleted"},
+    )
+    got = compute_neighbors(features, ["base", "gone"], k=10)
+    # Price band first, then the rest of the type, then other types sharing tokens.
+    assert [pid for pid, _ in got["base"]] == ["band", "close", "hoodie"]
+    assert got["base"][1][1] == round(4 / 5 + 0.1, 3)
+    assert got["gone"] == []
+    assert [pid for pid, _ in compute_neighbors(features, ["base"], k=2)["base"]] == ["band", "close"]
+
+
+class FakeDB:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetch_all(self, query, values=None):
+        values = values or {}
+        rows = sorted(self.rows, key=lambda r: (r["cached_at"], r["id"]))
+        if "after" in values:
+            rows = [r for r in rows if r["cached_at"] > values["after"]]
+        if "cursor_id" in values:
+            cursor = (values["cursor_cached_at"], values["cursor_id"])
+            rows = [r for r in rows if (r["cached_at"], r["id"]) > cursor]
+        return rows[: values["limit"]]
+
+
+def _catalog():
+    types = ["Shirts", "Hoodies", "Toys"]
+    return [
+        {
+            "id": i + 1,
+            "cached_at": T0 + timedelta(minutes=i),
+            "product_data": {
+                "id": f"p{i}",
+                "title": f"{['Red', 'Blue', 'Green'][i % 3]} {['Cotton', 'Wool'][i % 2]} item {i % 4}",
+                "product_type": types[i % 3],
+                "price": float(10 + i),
+            },
+        }
+        for i in range(30)
+    ]
+
+
+def _dump(root):
+    table = NeighborTable.open(str(root))
+    return {pid: table.lookup(pid, 100) for pid in table.ids}
+
+
+@pytest.mark.asyncio
+async def test_build_then_incremental_refresh_matches_full_rebuild(monkeypatch, tmp_path):
+    rows = _catalog()
+    monkeypatch.setattr(nt, "database", FakeDB(rows))
+    monkeypatch.setattr(nt, "SCAN_PAGE_SIZE", 7)
+
+    first = await nt.build_table(str(tmp_path / "inc"), k=5)
+    assert first["products"] == 30
+    table = NeighborTable.open(str(tmp_path / "inc"))
+    assert len(table.lookup("p0", 3)) == 3 and table.lookup("missing", 3) is None
+
+    # A shirt is renamed and repriced, a toy becomes a shirt, and one shirt is new.
+    rows[0]["product_data"] = {**rows[0]["product_data"], "title": "Green Wool item 9", "price": 50.0}
+    rows[0]["cached_at"] = T0 + timedelta(days=1)
+    rows[2]["product_data"] = {**rows[2]["product_data"], "product_type": "Shirts"}
+    rows[2]["cached_at"] = T0 + timedelta(days=1, minutes=1)
+    rows.append(
+        {
+            "id": 99,
+            "cached_at": T0 + timedelta(days=2),
+            "product_data": {"id": "new", "title": "Red Cotton item 1", "product_type": "Shirts", "price": 12.0},
+        }
+    )
+    refreshed = await nt.refresh_table(str(tmp_path / "inc"), k=5)
+    assert refreshed["mode"] == "incremental" and refreshed["changed"] == 3
+    # Hoodies are untouched and keep their stored neighbors.
+    assert refreshed["recomputed"] == 31 - 10
+
+    await nt.build_table(str(tmp_path / "full"), k=5)
+    assert _dump(tmp_path / "inc") == _dump(tmp_path / "full")
+    # Only the live version and its predecessor are kept.
+    assert len([d for d in (tmp_path / "inc").iterdir() if d.is_dir()]) == 2
+
+
+@pytest.mark.asyncio
+async def test_neighbors_strategy_serves_from_table_and_falls_back(monkeypatch, tmp_path):
+    monkeypatch.setattr(nt, "database", FakeDB(_catalog()))
+    await nt.build_table(str(tmp_path), k=5)
+    svc = SimilarityService(neighbor_tables=NeighborTableProvider(str(tmp_path), reload_s=0))
+
+    async def no_db(*_args, **_kwargs):
+        raise AssertionError("table hits must not touch the database")
+
+    monkeypatch.setattr(svc, "_load_base_product", no_db)
+    assert await svc.hasNeighborData("p3") and not await svc.hasNeighborData("missing")
+    result = await svc.findSimilar({"baseProductId": "p3", "limit": 1, "strategy": "neighbors"})
+    assert [c.productId for c in result] == [pid for pid, _ in NeighborTable.open(str(tmp_path)).lookup("p3", 5)]
+
+    live_calls = []
+
+    async def live_base(pid):
+        live_calls.append(pid)
+        return None
+
+    monkeypatch.setattr(svc, "_load_base_product", live_base)
+    assert await svc.findSimilar({"baseProductId": "missing", "limit": 1, "strategy": "neighbors"}) == []
+    assert live_calls == ["missing"]
@@ -0,0 +1,246 @@
+import asyncio
+import json
+import random
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import BackgroundTasks
+
+from routes import agent_shop_gateway
+from services import popularity_service, product_hydration
+from services.popularity_service import PopularityIndex
+
+
+def _orders(n, seed=3, start=datetime(2025, 1, 1)):
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        creator = rng.choice(["c1", "c2", "c3", None])
+        meta = {}
+        if creator:
+            meta["creator_id" if rng.random() < 0.7 else "creatorId"] = creator
+        items = [
+            {"product_id": f"p{rng.randint(1, 40)}", "quantity": rng.choice([1, 1, 2, 3, None])}
+            for _ in range(rng.randint(0, 3))
+        ]
+        out.append(
+            {
+                "merchant_id": rng.choice(["m1", "m2", "m3", ""]),
+                "items": json.dumps(items),
+                "metadata": meta,
+                # Some timestamps collide on purpose.
+                "created_at": start + timedelta(seconds=i // 2),
+                "is_deleted": rng.random() < 0.05,
+                "seq": i,
+                "id": i,
+            }
+        )
+    return out
+
+
+def _newest_first(rows):
+    return sorted(rows, key=lambda r: (r["created_at"], r["seq"]), reverse=True)
+
+
+class FakeDB:
+    def __init__(self, orders, products=()):
+        self.orders = orders
+        self.products = list(products)
+        self.queries = []
+
+    async def fetch_all(self, query, values=None):
+        values = values or {}
+        self.queries.append(query)
+        if "merchant_onboarding" in query:
+            return [{"merchant_id": m, "business_name": f"Shop {m}"} for m in ("m1", "m2", "m3")]
+        if "FROM orders" in query:
+            live = [o for o in self.orders if not o["is_deleted"]]
+            if "creator_id" in values:
+                c = values["creator_id"]
+                live = [o for o in live if c in (o["metadata"].get("creator_id"), o["metadata"].get("creatorId"))]
+            if "since" in values:
+                live = [o for o in sorted(live, key=lambda r: (r["created_at"], r["seq"])) if o["created_at"] >= values["since"]]
+                live = live[: values["page_size"]]
+            else:
+                live = _newest_first(live)
+                if "after_created_at" in values:
+                    after = (values["after_created_at"], values["after_id"])
+                    live = [o for o in live if (o["created_at"], o["id"]) < after]
+                live = live[: values.get("page_size", values.get("window"))]
+            return [
+                {
+                    **o,
+                    "creator_id": o["metadata"].get("creator_id"),
+                    "creator_id_alt": o["metadata"].get("creatorId"),
+                }
+                for o in live
+            ]
+        if "FROM products_cache" in query:
+            merchants = {v for k, v in values.items() if k.startswith("m")}
+            pids = {v for k, v in values.items() if k.startswith("p")}
+            rows = [
+                r
+                for r in self.products
+                if r["merchant_id"] in merchants
+                and (
+                    r["platform_product_id"] in pids
+                    or r["product_data"].get("id") in pids
+                    or r["product_data"].get("product_id") in pids
+                )
+            ]
+            return sorted(rows, key=lambda r: r["cached_at"], reverse=True)
+        return []
+
+
+def _legacy_top(orders, creator, n):
+    live = [o for o in _newest_first(orders) if not o["is_deleted"]]
+    if creator:
+        live = [o for o in live if creator in (o["metadata"].get("creator_id"), o["metadata"].get("creatorId"))]
+        live = live[:400]
+    else:
+        live = live[:800]
+    popularity = Counter()
+    for o in live:
+        if not o["merchant_id"]:
+            continue
+        for item in json.loads(o["items"]):
+            popularity[(o["merchant_id"], item["product_id"])] += max(int(item.get("quantity") or 1), 1)
+    return [k for k, _ in popularity.most_common(n)]
+
+
+@pytest.mark.asyncio
+async def test_windows_match_per_request_scan_across_incremental_refreshes(monkeypatch):
+    orders = _orders(3000)
+    fake = FakeDB(orders[:2000])
+    monkeypatch.setattr(popularity_service, "database", fake)
+
+    # Small pages: the full load walks the (created_at, id) keyset across many pages.
+    index = PopularityIndex(enabled=True, max_orders=100000, page_size=256)
+    await index.refresh(full=True)
+    assert sum("(created_at, id) <" in q for q in fake.queries) == 7
+    for creator in (None, "c1", "c2", "c3", "nobody"):
+        assert await index.top_keys(creator, 20) == _legacy_top(fake.orders, creator, 20), creator
+
+    # New orders (including ones sharing the watermark timestamp) slide the windows.
+    for upto in (2001, 2400, 3000):
+        fake.orders = orders[:upto]
+        await index.refresh()
+        for creator in (None, "c1", "c2", "c3"):
+            assert await index.top_keys(creator, 20) == _legacy_top(fake.orders, creator, 20), (upto, creator)
+    assert index.stats()["scan_fallbacks"] == 0
+
+
+@pytest.mark.asyncio
+async def test_full_reload_builds_off_the_loop_and_fingerprints_only_the_watermark(monkeypatch):
+    orders = _orders(2001)
+    fake = FakeDB(orders[:2000])
+    monkeypatch.setattr(popularity_service, "database", fake)
+    hashed = []
+    sha1 = popularity_service.hashlib.sha1
+    monkeypatch.setattr(popularity_service.hashlib, "sha1", lambda data: hashed.append(data) or sha1(data))
+
+    index = PopularityIndex(enabled=True, max_orders=100000)
+    await index.refresh(full=True)
+    newest = max(o["created_at"] for o in fake.orders if not o["is_deleted"])
+    at_watermark = sum(1 for o in fake.orders if not o["is_deleted"] and o["created_at"] == newest)
+    assert len(hashed) == at_watermark
+    before = await index.top_keys(None, 20)
+
+    entered, release = threading.Event(), threading.Event()
+    build = popularity_service._build_windows
+
+    def slow_build(rows, listeners):
+        entered.set()
+        release.wait(5)
+        return build(rows, listeners)
+
+    monkeypatch.setattr(popularity_service, "_build_windows", slow_build)
+    fake.orders = orders
+    reload = asyncio.ensure_future(index.refresh(full=True))
+    while not entered.is_set():
+        await asyncio.sleep(0.005)
+    # The loop is free and reads are answered from the previous windows.
+    assert await index.top_keys(None, 20) == before
+    release.set()
+    await reload
+    assert await index.top_keys(None, 20) == _legacy_top(orders, None, 20)
+
+
+@pytest.mark.asyncio
+async def test_failed_full_load_is_retried_per_interval_not_per_read(monkeypatch):
+    class BrokenDB:
+        loads = 0
+
+        async def fetch_all(self, query, values=None):
+            if "page_size" in (values or {}):
+                BrokenDB.loads += 1
+                raise ConnectionError("down")
+            return []
+
+    monkeypatch.setattr(popularity_service, "database", BrokenDB())
+    index = PopularityIndex(enabled=True)
+    for _ in range(5):
+        await index.top_keys(None, 10)
+        await index._refresh_task
+    assert BrokenDB.loads == 1
+    assert index.stats()["refresh_errors"] == 1 and index.stats()["scan_fallbacks"] == 5
+
+
+@pytest.mark.asyncio
+async def test_truncated_load_falls_back_to_scan_for_thin_creators(monkeypatch):
+    orders = _orders(1500)
+    fake = FakeDB(orders)
+    monkeypatch.setattr(popularity_service, "database", fake)
+
+    index = PopularityIndex(enabled=True, max_orders=900, page_size=200)
+    await index.refresh(full=True)
+    assert index.stats()["truncated"] is True and index.stats()["global_orders"] == 800
+    assert await index.top_keys("c2", 10) == _legacy_top(orders, "c2", 10)
+    assert await index.top_keys(None, 10) == _legacy_top(orders, None, 10)
+    assert index.stats()["scan_fallbacks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cold_start_reads_popularity_from_memory(monkeypatch):
+    orders = [
+        {
+            "merchant_id": "m1",
+            "items": json.dumps([{"product_id": f"p{i % 3}", "quantity": 1}]),
+            "metadata": {"creator_id": "c1"},
+            "created_at": datetime(2025, 1, 1) + timedelta(minutes=i),
+            "is_deleted": False,
+            "seq": i,
+            "id": i,
+        }
+        for i in range(7)
+    ]
+    products = [
+        {
+            "merchant_id": "m1",
+            "platform_product_id": f"p{i}",
+            "cached_at": datetime(2025, 1, 1),
+            "product_data": {"id": f"p{i}", "title": f"Product {i}", "price": 10.0, "currency": "USD"},
+        }
+        for i in range(3)
+    ]
+    fake = FakeDB(orders, products)
+    index = PopularityIndex(enabled=True)
+    monkeypatch.setattr(popularity_service, "database", fake)
+    monkeypatch.setattr(product_hydration, "database", fake)
+    monkeypatch.setattr("db.database.database", fake)
+    monkeypatch.setattr(agent_shop_gateway, "popularity_index", index)
+    await index.refresh(full=True)
+    fake.queries.clear()
+
+    payload = agent_shop_gateway.FindProductsMultiPayload(search={"query": "", "limit": 3})
+    result = await agent_shop_gateway._handle_find_products_multi(
+        payload, {"creator_id": "c1"}, BackgroundTasks()
+    )
+
+    # p1 and p2 tie on quantity; p2 sold more recently.
+    assert [p["id"] for p in result["products"]] == ["p0", "p2", "p1"]
+    assert result["metadata"]["query_source"] == "creator_top_sellers"
+    assert not [q for q in fake.queries if "FROM orders" in q and "creator_id_alt" not in q]
+    assert len([q for q in fake.queries if "FROM products_cache" in q]) == 1
@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import BackgroundTasks
+
+from routes import agent_shop_gateway
+from services.catalog_snapshot import CatalogSnapshot
+from services.merchant_directory import MerchantDirectory
+from services.prefetch import PrefetchGraph
+from services.user_signal_cache import UserSignalCache
+
+
+@pytest.mark.asyncio
+async def test_branches_run_concurrently_and_dependents_get_results():
+    started = {}
+
+    async def load(name, value, delay_s=0.05):
+        started[name] = asyncio.get_running_loop().time()
+        await asyncio.sleep(delay_s)
+        return value
+
+    graph = PrefetchGraph()
+    graph.add("a", lambda: load("a", 1))
+    graph.add("b", lambda: load("b", 2))
+    graph.add("c", lambda a, b: load("c", a + b, 0.0), after=("a", "b"))
+    assert await graph.run() == {"a": 1, "b": 2, "c": 3}
+
+    assert abs(started["a"] - started["b"]) < 0.02
+    assert started["c"] - started["a"] >= 0.04
+    assert {t["status"] for t in graph.timings.values()} == {"ok"}
+
+    with pytest.raises(ValueError):
+        graph.add("d", lambda: load("d", 0), after=("missing",))
+
+
+@pytest.mark.asyncio
+async def test_optional_branches_degrade_and_required_errors_propagate():
+    async def slow():
+        await asyncio.sleep(1.0)
+
+    async def broken():
+        raise ConnectionError("down")
+
+    graph = PrefetchGraph()
+    graph.add("slow", slow, timeout_s=0.01, fallback="none")
+    graph.add("broken", broken, fallback=[])
+    assert await graph.run() == {"slow": "none", "broken": []}
+    assert graph.timings["slow"]["status"] == "timeout"
+    assert graph.timings["broken"]["status"] == "error"
+
+    sibling_done = asyncio.Event()
+
+    async def sibling():
+        await asyncio.sleep(1.0)
+        sibling_done.set()
+
+    graph = PrefetchGraph()
+    graph.add("broken", broken)
+    graph.add("sibling", sibling)
+    with pytest.raises(ConnectionError):
+        await graph.run()
+    assert graph.timings["sibling"]["status"] == "cancelled"
+    assert not sibling_done.is_set()
+
+
+class FakeGatewayDB:
+    def __init__(self, history_delay_s=0.0, history_error=False):
+        self.history_delay_s = history_delay_s
+        self.history_error = history_error
+
+    async def fetch_all(self, query, values=None):
+        if "merchant_onboarding" in query:
+            await asyncio.sleep(0.05)
+            return [{"merchant_id": "m1", "business_name": "Shop One"}]
+        if "FROM orders" in query:
+            await asyncio.sleep(self.history_delay_s)
+            if self.history_error:
+                raise ConnectionError("orders down")
+            return [{"merchant_id": "m1", "items": json.dumps([{"product_id": "p2", "product_title": "Blue Tee"}])}]
+        if "products_cache" in query:
+            return [
+                {"merchant_id": "m1", "product_data": json.dumps({"id": pid, "title": title, "price": 10.0})}
+                for pid, title in (("p1", "Red Tee"), ("p2", "Blue Tee"))
+            ]
+        return []
+
+
+async def _search(monkeypatch, db):
+    monkeypatch.setattr("db.database.database", db)
+    monkeypatch.setattr(agent_shop_gateway, "merchant_directory", MerchantDirectory(refresh_interval_s=60))
+    monkeypatch.setattr(agent_shop_gateway, "catalog_snapshot", CatalogSnapshot(enabled=False))
+    monkeypatch.setattr(agent_shop_gateway, "user_signal_cache", UserSignalCache(max_users=0))
+    monkeypatch.setattr(agent_shop_gateway, "MULTI_HISTORY_TIMEOUT_S", 0.2)
+    payload = agent_shop_gateway.FindProductsMultiPayload(
+        search={"query": "tee", "limit": 10}, user={"id": "u1"}
+    )
+    return await agent_shop_gateway._handle_find_products_multi(payload, None, BackgroundTasks())
+
+
+@pytest.mark.asyncio
+async def test_find_products_multi_loads_history_alongside_merchants(monkeypatch):
+    result = await _search(monkeypatch, FakeGatewayDB(history_delay_s=0.05))
+    timings = result["metadata"]["prefetch"]
+
+    assert [p["id"] for p in result["products"]] == ["p2", "p1"]
+    assert result["metadata"]["history_boost_applied"] is True
+    assert timings["history"]["status"] == "ok"
+    assert timings["history"]["start_ms"] < 20
+    assert timings["candidates"]["start_ms"] >= timings["merchants"]["ms"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("db", [FakeGatewayDB(history_delay_s=1.0), FakeGatewayDB(history_error=True)])
+async def test_find_products_multi_without_history_when_it_is_slow_or_failing(monkeypatch, db):
+    result = await _search(monkeypatch, db)
+
+    assert {p["id"] for p in result["products"]} == {"p1", "p2"}
+    assert result["metadata"]["prefetch"]["history"]["status"] in {"timeout", "error"}
+    assert result["metadata"]["prefetch"]["candidates"]["status"] == "ok"
@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import BackgroundTasks, HTTPException
+
+from routes import agent_shop_gateway
+from services import product_detail_cache as detail_module
+from services.product_detail_cache import ProductDetailCache
+
+T0 = datetime(2025, 1, 1)
+
+
+class FakeDB:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    async def fetch_one(self, query, values=None):
+        self.queries.append(query)
+        matches = [
+            r
+            for r in self.rows
+            if r["merchant_id"] == values["merchant_id"]
+            and (
+                (
+                    "data_product_id" in query
+                    and values["pid"] in (r["product_data"].get("product_id"), r["platform_product_id"])
+                )
+                or ("product_data->>'id'" in query and r["product_data"].get("id") == values["pid"])
+            )
+        ]
+        if not matches:
+            return None
+        row = max(matches, key=lambda r: r["cached_at"])
+        if "product_data" in query.split("FROM")[0]:
+            return row
+        return {"cached_at": row["cached_at"]}
+
+
+def _catalog(n=2000):
+    # The requested product is the oldest row, far outside the 500 newest.
+    return [
+        {
+            "merchant_id": "m1",
+            "platform_product_id": f"pp{i}",
+            "cached_at": T0 + timedelta(minutes=i),
+            "product_data": {"id": f"pp{i}", "product_id": f"p{i}", "title": f"Item {i}", "price": 10.0},
+        }
+        for i in range(n)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_point_lookup_ttl_hit_revalidation_and_reload(monkeypatch):
+    rows = _catalog()
+    fake = FakeDB(rows)
+    monkeypatch.setattr(detail_module, "database", fake)
+    cache = ProductDetailCache(max_entries=10, ttl_s=60)
+
+    product, outcome = await cache.get("m1", "p0")
+    assert (product.title, product.merchant_id, outcome) == ("Item 0", "m1", "miss")
+    assert len(fake.queries) == 1
+
+    # Matches by product_data.id too, in the same single query.
+    assert (await cache.get("m1", "pp5"))[0].title == "Item 5"
+    assert len(fake.queries) == 2
+
+    fake.queries.clear()
+    assert (await cache.get("m1", "p0"))[1] == "hit"
+    assert fake.queries == []
+
+    # Past the TTL an unchanged cached_at only costs a cached_at probe.
+    cache.ttl_s = 0
+    again, outcome = await cache.get("m1", "p0")
+    assert outcome == "revalidated" and again is product
+    assert "product_data," not in fake.queries[-1]
+
+    rows[0]["cached_at"] = T0 + timedelta(days=30)
+    rows[0]["product_data"] = {**rows[0]["product_data"], "title": "Renamed"}
+    product, outcome = await cache.get("m1", "p0")
+    assert (product.title, outcome) == ("Renamed", "reloaded")
+
+    assert await cache.get("m1", "nope") == (None, "not_found")
+    assert cache.stats()["misses"] == 2
+
+    # Misses are cached for the TTL, then looked up again.
+    cache.ttl_s = 60
+    fake.queries.clear()
+    assert await cache.get("m1", "nope") == (None, "not_found")
+    assert fake.queries == [] and cache.stats()["negative_hits"] == 1
+    rows.append({**rows[1], "platform_product_id": "nope", "cached_at": T0 + timedelta(days=40)})
+    cache.ttl_s = 0
+    assert (await cache.get("m1", "nope"))[1] == "miss"
+
+
+@pytest.mark.asyncio
+async def test_lru_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(detail_module, "database", FakeDB(_catalog(5)))
+    cache = ProductDetailCache(max_entries=2, ttl_s=60)
+    for pid in ("p1", "p2", "p1", "p3"):
+        await cache.get("m1", pid)
+    assert set(cache._entries) == {("m1", "p1"), ("m1", "p3")}
+
+
+@pytest.mark.asyncio
+async def test_handler_uses_point_lookup_and_maps_errors(monkeypatch):
+    fake = FakeDB(_catalog())
+    monkeypatch.setattr(detail_module, "database", fake)
+    monkeypatch.setattr(agent_shop_gateway, "product_detail_cache", ProductDetailCache(ttl_s=60))
+
+    async def no_scan(**_kwargs):
+        raise AssertionError("get_product_detail must not scan the merchant catalog")
+
+    monkeypatch.setattr(agent_shop_gateway, "get_products_hybrid", no_scan)
+
+    fake.rows[3]["product_data"]["variants"] = [{"id": "v1", "title": "S", "price": 10.0}]
+    ref = agent_shop_gateway.ProductRef(merchant_id="m1", product_id="p3")
+    result = await agent_shop_gateway._handle_get_product_detail(ref, BackgroundTasks())
+    assert result["product"]["title"] == "Item 3"
+    assert result["product"]["attributes"]["variants"][0]["variant_id"] == "v1"
+    assert result["metadata"]["detail_cache"] == "miss"
+
+    # Products without variants (the model has no declared `variants` field) still render.
+    ref = agent_shop_gateway.ProductRef(merchant_id="m1", product_id="p4")
+    assert (await agent_shop_gateway._handle_get_product_detail(ref, BackgroundTasks()))["product"]["title"] == "Item 4"
+
+    with pytest.raises(HTTPException) as exc:
+        await agent_shop_gateway._handle_get_product_detail(
+            agent_shop_gateway.ProductRef(merchant_id="m1", product_id="missing"), BackgroundTasks()
+        )
+    assert exc.value.status_code == 404
+
+    class BrokenDB:
+        async def fetch_one(self, *_args, **_kwargs):
+            raise ConnectionError("down")
+
+    monkeypatch.setattr(detail_module, "database", BrokenDB())
+    with pytest.raises(HTTPException) as exc:
+        await agent_shop_gateway._handle_get_product_detail(
+            agent_shop_gateway.ProductRef(merchant_id="m1", product_id="p9"), BackgroundTasks()
+        )
+    assert exc.value.status_code == 502
@@ -0,0 +1,117 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from services import product_hydration
+from services.product_hydration import (
+    load_merchant_products,
+    load_merchant_products_ordered,
+    load_product_by_id,
+    load_products_by_ids,
+)
+
+T0 = datetime(2025, 1, 1)
+
+
+class FakeDB:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    async def fetch_all(self, query, values=None):
+        values = values or {}
+        assert "products_cache" in query
+        self.queries.append(values)
+        if "merchant_id IN" in query:
+            merchants = {v for k, v in values.items() if k.startswith("m")}
+            pids = {v for k, v in values.items() if k.startswith("p")}
+            rows = [
+                r
+                for r in self.rows
+                if r["merchant_id"] in merchants
+                and (
+                    r["platform_product_id"] in pids
+                    or _data(r).get("id") in pids
+                    or _data(r).get("product_id") in pids
+                )
+            ]
+        else:
+            pids = set(values.values())
+            rows = [r for r in self.rows if r["platform_product_id"] in pids or _data(r).get("product_id") in pids]
+        return sorted(rows, key=lambda r: r["cached_at"], reverse=True)
+
+
+def _data(row):
+    data = row["product_data"]
+    return json.loads(data) if isinstance(data, str) else data
+
+
+def _row(merchant_id, platform_id, minutes=0, **data):
+    data.setdefault("id", platform_id)
+    data.setdefault("title", f"{merchant_id}/{platform_id}")
+    return {
+        "merchant_id": merchant_id,
+        "platform_product_id": platform_id,
+        "cached_at": T0 + timedelta(minutes=minutes),
+        "product_data": data,
+    }
+
+
+@pytest.mark.asyncio
+async def test_merchant_pairs_newest_row_wins_in_one_query(monkeypatch):
+    fake = FakeDB(
+        [
+            _row("m1", "p1", title="Old"),
+            _row("m1", "x", minutes=5, product_id="p1", title="New"),
+            _row("m2", "p1", title="Other shop"),
+            {**_row("m2", "p2"), "product_data": json.dumps({"id": "p2", "title": "Json"})},
+        ]
+    )
+    monkeypatch.setattr(product_hydration, "database", fake)
+
+    out = await load_merchant_products([("m1", "p1"), ("m2", "p2"), ("m3", "p1")])
+    assert {k: v.title for k, v in out.items()} == {("m1", "p1"): "New", ("m2", "p2"): "Json"}
+    assert out[("m2", "p2")].merchant_id == "m2"
+    assert len(fake.queries) == 1
+
+
+@pytest.mark.asyncio
+async def test_ordered_hydration_preserves_order_bounds_in_list_and_stops_early(monkeypatch):
+    monkeypatch.setenv("PRODUCT_HYDRATION_MAX_IN_LIST", "4")
+    fake = FakeDB([_row("m1", f"p{i}") for i in range(20) if i % 3])
+    monkeypatch.setattr(product_hydration, "database", fake)
+
+    ranked = [("m1", f"p{i}") for i in reversed(range(20))]
+    products = await load_merchant_products_ordered(ranked)
+    assert [p.id for p in products] == [f"p{i}" for i in reversed(range(20)) if i % 3]
+    assert all(len([k for k in q if k.startswith("p")]) <= 4 for q in fake.queries)
+    assert len(fake.queries) == 5
+
+    fake.queries.clear()
+    products = await load_merchant_products_ordered(ranked, limit=3)
+    assert [p.id for p in products] == ["p19", "p17", "p16"]
+    assert len(fake.queries) == 1
+
+
+@pytest.mark.asyncio
+async def test_products_by_ids_prefers_product_id_and_keys_by_request(monkeypatch):
+    monkeypatch.setenv("PRODUCT_HYDRATION_MAX_IN_LIST", "2")
+    fake = FakeDB(
+        [
+            _row("m1", "a", title="Platform match"),
+            _row("m2", "zz", product_id="a", title="Product id match"),
+            _row("m1", "b", minutes=1, title="B new"),
+            _row("m3", "b", title="B old"),
+            _row("m1", "c"),
+        ]
+    )
+    monkeypatch.setattr(product_hydration, "database", fake)
+
+    out = await load_products_by_ids(["a", "b", "c", "missing", "a"])
+    assert {k: v.title for k, v in out.items()} == {"a": "Product id match", "b": "B new", "c": "m1/c"}
+    assert out["a"].merchant_id == "m2"
+    assert len(fake.queries) == 2
+
+    assert (await load_product_by_id("b")).title == "B new"
+    assert await load_product_by_id("missing") is None
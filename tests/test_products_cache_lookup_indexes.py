@@ -0,0 +1,128 @@
+"""
+EXPLAIN checks for the products_cache lookup queries against a real Postgres.
+
+Needs a scratch database without a `products_cache` table, e.g.
+    PIVOTA_TEST_PG_DSN=postgresql://localhost/pivota_test pytest tests/test_products_cache_lookup_indexes.py
+Everything runs in one transaction that is rolled back.
+"""
+import json
+import os
+import re
+
+import pytest
+
+from models.standard_product import StandardProduct
+from services import product_hydration, similarity_service as similarity_module
+from services.similarity_service import SimilarityService
+
+MIGRATION = os.path.join(
+    os.path.dirname(__file__), "..", "src", "db", "migrations", "060_products_cache_generated_lookup_columns.sql"
+)
+DSN = os.getenv("PIVOTA_TEST_PG_DSN")
+
+pytestmark = pytest.mark.skipif(not DSN, reason="PIVOTA_TEST_PG_DSN not set")
+
+
+class RecordingDB:
+    def __init__(self):
+        self.queries = []
+
+    async def fetch_all(self, query, values=None):
+        self.queries.append((query, dict(values or {})))
+        return []
+
+    async def fetch_one(self, query, values=None):
+        self.queries.append((query, dict(values or {})))
+        return None
+
+
+def _literal(value):
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _render(query, values):
+    # `:name` placeholders only; leave `::type` casts alone.
+    return re.sub(r"(?<!:):([A-Za-z_]\w*)", lambda m: _literal(values[m.group(1)]), query)
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+async def _captured_queries(monkeypatch):
+    recorder = RecordingDB()
+    monkeypatch.setattr(similarity_module, "database", recorder)
+    monkeypatch.setattr(product_hydration, "database", recorder)
+    service = SimilarityService()
+    base = StandardProduct(id="p1", title="Tee", product_type="T-Shirts", price=20.0, currency="USD")
+    await service._search_candidates_content(base, 50, True, (10.0, 40.0), "")
+    await service._load_base_product("p1")
+    await product_hydration.load_products_by_ids(["p1", "p2", "p3"])
+    return recorder.queries
+
+
+@pytest.mark.asyncio
+async def test_lookup_queries_use_generated_column_indexes(monkeypatch):
+    asyncpg = pytest.importorskip("asyncpg")
+    queries = await _captured_queries(monkeypatch)
+    assert any("data_product_type_lower" in q and "data_price" in q for q, _ in queries)
+
+    conn = await asyncpg.connect(DSN)
+    tx = conn.transaction()
+    await tx.start()
+    try:
+        if await conn.fetchval("SELECT to_regclass('public.products_cache')") is not None:
+            pytest.skip("PIVOTA_TEST_PG_DSN must point at a scratch database")
+        await conn.execute(
+            """
+            CREATE TABLE products_cache (
+              id bigserial PRIMARY KEY,
+              merchant_id text NOT NULL,
+              platform_product_id text,
+              product_data jsonb NOT NULL,
+              cached_at timestamptz NOT NULL DEFAULT now()
+            )
+            """
+        )
+        with open(MIGRATION, "r", encoding="utf-8") as f:
+            await conn.execute(f.read())
+
+        rows = [
+            (
+                f"m{i % 20}",
+                f"pp{i}",
+                json.dumps(
+                    {
+                        "id": f"pp{i}",
+                        "product_id": f"p{i}",
+                        "product_type": ["T-Shirts", "Hoodies", "Toys", "Skirts"][i % 4] + str(i % 50),
+                        "price": str(i % 300) if i % 97 else "n/a",
+                        "status": "active",
+                    }
+                ),
+            )
+            for i in range(20000)
+        ]
+        await conn.executemany(
+            "INSERT INTO products_cache (merchant_id, platform_product_id, product_data) VALUES ($1, $2, $3::jsonb)",
+            rows,
+        )
+        # Non-numeric prices become NULL instead of failing inserts or reads.
+        assert await conn.fetchval("SELECT count(*) FROM products_cache WHERE data_price IS NULL") > 0
+        await conn.execute("ANALYZE products_cache")
+        await conn.execute("SET LOCAL enable_seqscan = off")
+
+        for query, values in queries:
+            if "WHERE" not in query:
+                continue  # unfiltered "newest first" fallback
+            plan = json.loads(await conn.fetchval("EXPLAIN (FORMAT JSON) " + _render(query, values)))[0]["Plan"]
+            nodes = list(_plan_nodes(plan))
+            assert not [n for n in nodes if n["Node Type"] == "Seq Scan"], query
+            assert any(n.get("Index Name", "").startswith("idx_products_cache_") for n in nodes), query
+    finally:
+        await tx.rollback()
+        await conn.close()
@@ -0,0 +1,158 @@
+import random
+import re
+
+import pytest
+
+from models.standard_product import StandardProduct
+from routes import agent_shop_gateway
+from services import similarity_scoring
+from services.similarity_config import get_similarity_scoring_weights
+from services.similarity_scoring import (
+    content_scores,
+    personalization_scores,
+    rank_scores,
+    tokenize,
+    top_k_indices,
+)
+
+WORDS = ["red", "blue", "cotton", "tee", "shirt", "hoodie", "zip", "kids", "serum", "vitamin", "cream", "oversized"]
+
+
+@pytest.fixture(params=["numpy", "python"])
+def engine(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(similarity_scoring, "np", None)
+    return request.param
+
+
+# Reference implementations: the per-candidate code the engine replaced.
+def _legacy_tokens(text):
+    return {t for t in re.split(r"[^a-z0-9]+", text.lower()) if len(t) > 2}
+
+
+def _legacy_content(base_tokens, base_type, title, ptype):
+    tokens = _legacy_tokens(f"{title} {ptype or ''}")
+    token_score = len(base_tokens & tokens) / max(len(base_tokens | tokens), 1)
+    bonus = 0.1 if base_type and ptype and base_type == ptype.lower() else 0.0
+    return round(min(1.0, token_score + bonus), 3)
+
+
+def _legacy_personalization(title, queries):
+    title_tokens = set(re.split(r"[^a-z0-9]+", (title or "").lower()))
+    q_tokens = set()
+    for q in queries:
+        q_tokens |= set(re.split(r"[^a-z0-9]+", (q or "").lower()))
+    q_tokens = {t for t in q_tokens if len(t) > 2}
+    if not q_tokens:
+        return 0.0
+    return min(1.0, len(title_tokens & q_tokens) / max(len(q_tokens), 1))
+
+
+def _title(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 5)))
+
+
+def test_content_scores_match_legacy(engine):
+    rng = random.Random(3)
+    for _ in range(50):
+        base_title, base_type = _title(rng), rng.choice(["Shirts", "hoodies", ""])
+        base_tokens = tokenize(f"{base_title} {base_type}")
+        titles = [_title(rng) for _ in range(rng.randint(0, 40))]
+        types = [rng.choice(["shirts", "Hoodies", None, "serums"]) for _ in titles]
+        got = content_scores(base_tokens, base_type, [tokenize(f"{t} {p or ''}") for t, p in zip(titles, types)], types)
+        want = [_legacy_content(set(base_tokens), base_type.lower(), t, p) for t, p in zip(titles, types)]
+        assert got == want
+
+
+def test_rank_scores_match_legacy(engine):
+    rng = random.Random(5)
+    weights = get_similarity_scoring_weights()
+    for _ in range(50):
+        n = rng.randint(0, 30)
+        base_price = rng.choice([0.0, 19.99, 100.0])
+        sims = [rng.choice([None, 0.0, -0.2, rng.random()]) for _ in range(n)]
+        prices = [round(rng.uniform(0, 250), 2) for _ in range(n)]
+        merchants = [rng.random() < 0.5 for _ in range(n)]
+        titles = [_title(rng) for _ in range(n)]
+        queries = [_title(rng) for _ in range(rng.randint(0, 3))]
+        pers = personalization_scores(titles, queries)
+        assert pers == [_legacy_personalization(t, queries) for t in titles]
+
+        got = rank_scores(sims, prices, merchants, pers, base_price, weights)
+        for i in range(n):
+            sim = max(0.0, float(sims[i] or 0.0))
+            price = max(0.0, 1.0 - abs(prices[i] - base_price) / base_price) if base_price > 0 else 0.0
+            merchant = 1.0 if merchants[i] else 0.0
+            final = (
+                weights["similarity"] * sim
+                + weights["price"] * price
+                + weights["merchant"] * merchant
+                + weights["personalization"] * pers[i]
+            )
+            assert (got["similarity"][i], got["price"][i], got["final"][i]) == (sim, price, final)
+
+
+def test_top_k_is_a_stable_descending_sort(engine):
+    rng = random.Random(11)
+    for _ in range(200):
+        # Large batches take the NumPy argpartition path.
+        n = rng.choice([rng.randint(0, 25), rng.randint(500, 1500)])
+        scores = [rng.choice([0.1, 0.5, 0.5, 0.9, rng.random()]) for _ in range(n)]
+        k = rng.randint(0, 30)
+        want = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
+        assert top_k_indices(scores, k) == want
+
+
+def test_top_k_preferred_items_rank_first(engine):
+    rng = random.Random(9)
+    for _ in range(200):
+        n = rng.choice([rng.randint(0, 40), rng.randint(500, 3000)])
+        scores = [rng.choice([0.3, 0.7, 0.7, rng.random()]) for _ in range(n)]
+        preferred = [rng.random() < 0.3 for _ in range(n)]
+        k = rng.randint(0, 50)
+        want = sorted(range(n), key=lambda i: (preferred[i], scores[i]), reverse=True)[:k]
+        assert top_k_indices(scores, k, preferred=preferred) == want
+
+
+def _product(pid, ptype, price, **extra):
+    extra.setdefault("in_stock", True)
+    return StandardProduct(
+        id=pid, merchant_id="m1", title=f"Tee {pid}", product_type=ptype, price=price, currency="USD", **extra
+    )
+
+
+@pytest.mark.asyncio
+async def test_handler_ranks_strict_candidates_same_type_first(monkeypatch):
+    base = _product("base", "shirts", 20.0)
+    products = {
+        "a": _product("a", "shirts", 20.0),
+        "b": _product("b", "hoodies", 20.0),
+        "c": _product("c", "shirts", 40.0),
+        "d": _product("d", "shirts", 21.0, in_stock=False),
+    }
+
+    class Cand:
+        def __init__(self, pid, score):
+            self.productId, self.score = pid, score
+
+    async def fake_find_similar(params):
+        return [Cand("b", 0.9), Cand("c", 0.9), Cand("a", 0.5), Cand("a", 0.5), Cand("d", 1.0)]
+
+    async def load_base(pid):
+        return base
+
+    async def load_many(ids):
+        return {pid: products[pid] for pid in ids}
+
+    monkeypatch.setattr(agent_shop_gateway, "_load_product_by_id", load_base)
+    monkeypatch.setattr(agent_shop_gateway, "_load_products_by_ids", load_many)
+    monkeypatch.setattr(agent_shop_gateway.similarity_service, "findSimilar", fake_find_similar)
+    monkeypatch.setattr(agent_shop_gateway, "DEV_MODE", True)
+
+    payload = agent_shop_gateway.FindSimilarProductsPayload(
+        product_id="base", limit=3, strategy="content_embedding", debug=True
+    )
+    result = await agent_shop_gateway._handle_find_similar_products(payload, request_metadata={})
+    assert [item["product"]["id"] for item in result["items"]] == ["c", "a", "b"]
+    first = result["items"][0]
+    assert first["debug_scores"]["price"] == 0.0 and first["scores"]["similarity"] == 0.9
@@ -1,3 +1,5 @@
+import json
+
 import pytest
 
 from services import similarity_service
@@ -52,8 +54,19 @@ async def test_content_strategy_excludes_base_and_limits(monkeypatch):
     assert "base" not in ids
 
 
+class FakeCoPurchase:
+    def __init__(self, neighbors):
+        self._neighbors = neighbors
+
+    async def has_data(self, product_id):
+        return bool(self._neighbors.get(product_id))
+
+    async def neighbors(self, product_id, n):
+        return self._neighbors.get(product_id, [])[:n]
+
+
 @pytest.mark.asyncio
-async def test_coview_strategy_stub(monkeypatch):
+async def test_coview_strategy_without_data_returns_empty(monkeypatch):
     base = DummyProduct("base", "Red T Shirt", "shirts")
 
     async def fake_load_base(pid):
@@ -62,20 +75,40 @@ async def test_coview_strategy_stub(monkeypatch):
     async def fake_search_candidates(base_product, limit, require_same_category, price_band, text_query):
         return []
 
-    svc = similarity_service.SimilarityService()
+    svc = similarity_service.SimilarityService(co_purchase=FakeCoPurchase({}))
     monkeypatch.setattr(svc, "_load_base_product", fake_load_base)
     monkeypatch.setattr(svc, "_search_candidates_content", fake_search_candidates)
 
     result = await svc.findSimilar({"baseProductId": "base", "limit": 2, "strategy": "co_view"})
-    assert isinstance(result, list)
-    # stub returns empty list without throwing
     assert result == []
 
 
 @pytest.mark.asyncio
-async def test_has_coview_data_stub():
-    svc = similarity_service.SimilarityService()
-    assert await svc.hasCoViewData("any") is False
+async def test_coview_strategy_ranks_co_purchases_then_tops_up_with_content(monkeypatch):
+    from models.standard_product import StandardProduct
+
+    base = DummyProduct("base", "Red T Shirt", "shirts")
+
+    async def fake_load_base(pid):
+        return base
+
+    async def fake_search_candidates(base_product, limit, require_same_category, price_band, text_query):
+        return [
+            StandardProduct(id=pid, platform="shopify", merchant_id="m1", title=title, price=10, currency="USD", product_type="shirts")
+            for pid, title in (("c1", "Blue T Shirt"), ("p9", "Red Shirt"))
+        ]
+
+    co_purchase = FakeCoPurchase({"base": [("c1", 1.0), ("c2", 0.5)]})
+    svc = similarity_service.SimilarityService(co_purchase=co_purchase, recall_mode="sequential")
+    monkeypatch.setattr(svc, "_load_base_product", fake_load_base)
+    monkeypatch.setattr(svc, "_search_candidates_content", fake_search_candidates)
+
+    result = await svc.findSimilar({"baseProductId": "base", "limit": 3, "strategy": "co_view"})
+    assert [(c.productId, c.score) for c in result[:2]] == [("c1", 1.0), ("c2", 0.5)]
+    assert [c.productId for c in result[2:]] == ["p9"]  # content top-up, deduped
+
+    assert await svc.hasCoViewData("base") is True
+    assert await svc.hasCoViewData("other") is False
 
 
 @pytest.mark.asyncio
@@ -109,7 +142,7 @@ async def test_content_strategy_fallback_levels(monkeypatch):
         else:
             return []
 
-    svc = similarity_service.SimilarityService()
+    svc = similarity_service.SimilarityService(recall_mode="sequential")
     monkeypatch.setattr(svc, "_load_base_product", fake_load_base)
     monkeypatch.setattr(svc, "_search_candidates_content", fake_search_candidates)
 
@@ -117,3 +150,153 @@ async def test_content_strategy_fallback_levels(monkeypatch):
     ids = [c.productId for c in result]
     assert "p2" in ids
     assert calls["count"] >= 2
+
+
+@pytest.mark.asyncio
+async def test_text_product_data_is_decoded(monkeypatch):
+    data = {"id": "p1", "title": "Red Tee", "product_type": "shirts", "price": 12.0}
+
+    class TextDB:
+        async def fetch_one(self, query, values=None):
+            return {"product_data": json.dumps(data)}
+
+    monkeypatch.setattr(similarity_service, "database", TextDB())
+    svc = similarity_service.SimilarityService()
+    assert (await svc._load_base_product("p1")).title == "Red Tee"
+
+    rows = [{"product_data": json.dumps(data)}, {"product_data": "{not json"}, {"product_data": data}]
+    assert [p.id for p in svc._hydrate_rows(rows)] == ["p1", "p1"]
+
+
+class RecallDB:
+    """products_cache stand-in that understands the recall queries and records concurrency."""
+
+    def __init__(self, rows, delay_s=0.01):
+        self.rows = rows
+        self.delay_s = delay_s
+        self.queries = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.shipped = 0  # product_data payloads returned
+
+    def _select(self, ptype=None, band=None, limit=10):
+        out = [
+            r
+            for r in self.rows
+            if (ptype is None or r["ptype"] == ptype) and (band is None or band[0] <= r["price"] <= band[1])
+        ]
+        return sorted(out, key=lambda r: r["cached_at"], reverse=True)[:limit]
+
+    async def fetch_all(self, query, values=None):
+        import asyncio
+
+        self.queries += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay_s)
+        finally:
+            self.in_flight -= 1
+        if "WHERE id IN" in query:
+            wanted = set(values.values())
+            found = [{"id": r["cached_at"], "product_data": r["data"]} for r in self.rows if r["cached_at"] in wanted]
+            self.shipped += len(found)
+            return found
+        limit, ptype = values["limit"], values.get("ptype")
+        band = (values["pmin"], values["pmax"]) if "pmin" in values else None
+        if "UNION ALL" in query:
+            assert "product_data" not in query
+            levels = [self._select(ptype, band, limit), self._select(ptype, None, limit), self._select(None, None, limit)]
+            return [{"recall_level": i + 1, "id": r["cached_at"]} for i, rows in enumerate(levels) for r in rows]
+        uses_type = "data_product_type_lower = :ptype" in query
+        found = [{"product_data": r["data"]} for r in self._select(ptype if uses_type else None, band, limit)]
+        self.shipped += len(found)
+        return found
+
+
+def _recall_catalog():
+    rows = []
+    specs = [("shirts", 20.0, 3), ("shirts", 60.0, 6), ("hoodies", 30.0, 12), ("toys", 5.0, 4)]
+    n = 0
+    for ptype, price, count in specs:
+        for _ in range(count):
+            n += 1
+            rows.append(
+                {
+                    "ptype": ptype,
+                    "price": price,
+                    "cached_at": n,
+                    "data": {"id": f"p{n}", "title": f"Cotton {ptype} {n}", "product_type": ptype, "price": price},
+                }
+            )
+    return rows
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "base_type,base_price,limit",
+    [
+        ("shirts", 20.0, 2),  # level 1 is enough
+        ("shirts", 20.0, 5),  # level 2
+        ("shirts", 20.0, 12),  # level 3
+        ("gadgets", 20.0, 3),  # empty category: the per-level fallback query
+        ("shirts", 0.0, 4),  # no price band: levels 1 and 2 are the same query
+    ],
+)
+async def test_recall_modes_return_identical_candidates(monkeypatch, base_type, base_price, limit):
+    from models.standard_product import StandardProduct
+
+    base = StandardProduct(id="base", title="Cotton Tee", product_type=base_type, price=base_price)
+    results, shipped = {}, {}
+    for mode in ("sequential", "parallel", "union"):
+        db = RecallDB(_recall_catalog())
+        monkeypatch.setattr(similarity_service, "database", db)
+        svc = similarity_service.SimilarityService(recall_mode=mode)
+
+        async def load_base(pid):
+            return base
+
+        monkeypatch.setattr(svc, "_load_base_product", load_base)
+        found = await svc.findSimilar({"baseProductId": "base", "limit": limit, "strategy": "content_embedding"})
+        results[mode] = [(c.productId, c.score) for c in found]
+        shipped[mode] = db.shipped
+        if mode == "union" and limit == 2:
+            assert db.queries == 2  # the id query, then level 1 by id
+        if mode == "parallel":
+            assert db.max_in_flight >= 2
+    assert results["parallel"] == results["sequential"]
+    assert results["union"] == results["sequential"]
+    # Union ships product_data for the levels it hydrates only, never more than the cascade.
+    assert shipped["union"] <= shipped["sequential"]
+
+
+def test_union_is_the_default_recall_mode(monkeypatch):
+    monkeypatch.delenv("SIMILARITY_RECALL_MODE", raising=False)
+    assert similarity_service.SimilarityService().recall_mode == "union"
+    monkeypatch.setenv("SIMILARITY_RECALL_MODE", "Parallel")
+    assert similarity_service.SimilarityService().recall_mode == "parallel"
+    monkeypatch.setenv("SIMILARITY_RECALL_MODE", "bogus")
+    assert similarity_service.SimilarityService().recall_mode == "union"
+
+
+@pytest.mark.asyncio
+async def test_parallel_recall_overlaps_levels_and_reports_p95(monkeypatch):
+    from models.standard_product import StandardProduct
+
+    base = StandardProduct(id="base", title="Cotton Tee", product_type="shirts", price=20.0)
+    timings = {}
+    for mode in ("sequential", "parallel"):
+        monkeypatch.setattr(similarity_service, "database", RecallDB(_recall_catalog(), delay_s=0.05))
+        svc = similarity_service.SimilarityService(recall_mode=mode)
+
+        async def load_base(pid):
+            return base
+
+        monkeypatch.setattr(svc, "_load_base_product", load_base)
+        await svc.findSimilar({"baseProductId": "base", "limit": 12, "strategy": "content_embedding"})
+        stats = svc.recall_stats.snapshot()
+        timings[mode] = stats["latency"]["total"]["p95_ms"]
+        assert stats["served_by_level"] == {"level3": 1}
+        assert {"level1", "level2", "level3"} <= set(stats["latency"])
+    # Three 50 ms levels: about 150 ms one after another, about 50 ms concurrently.
+    assert timings["parallel"] < timings["sequential"] * 0.6
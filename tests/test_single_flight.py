@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+from fastapi import BackgroundTasks
+
+from routes import agent_shop_gateway
+from services.single_flight import SingleFlight, canonical_request_key
+
+
+def test_canonical_key_ignores_key_order_and_trace_id():
+    a = canonical_request_key(
+        "find_similar_products",
+        {"product_id": "p1", "limit": 6, "metadata": {"trace_id": "t1", "creator_id": "c1"}},
+        {"source": "ui", "trace_id": "x"},
+    )
+    b = canonical_request_key(
+        "find_similar_products",
+        {"metadata": {"creator_id": "c1", "trace_id": "t2"}, "limit": 6, "product_id": "p1"},
+        {"trace_id": "y", "source": "ui"},
+    )
+    assert a == b
+    assert a != canonical_request_key("find_similar_products", {"product_id": "p1", "limit": 7}, {})
+    assert a != canonical_request_key("find_products_multi", {"product_id": "p1", "limit": 6}, {})
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_invocations_share_one_computation(monkeypatch):
+    calls = []
+
+    async def fake_similar(payload, request_metadata):
+        calls.append(payload.product_id)
+        await asyncio.sleep(0.02)
+        return {"base_product_id": payload.product_id, "strategy_used": "content_embedding", "items": []}
+
+    flight = SingleFlight(enabled=True, ttl_s=0)
+    monkeypatch.setattr(agent_shop_gateway, "invoke_single_flight", flight)
+    monkeypatch.setattr(agent_shop_gateway, "_handle_find_similar_products", fake_similar)
+
+    def request(pid, trace):
+        return agent_shop_gateway.ShopGatewayRequest(
+            operation="find_similar_products",
+            payload={"product_id": pid},
+            metadata={"trace_id": trace},
+        )
+
+    results = await asyncio.gather(
+        *(agent_shop_gateway.invoke_shop_operation(request("p1", f"t{i}"), BackgroundTasks()) for i in range(8)),
+        agent_shop_gateway.invoke_shop_operation(request("p2", "t"), BackgroundTasks()),
+    )
+
+    assert sorted(calls) == ["p1", "p2"]
+    assert [r["base_product_id"] for r in results] == ["p1"] * 8 + ["p2"]
+    # Each caller owns its response object.
+    results[0]["items"].append("mutated")
+    assert results[1]["items"] == []
+    stats = flight.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"]) == (2, 7, 0)
+    assert stats["fan_in"] == 4.5
+    assert stats["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_ttl_reuse_and_errors_are_not_cached():
+    flight = SingleFlight(enabled=True, ttl_s=60)
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        return {"n": calls}
+
+    assert await flight.run("k", compute) == {"n": 1}
+    assert await flight.run("k", compute) == {"n": 1}
+    assert flight.stats()["hits"] == 1
+
+    async def boom():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        await asyncio.gather(flight.run("bad", boom), flight.run("bad", boom))
+    assert flight.stats()["errors"] == 1
+    assert await flight.run("bad", compute) == {"n": 2}
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_cancel_followers():
+    flight = SingleFlight(enabled=True, ttl_s=0)
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(0.05)
+        return "done"
+
+    leader = asyncio.ensure_future(flight.run("k", slow))
+    await started.wait()
+    follower = asyncio.ensure_future(flight.run("k", slow))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await follower == "done"
+    assert flight._followers == {}
+
+
+@pytest.mark.asyncio
+async def test_cancelled_follower_does_not_leave_a_follower_count():
+    flight = SingleFlight(enabled=True, ttl_s=0)
+    release = asyncio.Event()
+
+    async def compute():
+        await release.wait()
+        return {"items": []}
+
+    leader = asyncio.ensure_future(flight.run("k", compute))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(flight.run("k", compute))
+    await asyncio.sleep(0)
+    assert flight._followers == {"k": 1}
+    follower.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    result = await leader
+    assert flight._followers == {}
+    assert result == {"items": []}
+
+
+@pytest.mark.asyncio
+async def test_every_coalesced_caller_gets_the_background_tasks(monkeypatch):
+    refreshed = []
+
+    async def fake_multi(payload, request_metadata, background_tasks):
+        background_tasks.add_task(refreshed.append, payload.search.query)
+        await asyncio.sleep(0.02)
+        return {"products": [], "total": 0}
+
+    flight = SingleFlight(enabled=True, ttl_s=0)
+    monkeypatch.setattr(agent_shop_gateway, "invoke_single_flight", flight)
+    monkeypatch.setattr(agent_shop_gateway, "_handle_find_products_multi", fake_multi)
+    monkeypatch.setattr(agent_shop_gateway, "_should_proxy_beauty_find_products_multi", lambda *a: False)
+
+    request = agent_shop_gateway.ShopGatewayRequest(
+        operation="find_products_multi", payload={"search": {"query": "tee"}}
+    )
+    callers = [BackgroundTasks() for _ in range(3)]
+    results = await asyncio.gather(*(agent_shop_gateway.invoke_shop_operation(request, bt) for bt in callers))
+
+    assert results == [{"products": [], "total": 0}] * 3
+    assert flight.stats()["coalesced"] == 2
+    for bt in callers:
+        assert len(bt.tasks) == 1
+        await bt()
+    assert refreshed == ["tee"] * 3
@@ -0,0 +1,77 @@
+import pytest
+from pydantic import ValidationError
+
+from models import standard_product
+from models.standard_product import ProductStatus, StandardProduct, hydrate_product
+
+# Fields the gateway and similarity code read off cached products.
+READ_FIELDS = (
+    "id",
+    "product_id",
+    "platform_product_id",
+    "platform",
+    "merchant_id",
+    "title",
+    "description",
+    "product_type",
+    "price",
+    "currency",
+    "sku",
+    "status",
+    "inventory_quantity",
+    "in_stock",
+    "image_url",
+    "images",
+    "platform_metadata",
+)
+
+ROWS = [
+    {"id": "p1", "title": "Tee", "price": 19.5, "currency": "USD", "status": "active", "images": ["a.jpg"]},
+    {"product_id": "p2", "price": 20, "inventory_quantity": 3, "in_stock": True, "vendor": "Acme"},
+    {"id": "p3", "product_id": "other", "platform_metadata": {"creator_id": "c1"}, "variants": [{"id": "v1"}]},
+    {"id": "p4", "price": "12.50", "status": "ACTIVE"},  # coerced / rejected by validation
+    {"id": "p5", "price": None, "status": None, "description": None},
+    {"id": "p6", "inventory_quantity": "7", "in_stock": "yes"},
+    {},
+]
+INVALID = [
+    {"id": 7, "title": "int id"},
+    {"id": "p8", "images": None},
+    {"id": "p9", "price": "n/a"},
+    {"id": "p10", "status": "archived"},
+    {"id": "p11", "images": [1, 2]},
+]
+
+
+def _outcome(build, data):
+    try:
+        product = build(data)
+    except ValidationError:
+        return "invalid"
+    return (
+        {f: getattr(product, f) for f in READ_FIELDS},
+        product.model_extra,
+        product.model_fields_set,
+        product.model_dump(),
+    )
+
+
+@pytest.mark.parametrize("data", ROWS + INVALID)
+def test_fast_path_matches_full_validation(data):
+    assert _outcome(hydrate_product, data) == _outcome(lambda d: StandardProduct(**d), data)
+
+
+def test_fast_path_types_and_mutability():
+    product = hydrate_product({"id": "p1", "price": 3, "status": "draft", "variants": []})
+    assert type(product.price) is float and product.status is ProductStatus.DRAFT
+    assert product.variants == [] and product.product_id == "p1"
+    product.merchant_id = "m1"
+    assert product.merchant_id == "m1"
+
+
+def test_kill_switch_forces_validation(monkeypatch):
+    calls = []
+    monkeypatch.setattr(standard_product, "FAST_HYDRATION_ENABLED", False)
+    monkeypatch.setattr(standard_product, "_trusted_product", calls.append)
+    assert hydrate_product({"id": "p1"}).id == "p1"
+    assert calls == []
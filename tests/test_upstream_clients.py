@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from services.upstream_clients import UpstreamClient
+
+
+class StubUpstream:
+    """Minimal keep-alive HTTP/1.1 server that echoes the request path and body."""
+
+    def __init__(self, delay_s: float = 0.0):
+        self.delay_s = delay_s
+        self.connections = 0
+        self.requests = 0
+        self._server = None
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                _method, path, _ = lines[0].split(" ", 2)
+                headers = {k.lower(): v.strip() for k, v in (l.split(":", 1) for l in lines[1:] if ":" in l)}
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                self.requests += 1
+                if self.delay_s:
+                    await asyncio.sleep(self.delay_s)
+                payload = json.dumps({"path": path, "body": json.loads(body or b"null")}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                    + payload
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+
+@pytest.mark.asyncio
+async def test_sequential_calls_reuse_one_keepalive_connection():
+    async with StubUpstream() as stub:
+        upstream = UpstreamClient("stub", stub.base_url, default_timeout_s=5.0)
+        for i in range(5):
+            resp = await upstream.post("/agent/v1/payments", operation="submit_payment", json={"i": i})
+            assert resp.json() == {"path": "/agent/v1/payments", "body": {"i": i}}
+
+        stats = upstream.stats()
+        await upstream.aclose()
+
+    assert stub.requests == 5
+    assert stub.connections == 1
+    assert stats["requests"] == 5
+    assert stats["errors"] == 0
+    assert stats["clients_created"] == 1
+    assert stats["connections"] == 1
+    assert stats["idle_connections"] == 1
+    assert stats["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded_by_pool_limits():
+    async with StubUpstream(delay_s=0.02) as stub:
+        upstream = UpstreamClient(
+            "stub",
+            stub.base_url,
+            default_timeout_s=5.0,
+            limits=httpx.Limits(max_connections=3, max_keepalive_connections=3),
+        )
+        await asyncio.gather(*(upstream.post("/x", json={}) for _ in range(12)))
+        stats = upstream.stats()
+        await upstream.aclose()
+
+    assert stub.requests == 12
+    assert stub.connections <= 3
+    assert stats["peak_in_flight"] == 12
+    assert stats["max_connections"] == 3
+
+
+@pytest.mark.asyncio
+async def test_per_operation_timeouts_and_error_counting(monkeypatch):
+    async with StubUpstream(delay_s=0.3) as stub:
+        upstream = UpstreamClient(
+            "stub",
+            stub.base_url,
+            default_timeout_s=5.0,
+            operation_timeouts={"preview_quote": 0.05},
+        )
+        with pytest.raises(httpx.TimeoutException):
+            await upstream.post("/q", operation="preview_quote", json={})
+
+        monkeypatch.setenv("SHOP_GATEWAY_TIMEOUT_PREVIEW_QUOTE_S", "2")
+        assert upstream.timeout_for("preview_quote") == 2.0
+        assert upstream.timeout_for("create_order") == 5.0
+        resp = await upstream.post("/q", operation="preview_quote", json={})
+        assert resp.status_code == 200
+        stats = upstream.stats()
+        await upstream.aclose()
+
+    assert stats["errors"] == 1
+    assert stats["requests"] == 2
+
+
+def test_http2_opt_in_degrades_without_h2(monkeypatch):
+    from services import upstream_clients
+
+    monkeypatch.setattr(upstream_clients, "_HTTP2_AVAILABLE", False)
+    upstream = UpstreamClient("stub", "http://127.0.0.1:1", default_timeout_s=1.0, http2=True)
+    assert upstream.http2 is False
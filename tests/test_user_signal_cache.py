@@ -0,0 +1,139 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import BackgroundTasks
+
+from routes import agent_shop_gateway
+from services.catalog_snapshot import CatalogSnapshot
+from services.merchant_directory import MerchantDirectory
+from services.user_signal_cache import UserSignalCache, UserSignals
+
+
+def _signals(*pids):
+    return UserSignals(frozenset(pids), frozenset())
+
+
+@pytest.mark.asyncio
+async def test_hits_expiry_and_lru_bound():
+    cache = UserSignalCache(max_users=2, ttl_s=60)
+    loads = []
+
+    def loader(name):
+        async def load():
+            loads.append(name)
+            return _signals(name)
+
+        return load
+
+    assert (await cache.get(("u1", "", ""), loader("u1"))).product_ids == {"u1"}
+    await cache.get(("u1", "", ""), loader("u1"))
+    await cache.get(("u2", "", ""), loader("u2"))
+    await cache.get(("u1", "", ""), loader("u1"))  # u2 is now least recently used
+    await cache.get(("u3", "", ""), loader("u3"))
+    assert loads == ["u1", "u2", "u3"]
+    assert cache.stats()["users"] == 2 and cache.stats()["evicted"] == 1
+
+    await cache.get(("u2", "", ""), loader("u2"))
+    assert loads[-1] == "u2"
+
+    cache.ttl_s = 0
+    await cache.get(("u2", "", ""), loader("u2"))
+    assert loads.count("u2") == 3 and cache.stats()["expired"] == 1
+
+
+@pytest.mark.asyncio
+async def test_invalidation_by_email_and_loads_racing_an_order():
+    cache = UserSignalCache(max_users=10, ttl_s=60)
+    await cache.get(("u1", "Ann@Example.com", ""), lambda: _ok(_signals("p1")))
+    await cache.get(("bob@example.com", "", "bob@example.com"), lambda: _ok(_signals("p2")))
+
+    assert cache.invalidate("ann@example.com") == 1
+    assert cache.invalidate("nobody@example.com", None, "") == 0
+    assert cache.stats()["users"] == 1
+
+    # A read that started before the order is answered but not cached.
+    gate = asyncio.Event()
+
+    async def slow_read():
+        await gate.wait()
+        return _signals("old")
+
+    pending = asyncio.ensure_future(cache.get(("u1", "ann@example.com", ""), slow_read))
+    await asyncio.sleep(0)
+    coalesced = asyncio.ensure_future(cache.get(("u1", "ann@example.com", ""), slow_read))
+    await asyncio.sleep(0)
+    cache.invalidate("ann@example.com")
+    gate.set()
+    assert (await pending).product_ids == {"old"} and (await coalesced).product_ids == {"old"}
+    assert cache.stats()["coalesced"] == 1 and cache.stats()["users"] == 1
+
+
+async def _ok(value):
+    return value
+
+
+class FakeGatewayDB:
+    def __init__(self):
+        self.history_reads = 0
+
+    async def fetch_all(self, query, values=None):
+        if "merchant_onboarding" in query:
+            return [{"merchant_id": "m1", "business_name": "Shop One"}]
+        if "FROM orders" in query:
+            self.history_reads += 1
+            return [{"items": json.dumps([{"product_id": "p2", "product_title": "Blue Tee"}])}]
+        if "products_cache" in query:
+            return [
+                {"merchant_id": "m1", "product_data": json.dumps({"id": pid, "title": title, "price": 10.0})}
+                for pid, title in (("p1", "Red Tee"), ("p2", "Blue Tee"))
+            ]
+        return []
+
+
+@pytest.mark.asyncio
+async def test_find_products_multi_reuses_history_until_the_user_orders(monkeypatch):
+    db = FakeGatewayDB()
+    cache = UserSignalCache(max_users=10, ttl_s=60)
+    monkeypatch.setattr("db.database.database", db)
+    monkeypatch.setattr(agent_shop_gateway, "merchant_directory", MerchantDirectory(refresh_interval_s=60))
+    monkeypatch.setattr(agent_shop_gateway, "catalog_snapshot", CatalogSnapshot(enabled=False))
+    monkeypatch.setattr(agent_shop_gateway, "user_signal_cache", cache)
+
+    async def fake_proxy(method, path, body, operation=None):
+        return {"status": "success", "order_id": "o1"}
+
+    monkeypatch.setattr(agent_shop_gateway, "_proxy_agent_api", fake_proxy)
+
+    payload = agent_shop_gateway.FindProductsMultiPayload(
+        search={"query": "tee", "limit": 10}, user={"id": "ann@example.com", "recent_queries": ["red socks"]}
+    )
+    for _ in range(3):
+        result = await agent_shop_gateway._handle_find_products_multi(payload, None, BackgroundTasks())
+        assert [p["id"] for p in result["products"]] == ["p2", "p1"]
+    assert db.history_reads == 1
+
+    order = agent_shop_gateway.OrderPayloadBody(
+        merchant_id="m1",
+        customer_email="ann@example.com",
+        items=[
+            {
+                "merchant_id": "m1",
+                "product_id": "p1",
+                "product_title": "Red Tee",
+                "quantity": 1,
+                "unit_price": 10.0,
+                "subtotal": 10.0,
+            }
+        ],
+        shipping_address={
+            "name": "Ann",
+            "address_line1": "1 Main St",
+            "city": "Springfield",
+            "country": "US",
+            "postal_code": "12345",
+        },
+    )
+    await agent_shop_gateway._handle_create_order(order)
+    await agent_shop_gateway._handle_find_products_multi(payload, None, BackgroundTasks())
+    assert db.history_reads == 2